@@ -1,9 +1,12 @@
 from abc import ABC
 import ast
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 import importlib
 from json import JSONDecodeError, dumps, loads
 import logging
-import re
+import random
 import time
 import traceback
 from urllib.parse import urljoin
@@ -12,7 +15,12 @@ from fastapi import HTTPException
 import httpx
 from redis.asyncio import Redis as AsyncRedis
 
+from api.helpers._metricsamples import add_metric_samples
+from api.helpers._slotlease import SlotLease
+from api.helpers._streamprocessor import StreamProcessor
+from api.helpers._usagetokenizer import StreamTokenCounter
 from api.schemas.admin.providers import ProviderType
+from api.schemas.admin.routers import RouterUsageSource
 from api.schemas.audio import AudioTranscription, CreateAudioTranscription
 from api.schemas.chat import CreateChatCompletion
 from api.schemas.core.models import Metric, RequestContent
@@ -21,7 +29,7 @@ from api.schemas.usage import Usage
 from api.utils.carbon import get_carbon_footprint
 from api.utils.context import generate_request_id, global_context, request_context
 from api.utils.exceptions import ModelIsTooBusyException, ResponseFormatFailedException
-from api.utils.redis import redis_retry, safe_redis_reset
+from api.utils.redis import redis_retry
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
     ENDPOINT__CHAT_COMPLETIONS,
@@ -29,9 +37,7 @@ from api.utils.variables import (
     ENDPOINT__MODELS,
     ENDPOINT__OCR,
     ENDPOINT__RERANK,
-    PREFIX__REDIS_METRIC_GAUGE,
     PREFIX__REDIS_METRIC_TIMESERIE,
-    REDIS__TIMESERIE_RETENTION_SECONDS,
 )
 
 logger = logging.getLogger(__name__)
@@ -46,6 +52,10 @@ class BaseModelProvider(ABC):
         ENDPOINT__OCR: None,
         ENDPOINT__RERANK: None,
     }
+    METRICS_ENDPOINT: str | None = None  # Prometheus metrics endpoint of the provider, None if not supported
+    METRICS_TABLE: dict[str, tuple[str, ...]] = {}  # backend metric: Prometheus metric names, the first one found is used
+    TIMESERIES_KEYS: set[str] = set()  # metric time series already created, shared by all the providers of the process
+    STREAM_USAGE_OPTION: bool = True  # whether the provider accepts `stream_options.include_usage` to report the usage of a stream
 
     def __init__(
         self,
@@ -69,6 +79,10 @@ class BaseModelProvider(ABC):
         self.id: int | None = None  # set by the ModelRegistry when the provider is created
         self.cost_prompt_tokens: float | None = None  # set by the ModelRegistry when the provider is retrieved
         self.cost_completion_tokens: float | None = None  # set by the ModelRegistry when the provider is retrieved
+        self.usage_source: RouterUsageSource = RouterUsageSource.UPSTREAM  # set by the ModelRegistry when the provider is retrieved
+        self.peak_ewma_half_life: float | None = None  # set by the ModelRegistry when the provider is retrieved
+        self.slot_lease_ttl: int = 600  # set by the ModelRegistry when the provider is retrieved
+        self.slot_lease: SlotLease | None = None  # slot acquired by the routing, set by the ModelRegistry when the provider is retrieved
 
         self.headers = {"Authorization": f"Bearer {self.key}"} if self.key else {}
 
@@ -96,13 +110,69 @@ class BaseModelProvider(ABC):
         """
         pass
 
+    @asynccontextmanager
+    async def _get_http_client(self) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        Get a HTTP client to call the model provider. The shared client of the HTTP client pool is used when the pool is set up in
+        global context (API process), otherwise (eg. Celery worker, scripts) a new client is created and closed after use.
+
+        Returns:
+            AsyncIterator[httpx.AsyncClient]: The HTTP client, timeout must be passed on each request.
+        """
+        # In Celery worker processes the FastAPI lifespan does not run, so the pool may be absent from global context.
+        http_client_pool = getattr(global_context, "http_client_pool", None)
+        if http_client_pool is None:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                yield client
+        else:
+            yield http_client_pool.get_client(url=self.url)
+
+    async def get_backend_metrics(self) -> dict[str, float]:
+        """
+        Scrape the Prometheus metrics endpoint of the model provider and get the backend metrics defined in `METRICS_TABLE`. Values
+        of the same metric with different labels (eg. several engines) are summed, except ratios (`kv_cache`) for which the maximum is kept.
+
+        Returns:
+            dict[str, float]: The backend metrics found, empty if the provider does not expose metrics.
+        """
+        if self.METRICS_ENDPOINT is None:
+            return {}
+
+        url = urljoin(base=self.url, url=self.METRICS_ENDPOINT.lstrip("/"))
+        async with self._get_http_client() as client:
+            response = await client.get(url=url, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+
+        samples = {}
+        for line in response.text.splitlines():
+            if not line or line.startswith("#"):
+                continue
+            # sample format: `name{labels} value [timestamp]`, labels are optional
+            if "{" in line:
+                name, rest = line[: line.index("{")], line[line.rindex("}") + 1 :]
+            else:
+                name, _, rest = line.partition(" ")
+            try:
+                value = float(rest.split()[0])
+            except (IndexError, ValueError):
+                continue
+            samples.setdefault(name.strip(), []).append(value)
+
+        metrics = {}
+        for metric, names in self.METRICS_TABLE.items():
+            values = next((samples[name] for name in names if name in samples), None)
+            if values is not None:
+                metrics[metric] = max(values) if metric == Metric.KV_CACHE.value else sum(values)
+
+        return metrics
+
     async def get_vector_size(self) -> int | None:
         if self.ENDPOINT_TABLE[ENDPOINT__EMBEDDINGS] is None:
             return None
 
         url = urljoin(base=self.url, url=self.ENDPOINT_TABLE[ENDPOINT__EMBEDDINGS].lstrip("/"))
 
-        async with httpx.AsyncClient() as client:
+        async with self._get_http_client() as client:
             response = await client.post(url=url, headers=self.headers, json={"model": self.model_name, "input": "hello world"}, timeout=self.timeout)
             assert response.status_code == 200, f"Model is not reachable ({response.status_code} - {response.text})."
 
@@ -114,18 +184,24 @@ class BaseModelProvider(ABC):
     def _get_usage(
         self,
         request_content: RequestContent,
-        response_data: dict | list[dict],
+        response_data: dict | StreamTokenCounter | None,
         stream: bool,
         request_latency: float = 0.0,
+        upstream_usage: dict | None = None,
+        sampled: bool | None = None,
     ) -> Usage | None:
         """
-        Get usage data from request and response.
+        Get usage data from request and response. Depending on the usage source of the router, the token counts come from the usage
+        reported by the provider or from the API tokenizer (as fallback if the provider does not report usage).
 
         Args:
             request_content(RequestContent): The request content.
-            response_data(dict): The data of the response.
+            response_data(dict | StreamTokenCounter | None): The data of the response, or the token counter fed during the stream if stream.
             stream(bool): Whether the response is a stream.
             request_latency(float): The request latency in seconds.
+            upstream_usage(dict | None): The usage reported by the provider in the response.
+            sampled(bool | None): Whether the upstream usage is checked with the API tokenizer (sampling usage source), drawn before
+                the stream so the completion is counted while streamed. If None, drawn with the sampling rate of the tokenizer.
 
         Returns:
             Usage | None: The usage data.
@@ -138,9 +214,23 @@ class BaseModelProvider(ABC):
         tokenizer = getattr(global_context, "tokenizer", None)
         if tokenizer and request_content.endpoint in tokenizer.USAGE_ENDPOINTS:
             try:
-                completion_tokens = 0
-                prompt_tokens = tokenizer.get_prompt_tokens(endpoint=request_content.endpoint, body=request_content.json)
-                completion_tokens = tokenizer.get_completion_tokens(endpoint=request_content.endpoint, response_data=response_data, stream=stream)
+                upstream_tokens = None if self.usage_source == RouterUsageSource.LOCAL else self._get_upstream_tokens(upstream_usage=upstream_usage)
+
+                if upstream_tokens is None:
+                    prompt_tokens = tokenizer.get_prompt_tokens(endpoint=request_content.endpoint, body=request_content.json)
+                    completion_tokens = tokenizer.get_completion_tokens(endpoint=request_content.endpoint, response_data=response_data, stream=stream)
+                else:
+                    prompt_tokens, completion_tokens = upstream_tokens
+                    if sampled is None:
+                        sampled = self.usage_source == RouterUsageSource.SAMPLING and random.random() < tokenizer.sampling_rate
+                    if sampled:
+                        local_prompt_tokens = tokenizer.get_prompt_tokens(endpoint=request_content.endpoint, body=request_content.json)
+                        local_completion_tokens = tokenizer.get_completion_tokens(endpoint=request_content.endpoint, response_data=response_data, stream=stream)  # fmt: off
+                        if (local_prompt_tokens, local_completion_tokens) != upstream_tokens:
+                            logger.warning(
+                                f"Upstream usage of {self.model_name} (id: {self.id}) differs from the API tokenizer count "
+                                f"(prompt tokens: {prompt_tokens} vs {local_prompt_tokens}, completion tokens: {completion_tokens} vs {local_completion_tokens})."
+                            )
                 total_tokens = prompt_tokens + completion_tokens
 
                 carbon_footprint = get_carbon_footprint(
@@ -169,6 +259,27 @@ class BaseModelProvider(ABC):
 
         return usage
 
+    @staticmethod
+    def _get_upstream_tokens(upstream_usage: dict | None) -> tuple[int, int] | None:
+        """
+        Get the prompt and completion tokens from the usage reported by the provider.
+
+        Args:
+            upstream_usage(dict | None): The usage object of the provider response (OpenAI format).
+
+        Returns:
+            tuple[int, int] | None: The prompt and completion tokens, None if the usage is missing or incomplete.
+        """
+        if not isinstance(upstream_usage, dict):
+            return None
+
+        prompt_tokens = upstream_usage.get("prompt_tokens")
+        completion_tokens = upstream_usage.get("completion_tokens") or 0  # embeddings and rerank responses have no completion tokens
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            return None
+
+        return prompt_tokens, completion_tokens
+
     def _format_request(self, request_content: RequestContent) -> RequestContent:
         """
         Format a request to a provider model. This method can be overridden by a subclass to add additional headers or parameters. This method format the requested endpoint thanks the ENDPOINT_TABLE attribute.
@@ -209,7 +320,14 @@ class BaseModelProvider(ABC):
         if content_type == "application/json":
             response_data = response.json()
 
-            usage = self._get_usage(request_content=request_content, response_data=response_data, stream=False, request_latency=request_latency)
+            upstream_usage = response_data.get("usage") if isinstance(response_data, dict) else None
+            usage = self._get_usage(
+                request_content=request_content,
+                response_data=response_data,
+                stream=False,
+                request_latency=request_latency,
+                upstream_usage=upstream_usage,
+            )
 
             if request_context.get().id is None:
                 if isinstance(response_data, dict) and "id" in response_data:
@@ -246,25 +364,13 @@ class BaseModelProvider(ABC):
 
         return response
 
-    async def _ensure_timeseries_exists(self, redis_client: AsyncRedis, key: str) -> None:
-        """
-        Ensure a time series exists with proper retention configuration.
-
-        Args:
-            redis_client(AsyncRedis): The redis client to use.
-            key(str): The time series key to create.
-        """
-        try:
-            await redis_client.ts().info(key)
-        except Exception:
-            try:
-                await redis_client.ts().create(key, retention_msecs=REDIS__TIMESERIE_RETENTION_SECONDS * 1000, duplicate_policy="LAST")
-            except Exception:
-                pass
-
     async def _log_performance_metric(self, redis_client: AsyncRedis, ttft: int | None, latency: int | None) -> None:
         """
-        Log performance metrics in redis.
+        Log performance metrics in redis. All the metrics of the request are written in a single pipeline with `TS.MADD`, the time
+        series are created in the same pipeline on first use and remembered by the process (see `TIMESERIES_KEYS`). If the metrics
+        aggregator is enabled, the metrics are recorded in process and written by the aggregator on its next flush. The peak EWMA of
+        the provider is updated with the time to first token of a stream, so a long generation is not seen as a degradation, and
+        with the latency otherwise.
 
         Args:
             redis_client(AsyncRedis): The redis client to use for the request.
@@ -274,24 +380,60 @@ class BaseModelProvider(ABC):
         request_context.get().ttft = ttft
         request_context.get().latency = latency
 
-        try:
-            if ttft is not None:
-                key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.TTFT.value}:{self.id}"
-                await self._ensure_timeseries_exists(redis_client, key)
-                await redis_client.ts().add(key=key, timestamp=int(time.time() * 1000), value=ttft)
-        except Exception:
-            logger.error(f"Failed to log request metrics (TTFT) in redis (id: {self.id})", exc_info=True)
-            await safe_redis_reset(redis_client)
+        timestamp = int(time.time() * 1000)  # use milliseconds timestamp to avoid collisions
+        latency_key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.LATENCY.value}:{self.id}"
+        samples = []
+        if ttft is not None:
+            samples.append((f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.TTFT.value}:{self.id}", timestamp, ttft))
+        if latency is not None:
+            samples.append((latency_key, timestamp, latency))
 
-        try:
-            if latency is not None:
-                key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.LATENCY.value}:{self.id}"
-                await self._ensure_timeseries_exists(redis_client, key)
-                # Use milliseconds timestamp to avoid collisions
-                await redis_client.ts().add(key=key, timestamp=int(time.time() * 1000), value=latency)
-        except Exception:
-            logger.error(f"Failed to log request metrics (latency) in redis (id: {self.id})", exc_info=True)
-            await safe_redis_reset(redis_client)
+        if not samples:
+            return
+
+        peak_ewma_sample = ttft if ttft is not None else latency
+
+        metrics_aggregator = getattr(global_context, "metrics_aggregator", None)
+        if metrics_aggregator is not None:
+            for key, _, value in samples:
+                metrics_aggregator.record(key=key, value=value)
+            metrics_aggregator.record_peak_ewma(key=latency_key, value=peak_ewma_sample)
+            return
+
+        latencies = [(latency_key, timestamp, peak_ewma_sample)]
+        await add_metric_samples(redis_client=redis_client, samples=samples, created_keys=self.TIMESERIES_KEYS, peak_ewma_half_life=self.peak_ewma_half_life, latencies=latencies)  # fmt: off
+
+    async def _get_slot_lease(self, redis_client: AsyncRedis) -> SlotLease | None:
+        """
+        Get the lease of the provider slot acquired by the routing for the request. Further requests forwarded with the same provider
+        (e.g. one request by page) acquire a slot without QoS limit, as the request has already been admitted.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use for the request.
+
+        Returns:
+            SlotLease | None: The lease, None if the slot could not be acquired (Redis unavailable).
+        """
+        lease, self.slot_lease = self.slot_lease, None
+        if lease is None:
+            lease = await redis_retry(SlotLease.acquire, redis_client=redis_client, provider_id=self.id, ttl=self.slot_lease_ttl, max_retries=2)
+
+        return lease
+
+    async def _release_slot_lease(self, lease: SlotLease, redis_client: AsyncRedis) -> None:
+        """
+        Release the provider slot of the request, and remove it from the slots released at the end of the request (see
+        `release_slot_leases`).
+
+        Args:
+            lease(SlotLease): The lease of the slot.
+            redis_client(AsyncRedis): The redis client to use for the request.
+        """
+        slot_leases = request_context.get().slot_leases
+        if slot_leases is not None and lease in slot_leases:
+            slot_leases.remove(lease)
+
+        await redis_retry(lease.release, redis_client=redis_client, max_retries=2)
 
     async def forward_request(self, request_content: RequestContent, redis_client: AsyncRedis) -> httpx.Response:
         """
@@ -308,11 +450,10 @@ class BaseModelProvider(ABC):
         url = urljoin(base=self.url, url=self.ENDPOINT_TABLE[request_content.endpoint].lstrip("/"))
         request_content = self._format_request(request_content=request_content)
 
-        inflight_key = f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT.value}:{self.id}"
+        lease = await self._get_slot_lease(redis_client=redis_client)
+        keep_alive = asyncio.create_task(lease.keep_alive(redis_client=redis_client)) if lease is not None else None
         try:
-            await redis_retry(redis_client.incr, name=inflight_key, max_retries=2)
-
-            async with httpx.AsyncClient(timeout=self.timeout) as async_client:
+            async with self._get_http_client() as async_client:
                 try:
                     start_time = time.perf_counter()
                     response = await async_client.request(
@@ -322,6 +463,7 @@ class BaseModelProvider(ABC):
                         json=request_content.json,
                         files=request_content.files,
                         data=request_content.form,
+                        timeout=self.timeout,
                     )
                     end_time = time.perf_counter()
                 except (
@@ -351,7 +493,10 @@ class BaseModelProvider(ABC):
                         message = response.text
                     raise HTTPException(status_code=response.status_code, detail=message)
         finally:
-            await redis_retry(redis_client.decr, name=inflight_key, max_retries=2)
+            if keep_alive is not None:
+                keep_alive.cancel()
+            if lease is not None:
+                await self._release_slot_lease(lease=lease, redis_client=redis_client)
 
         # add additional data to the response
         request_latency = end_time - start_time
@@ -360,48 +505,41 @@ class BaseModelProvider(ABC):
 
         return response
 
-    def _format_stream_response(self, request_content: RequestContent, response: list[bytes], request_latency: float = 0.0) -> tuple | None:
+    def _format_stream_response(
+        self, request_content: RequestContent, stream_processor: StreamProcessor, request_latency: float = 0.0, sampled: bool = False
+    ) -> dict | None:
         """
-        Format streaming response data for chat completions.
+        Format the extra chunk with usage data sent at the end of a streaming response.
 
         Args:
-            json(dict):
-            response (list): List of response chunks (buffer).
-            endpoint(str): The endpoint to use for the request.
-            additional_data (Dict[str, Any]): Additional data to include in the response.
+            request_content(RequestContent): The request content.
+            stream_processor(StreamProcessor): The processor of the stream, after the end of the stream.
+            request_latency(float): The request latency in milliseconds.
+            sampled(bool): Whether the upstream usage is checked with the API tokenizer (see `_prepare_stream_usage`).
 
         Returns:
-            tuple: (data, extra) where data is the processed raw data and extra is the formatted response.
+            dict | None: The extra chunk, None if no chunk has been received from the provider (error case).
         """
 
-        content, chunks = None, list()
-        for lines in response:
-            lines = lines.decode(encoding="utf-8").split(sep="\n\n")
-            for line in lines:
-                line = line.strip()
-                if not line.startswith("data: "):
-                    continue
-                line = line.removeprefix("data: ")
-                if not line:
-                    continue
-                try:
-                    content = loads(line)
-                    chunks.append(content)
-                except JSONDecodeError as e:
-                    logger.debug(f"Failed to decode JSON from streaming response ({e}) on the following chunk: {line}.")
-
         # error case
-        if content is None:
+        if stream_processor.last_chunk is None:
             return None
 
         # normal case
-        extra_chunk = content  # based on last chunk to conserve the chunk structure
+        extra_chunk = dict(stream_processor.last_chunk)  # based on last chunk to conserve the chunk structure
         if request_content.endpoint == ENDPOINT__CHAT_COMPLETIONS:
             extra_chunk.update({"choices": []})  # clean the choices field
 
-        usage = self._get_usage(request_content=request_content, response_data=chunks, stream=True, request_latency=request_latency)
+        usage = self._get_usage(
+            request_content=request_content,
+            response_data=stream_processor.token_counter,
+            stream=True,
+            request_latency=request_latency,
+            upstream_usage=stream_processor.usage,
+            sampled=sampled,
+        )
         if request_context.get().id is None:
-            request_id = chunks[0].get("id", generate_request_id())
+            request_id = stream_processor.id or generate_request_id()
             request_context.get().id = request_id
         else:
             request_id = request_context.get().id
@@ -412,6 +550,38 @@ class BaseModelProvider(ABC):
 
         return extra_chunk
 
+    def _prepare_stream_usage(self, request_content: RequestContent) -> tuple[StreamTokenCounter | None, bool, bool]:
+        """
+        Prepare the usage count of a stream request. The completion is counted with the API tokenizer while streamed only if the
+        usage source of the router is local or if the request is drawn to check the upstream usage (sampling usage source). Otherwise
+        the usage is requested from the provider with `stream_options.include_usage`, and the deltas are only kept to be counted if
+        the provider does not report the usage.
+
+        Args:
+            request_content(RequestContent): The request content, updated with the stream options.
+
+        Returns:
+            tuple[StreamTokenCounter | None, bool, bool]: The counter of the completion tokens, whether the usage chunk of the provider is
+                not forwarded to the client, and whether the upstream usage is checked with the API tokenizer.
+        """
+        tokenizer = getattr(global_context, "tokenizer", None)
+        if not tokenizer or request_content.endpoint != ENDPOINT__CHAT_COMPLETIONS:
+            return None, False, False
+
+        sampled = self.usage_source == RouterUsageSource.SAMPLING and random.random() < tokenizer.sampling_rate
+        counted = self.usage_source == RouterUsageSource.LOCAL or sampled
+
+        drop_usage = False
+        if self.usage_source != RouterUsageSource.LOCAL and self.STREAM_USAGE_OPTION:
+            stream_options = request_content.json.get("stream_options") or {}
+            if not stream_options.get("include_usage"):  # the usage chunk is not forwarded to the client which did not request it
+                request_content.json["stream_options"] = {**stream_options, "include_usage": True}
+                drop_usage = True
+
+        token_counter = tokenizer.get_stream_token_counter(lazy=not counted)
+
+        return token_counter, drop_usage, sampled
+
     async def forward_stream(self, request_content: RequestContent, redis_client: AsyncRedis):
         """
         Forward a stream request to a provider model and add model name to the response. Optionally, add additional data to the response.
@@ -423,13 +593,10 @@ class BaseModelProvider(ABC):
 
         url = urljoin(base=self.url, url=self.ENDPOINT_TABLE[request_content.endpoint].lstrip("/"))
         request_content = self._format_request(request_content=request_content)
+        token_counter, drop_usage, sampled = self._prepare_stream_usage(request_content=request_content)
 
-        async with httpx.AsyncClient(timeout=self.timeout) as async_client:
-            inflight_key = f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT.value}:{self.id}"
-            try:
-                await redis_client.incr(name=inflight_key)
-            except Exception:
-                logger.error("Unable to increment redis requests inflight key")
+        async with self._get_http_client() as async_client:
+            lease = await self._get_slot_lease(redis_client=redis_client)
 
             try:
                 async with async_client.stream(
@@ -439,12 +606,13 @@ class BaseModelProvider(ABC):
                     json=request_content.json,
                     files=request_content.files,
                     data=request_content.form,
+                    timeout=self.timeout,
                 ) as response:
-                    buffer = list()
-                    start_time = time.perf_counter()
-                    first_token_time = None
-                    done_found = False
+                    stream_processor = StreamProcessor(token_counter=token_counter, drop_usage=drop_usage)
                     async for chunk in response.aiter_raw():
+                        if lease is not None:
+                            await redis_retry(lease.renew, redis_client=redis_client, max_retries=1)
+
                         # error case
                         if response.status_code // 100 != 2:
                             chunks = loads(chunk.decode(encoding="utf-8"))
@@ -455,73 +623,36 @@ class BaseModelProvider(ABC):
                                     pass
                             chunk = dumps(chunks).encode(encoding="utf-8")
                             yield chunk, response.status_code
-                        # normal case
-                        else:
-                            match = re.search(rb"data: \[DONE\]", chunk)
-                            if not match:
-                                buffer.append(chunk)
-                                if first_token_time is None:
-                                    try:
-                                        # The first token comes in the first non-empty chunk of the stream
-                                        if loads((chunk.decode(encoding="utf-8")).removeprefix("data: "))["choices"][0]["delta"]["content"] != "":
-                                            first_token_time = time.perf_counter()
-                                    except Exception:
-                                        pass
-
-                                yield chunk, response.status_code
-
-                            # end of the stream
-                            else:
-                                done_found = True
-                                last_chunks = chunk[: match.start()]
-                                done_chunk = chunk[match.start() :]
-
-                                # Edge case: the stream consists in just one group of chunks
-                                if first_token_time is None and last_chunks != "" and len(buffer) == 0:
-                                    first_token_time = time.perf_counter()
-
-                                buffer.append(last_chunks)
-
-                                end_time = time.perf_counter()
-                                request_latency = int((end_time - start_time) * 1000)  # ms
-                                ttft = int((first_token_time - start_time) * 1000) if first_token_time is not None else None
-
-                                extra_chunk = self._format_stream_response(
-                                    request_content=request_content,
-                                    response=buffer,
-                                    request_latency=request_latency,
-                                )
-                                await self._log_performance_metric(redis_client=redis_client, ttft=ttft, latency=int(request_latency))
-
-                                # if error case, yield chunk
-                                if extra_chunk is None:
-                                    yield chunk, response.status_code
-                                    continue
-
-                                yield last_chunks, response.status_code
-                                yield f"data: {dumps(extra_chunk)}\n\n".encode(), response.status_code
-                                yield done_chunk, response.status_code
-
-                    # If [DONE] pattern was not found, calculate metrics now
-                    if not done_found and response.status_code // 100 == 2:
-                        end_time = time.perf_counter()
-                        request_latency = int((end_time - start_time) * 1000)  # ms
-                        if first_token_time is not None:
-                            ttft = int((first_token_time - start_time) * 1000)  # ms
+                        # normal case, forward complete events until [DONE] (the rest of the stream is read but not forwarded)
                         else:
+                            events = stream_processor.feed(data=chunk)
+                            if events:
+                                yield events, response.status_code
+
+                    # end of the stream
+                    if response.status_code // 100 == 2:
+                        events = stream_processor.flush()
+                        if events:
+                            yield events, response.status_code
+
+                        stream_processor.finish()
+                        request_latency = int((time.perf_counter() - stream_processor.start_time) * 1000)  # ms
+                        ttft = stream_processor.get_ttft()
+                        if ttft is None:
                             logger.warning(f"Time to first token could not be determined for request {request_context.get().id}.")
-                            ttft = None
 
                         extra_chunk = self._format_stream_response(
                             request_content=request_content,
-                            response=buffer,
+                            stream_processor=stream_processor,
                             request_latency=request_latency,
+                            sampled=sampled,
                         )
-                        await self._log_performance_metric(redis_client=redis_client, ttft=ttft, latency=int(request_latency))
+                        await self._log_performance_metric(redis_client=redis_client, ttft=ttft, latency=request_latency)
 
-                        # Yield the extra chunk with usage info
+                        # yield the extra chunk with usage info before the end of the stream
                         if extra_chunk is not None:
-                            yield f"\n\ndata: {dumps(extra_chunk)}\n\n".encode(), response.status_code
+                            yield f"data: {dumps(extra_chunk)}\n\n".encode(), response.status_code
+                        if extra_chunk is not None or stream_processor.done:
                             yield b"data: [DONE]\n\n", response.status_code
 
             except (httpx.TimeoutException, httpx.ReadTimeout, httpx.ConnectTimeout, httpx.WriteTimeout, httpx.PoolTimeout) as e:
@@ -531,6 +662,7 @@ class BaseModelProvider(ABC):
                 yield dumps({"detail": type(e).__name__}).encode(), 500
             finally:
                 try:
-                    await redis_client.decr(name=inflight_key)
+                    if lease is not None:
+                        await self._release_slot_lease(lease=lease, redis_client=redis_client)
                 except Exception:
-                    logger.error("Unable to decrement redis requests inflight key")
+                    logger.error("Unable to release the provider slot")
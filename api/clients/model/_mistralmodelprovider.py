@@ -1,8 +1,6 @@
 import logging
 from urllib.parse import urljoin
 
-import httpx
-
 from api.schemas.admin.providers import ProviderType
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
@@ -27,6 +25,7 @@ class MistralModelProvider(BaseModelProvider):
         ENDPOINT__OCR: "/v1/ocr",
         ENDPOINT__RERANK: None,
     }
+    STREAM_USAGE_OPTION = False  # the usage is reported in the last chunk of the stream
 
     def __init__(
         self,
@@ -56,7 +55,7 @@ class MistralModelProvider(BaseModelProvider):
         url = urljoin(base=str(self.url), url=self.ENDPOINT_TABLE[ENDPOINT__MODELS].lstrip("/"))
 
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._get_http_client() as client:
                 response = await client.get(url=url, headers=self.headers, timeout=self.timeout)
                 response.raise_for_status()
         except Exception as e:
@@ -1,8 +1,6 @@
 import logging
 from urllib.parse import urljoin
 
-import httpx
-
 from api.schemas.admin.providers import ProviderType
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
@@ -56,7 +54,7 @@ class OpenaiModelProvider(BaseModelProvider):
         url = urljoin(base=str(self.url), url=self.ENDPOINT_TABLE[ENDPOINT__MODELS].lstrip("/"))
 
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._get_http_client() as client:
                 response = await client.get(url=url, headers=self.headers, timeout=self.timeout)
                 response.raise_for_status()
         except Exception as e:
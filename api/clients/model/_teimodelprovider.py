@@ -1,9 +1,8 @@
 import logging
 from urllib.parse import urljoin
 
-import httpx
-
 from api.schemas.admin.providers import ProviderType
+from api.schemas.core.models import Metric
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
     ENDPOINT__CHAT_COMPLETIONS,
@@ -27,6 +26,11 @@ class TeiModelProvider(BaseModelProvider):
         ENDPOINT__OCR: None,
         ENDPOINT__RERANK: "/rerank",
     }
+    METRICS_ENDPOINT = "/metrics"
+    METRICS_TABLE = {
+        Metric.WAITING.value: ("te_queue_size",),
+        "running": ("te_batch_current_size",),
+    }
 
     def __init__(
         self,
@@ -56,7 +60,7 @@ class TeiModelProvider(BaseModelProvider):
         url = urljoin(base=self.url, url=self.ENDPOINT_TABLE[ENDPOINT__MODELS].lstrip("/"))
 
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._get_http_client() as client:
                 response = await client.get(url=url, headers=self.headers, timeout=self.timeout)
                 response.raise_for_status()
         except Exception as e:
@@ -1,9 +1,8 @@
 import logging
 from urllib.parse import urljoin
 
-import httpx
-
 from api.schemas.admin.providers import ProviderType
+from api.schemas.core.models import Metric
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
     ENDPOINT__CHAT_COMPLETIONS,
@@ -27,6 +26,12 @@ class VllmModelProvider(BaseModelProvider):
         ENDPOINT__OCR: "/v1/chat/completions",
         ENDPOINT__RERANK: None,
     }
+    METRICS_ENDPOINT = "/metrics"
+    METRICS_TABLE = {
+        Metric.WAITING.value: ("vllm:num_requests_waiting",),
+        "running": ("vllm:num_requests_running",),
+        Metric.KV_CACHE.value: ("vllm:kv_cache_usage_perc", "vllm:gpu_cache_usage_perc"),
+    }
 
     def __init__(
         self,
@@ -56,7 +61,7 @@ class VllmModelProvider(BaseModelProvider):
         url = urljoin(base=self.url, url=self.ENDPOINT_TABLE[ENDPOINT__MODELS].lstrip("/"))
 
         try:
-            async with httpx.AsyncClient() as client:
+            async with self._get_http_client() as client:
                 response = await client.get(url=url, headers=self.headers, timeout=self.timeout)
                 response.raise_for_status()
         except Exception as e:
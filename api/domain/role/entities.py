@@ -29,6 +29,7 @@ class Role(BaseModel):
     name: str
     permissions: list[PermissionType]
     limits: list[Limit]
+    routing_weight: float = 1.0
     users: int = 0
     created: int = Field(default_factory=lambda: int(dt.datetime.now().timestamp()))
     updated: int = Field(default_factory=lambda: int(dt.datetime.now().timestamp()))
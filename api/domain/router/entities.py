@@ -30,6 +30,9 @@ class Model(BaseModel):
 class RouterLoadBalancingStrategy(str, Enum):
     SHUFFLE = "shuffle"
     LEAST_BUSY = "least_busy"
+    POWER_OF_TWO = "power_of_two"
+    PEAK_EWMA = "peak_ewma"
+    LEAST_LOADED = "least_loaded"
 
 
 class Router(BaseModel):
@@ -2,6 +2,7 @@ from typing import Literal
 
 from fastapi import APIRouter, Body, Depends, Path, Query, Request, Security
 from fastapi.responses import JSONResponse, Response
+from redis.asyncio import Redis as AsyncRedis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.helpers._accesscontroller import AccessController
@@ -15,7 +16,7 @@ from api.schemas.admin.providers import (
 )
 from api.schemas.admin.roles import PermissionType
 from api.utils.context import request_context
-from api.utils.dependencies import get_model_registry, get_postgres_session
+from api.utils.dependencies import get_model_registry, get_postgres_session, get_redis_client
 from api.utils.variables import ENDPOINT__ADMIN_PROVIDERS, ROUTER__ADMIN
 
 router = APIRouter(prefix="/v1", tags=[ROUTER__ADMIN.title()])
@@ -30,6 +31,7 @@ async def create_provider(
     request: Request,
     body: CreateProvider,
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> CreateProviderResponse:
     """
@@ -50,6 +52,8 @@ async def create_provider(
         qos_limit=body.qos_limit,
         postgres_session=postgres_session,
     )
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
+
     return JSONResponse(status_code=201, content=CreateProviderResponse(id=provider_id).model_dump())
 
 
@@ -62,12 +66,14 @@ async def delete_provider(
     request: Request,
     provider: int = Path(description="The ID of the provider to delete."),
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> Response:
     """
     Delete a router provider.
     """
     await model_registry.delete_provider(provider_id=provider, postgres_session=postgres_session)
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
 
     return Response(status_code=204)
 
@@ -82,6 +88,7 @@ async def update_provider(
     provider: int = Path(description="The ID of the provider to update."),
     body: UpdateProvider = Body(description="The provider update request."),
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> Response:
     """
@@ -98,6 +105,7 @@ async def update_provider(
         qos_limit=body.qos_limit,
         postgres_session=postgres_session,
     )
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
 
     return Response(status_code=204)
 
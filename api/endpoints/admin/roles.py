@@ -29,7 +29,7 @@ async def create_role(
     """
 
     role_id = await global_context.identity_access_manager.create_role(
-        postgres_session=postgres_session, name=body.name, permissions=body.permissions, limits=body.limits
+        postgres_session=postgres_session, name=body.name, permissions=body.permissions, limits=body.limits, routing_weight=body.routing_weight
     )
 
     return JSONResponse(status_code=201, content={"id": role_id})
@@ -75,6 +75,7 @@ async def update_role(
         name=body.name,
         permissions=body.permissions,
         limits=body.limits,
+        routing_weight=body.routing_weight,
     )
 
     return Response(status_code=204)
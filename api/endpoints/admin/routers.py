@@ -2,6 +2,7 @@ from typing import Literal
 
 from fastapi import APIRouter, Body, Depends, Path, Query, Request, Security
 from fastapi.responses import JSONResponse, Response
+from redis.asyncio import Redis as AsyncRedis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.helpers._accesscontroller import AccessController
@@ -9,7 +10,7 @@ from api.helpers.models import ModelRegistry
 from api.schemas.admin.roles import PermissionType
 from api.schemas.admin.routers import CreateRouter, CreateRouterResponse, Router, Routers, UpdateRouter
 from api.utils.context import request_context
-from api.utils.dependencies import get_model_registry, get_postgres_session
+from api.utils.dependencies import get_model_registry, get_postgres_session, get_redis_client
 from api.utils.variables import ENDPOINT__ADMIN_ROUTERS, ROUTER__ADMIN
 
 router = APIRouter(prefix="/v1", tags=[ROUTER__ADMIN.title()])
@@ -20,6 +21,7 @@ async def create_router(
     request: Request,
     body: CreateRouter = Body(description="The router creation request."),
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> CreateRouterResponse:
     """
@@ -32,9 +34,12 @@ async def create_router(
         load_balancing_strategy=body.load_balancing_strategy,
         cost_prompt_tokens=body.cost_prompt_tokens,
         cost_completion_tokens=body.cost_completion_tokens,
+        usage_source=body.usage_source,
         user_id=request_context.get().user_info.id,
         postgres_session=postgres_session,
     )
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
+
     return JSONResponse(status_code=201, content=CreateRouterResponse(id=router_id).model_dump())
 
 
@@ -47,12 +52,14 @@ async def delete_router(
     request: Request,
     router: int = Path(description="The ID of the router to delete (router ID, eg. 123)."),
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> Response:
     """
     Delete a model and all its providers.
     """
     await model_registry.delete_router(router_id=router, postgres_session=postgres_session)
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
 
     return Response(status_code=204)
 
@@ -67,6 +74,7 @@ async def update_router(
     router: int = Path(description="The ID of the router to update (router ID, eg. 123)."),
     body: UpdateRouter = Body(description="The router update request."),
     postgres_session: AsyncSession = Depends(get_postgres_session),
+    redis_client: AsyncRedis = Depends(get_redis_client),
     model_registry: ModelRegistry = Depends(get_model_registry),
 ) -> Response:
     """
@@ -80,8 +88,10 @@ async def update_router(
         load_balancing_strategy=body.load_balancing_strategy,
         cost_prompt_tokens=body.cost_prompt_tokens,
         cost_completion_tokens=body.cost_completion_tokens,
+        usage_source=body.usage_source,
         postgres_session=postgres_session,
     )
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
 
     return Response(status_code=204)
 
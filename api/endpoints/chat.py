@@ -102,6 +102,7 @@ async def chat_completions(
         postgres_session=postgres_session,
         redis_client=redis_client,
         request_context=request_context,
+        body=body,
     )
 
     request_content = RequestContent(
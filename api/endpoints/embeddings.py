@@ -28,15 +28,17 @@ async def embeddings(
     Creates an embedding vector representing the input text.
     """
 
+    json = body.model_dump()
     model_provider = await model_registry.get_model_provider(
         model=body.model,
         endpoint=ENDPOINT__EMBEDDINGS,
         postgres_session=postgres_session,
         redis_client=redis_client,
         request_context=request_context,
+        body=json,
     )
     response = await model_provider.forward_request(
-        request_content=RequestContent(method="POST", endpoint=ENDPOINT__EMBEDDINGS, json=body.model_dump(), model=body.model),
+        request_content=RequestContent(method="POST", endpoint=ENDPOINT__EMBEDDINGS, json=json, model=body.model),
         redis_client=redis_client,
     )
 
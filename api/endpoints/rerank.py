@@ -30,15 +30,17 @@ async def rerank(
     """
     Creates an ordered array with each text assigned a relevance score, based on the query.
     """
+    json = body.model_dump()
     model_provider = await model_registry.get_model_provider(
         model=body.model,
         endpoint=ENDPOINT__RERANK,
         postgres_session=postgres_session,
         redis_client=redis_client,
         request_context=request_context,
+        body=json,
     )
     response = await model_provider.forward_request(
-        request_content=RequestContent(method="POST", endpoint=ENDPOINT__RERANK, json=body.model_dump(), model=body.model),
+        request_content=RequestContent(method="POST", endpoint=ENDPOINT__RERANK, json=json, model=body.model),
         redis_client=redis_client,
     )
 
@@ -114,14 +114,12 @@ class AccessController:
             key_id = 0
             key_name = "master"
         else:
-            user_id, key_id, key_name = await global_context.identity_access_manager.check_token(
+            user_info, key_id, key_name = await global_context.identity_access_manager.get_token_user_info(
                 postgres_session=postgres_session, token=api_key.credentials
             )
-            if not user_id:
+            if not user_info:
                 raise InvalidAPIKeyException()
 
-            user_info = await global_context.identity_access_manager.get_user_info(postgres_session=postgres_session, user_id=user_id)
-
             # invalid token if user is expired, except for /me and /me/role endpoints
             if user_info.expires and user_info.expires < time.time() and not request.url.path.endswith(ENDPOINT__ME_INFO):
                 raise InvalidAPIKeyException()
@@ -209,7 +207,10 @@ class AccessController:
 
     @staticmethod
     async def _safely_parse_body(request: Request) -> dict:
-        """Safely parse request body as JSON or form data, handling encoding errors."""
+        """
+        Safely parse request body as JSON or form data, handling encoding errors. The body is parsed once per request: starlette caches
+        the decoded JSON and the parsed form on the request, and FastAPI has already parsed them for the endpoints with body parameters.
+        """
         try:
             # Check content type to determine parsing strategy
             content_type = request.headers.get("content-type", "").lower()
@@ -222,7 +223,7 @@ class AccessController:
                     result = {}
                     for key, value in form_data.items():
                         if hasattr(value, "filename"):  # File upload
-                            # For file uploads, store filename and content type info
+                            # For file uploads, store filename and content type info, the file content is not read
                             result[key] = {
                                 "filename": value.filename,
                                 "content_type": value.content_type,
@@ -241,14 +242,11 @@ class AccessController:
                 if not body:
                     return {}
 
-                # Try to decode as UTF-8 first
                 try:
-                    body_str = body.decode("utf-8")
+                    return await request.json()
                 except UnicodeDecodeError:
                     # If UTF-8 fails, try with error handling to replace invalid characters
-                    body_str = body.decode("utf-8", errors="replace")
-
-                return json.loads(body_str)
+                    return json.loads(body.decode("utf-8", errors="replace"))
         except (json.JSONDecodeError, AttributeError, ValueError):
             logger.warning("Failed to parse request body as JSON or form data.", exc_info=True)
             return {}
@@ -0,0 +1,117 @@
+import asyncio
+from dataclasses import dataclass, field
+import logging
+
+from redis.asyncio import ConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+
+from api.utils.variables import PREFIX__REDIS_ADMISSION
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class _Waiter:
+    sort_key: tuple[int, float]
+    provider_ids: frozenset[int] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    member: str | None = field(default=None, compare=False)
+
+
+class AdmissionController:
+    """
+    Event-driven admission of the requests refused by the QoS policy of their providers. When a provider releases a slot (end of a
+    request), the release is published on a Redis channel; each API worker listens to the channel and wakes up the waiting request
+    with the highest priority (then the oldest) among the requests that can be routed to this provider. The woken request
+    re-evaluates the QoS policy and the load balancing across all the providers of its router, so it is admitted within
+    milliseconds of the release instead of after a fixed sleep. When the head of a routing queue leaves the queue, the new head is
+    published on the same channel (see `RoutingScheduler`), and only the worker of this request wakes it up.
+    """
+
+    CHANNEL = f"{PREFIX__REDIS_ADMISSION}:released"
+    MEMBER_PREFIX = "member:"  # prefix of the messages of the routing queues, followed by the member of the request to wake up
+
+    def __init__(self) -> None:
+        self.waiters: list[_Waiter] = []
+
+    async def wait(self, provider_ids: list[int], priority: int, arrival: float, timeout: float, member: str | None = None) -> bool:
+        """
+        Wait until one of the providers releases a slot, or until the timeout.
+
+        Args:
+            provider_ids(list[int]): The providers the request can be routed to.
+            priority(int): The priority of the request, higher priority requests are woken up first.
+            arrival(float): The rank of the request among the requests of the same priority, lower ranks are woken up first: the event
+                loop time of arrival of the request, or its virtual start time in a routing queue (see `RoutingScheduler`). A request
+                refused again after a wake-up keeps its rank by waiting with the same value.
+            timeout(float): Maximum number of seconds to wait.
+            member(str | None): The member of the request in a routing queue, to be woken up when it becomes the head of the queue.
+
+        Returns:
+            bool: True if woken up by a release, False on timeout.
+        """
+        waiter = _Waiter(
+            sort_key=(-priority, arrival),
+            provider_ids=frozenset(provider_ids),
+            future=asyncio.get_running_loop().create_future(),
+            member=member,
+        )
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout=timeout)
+            return True
+        except TimeoutError:
+            return False
+        finally:
+            self.waiters.remove(waiter)
+
+    def wake(self, provider_id: int) -> None:
+        """
+        Wake up the waiting request with the highest priority (then the oldest) that can be routed to the provider.
+
+        Args:
+            provider_id(int): The provider that released a slot.
+        """
+        candidates = [waiter for waiter in self.waiters if provider_id in waiter.provider_ids and not waiter.future.done()]
+        if candidates:
+            min(candidates).future.set_result(None)
+
+    def wake_member(self, member: str) -> None:
+        """
+        Wake up the waiting request of a routing queue which became the head of the queue, if it waits in this worker.
+
+        Args:
+            member(str): The member of the request in the routing queue.
+        """
+        for waiter in self.waiters:
+            if waiter.member == member and not waiter.future.done():
+                waiter.future.set_result(None)
+
+    async def run(self, redis_pool: ConnectionPool) -> None:
+        """
+        Listen to the slot releases published by all the API workers until cancelled. Run as a background task in lifespan.
+
+        Args:
+            redis_pool(ConnectionPool): The redis connection pool.
+        """
+        redis_client = AsyncRedis(connection_pool=redis_pool)
+        try:
+            while True:
+                try:
+                    async with redis_client.pubsub() as pubsub:
+                        await pubsub.subscribe(self.CHANNEL)
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                data = message["data"].decode() if isinstance(message["data"], bytes) else message["data"]
+                                if data.startswith(self.MEMBER_PREFIX):
+                                    self.wake_member(member=data.removeprefix(self.MEMBER_PREFIX))
+                                else:
+                                    self.wake(provider_id=int(data))
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # waiting requests still re-check their providers periodically while the subscription is down
+                    logger.error("Admission controller subscription failed, retrying.", exc_info=True)
+                    await asyncio.sleep(1)
+        finally:
+            await redis_client.aclose()
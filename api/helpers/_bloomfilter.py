@@ -0,0 +1,41 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Bloom filter of integers. Membership tests have no false negatives and a false positive rate of at most `error_rate` while the
+    filter holds less than `capacity` items, whatever the size of the items: a filter of 100,000 items with a 0.1% error rate holds
+    in 180 kB.
+
+    Args:
+        capacity(int): The number of items the filter is sized for.
+        error_rate(float): The false positive rate of the filter at full capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item: int) -> list[int]:
+        # double hashing: the k positions are derived from two 64 bits hashes of the item
+        digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: int) -> None:
+        """
+        Add an item to the filter.
+
+        Args:
+            item(int): The item to add.
+        """
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
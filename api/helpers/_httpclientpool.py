@@ -0,0 +1,60 @@
+import importlib.util
+import logging
+
+import httpx
+
+from api.utils.variables import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClientPool:
+    """
+    Process-wide pool of HTTP clients used to forward requests to the model providers. One client is created by provider URL on first
+    use and kept for the lifespan of the API, so requests to the same provider reuse keep-alive connections instead of paying a new
+    TCP/TLS handshake each time.
+    """
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, http2: bool = False) -> None:
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 is enabled for provider clients but h2 package is not installed, fallback to HTTP/1.1.")
+            http2 = False
+
+        self.http2 = http2
+        self.clients: dict[str, httpx.AsyncClient] = {}
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """
+        Get the shared client of a model provider, create it if it does not exist yet.
+
+        Args:
+            url(str): The model provider URL, used as pool key.
+
+        Returns:
+            httpx.AsyncClient: The shared client. Do not close it, it is closed with the pool.
+        """
+        client = self.clients.get(url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self.limits, http2=self.http2, timeout=DEFAULT_TIMEOUT)
+            self.clients[url] = client
+
+        return client
+
+    async def close(self) -> None:
+        """
+        Close all the clients of the pool. Run when the API shuts down.
+        """
+        clients = list(self.clients.values())
+        self.clients.clear()
+
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                logger.warning("Failed to close provider HTTP client.", exc_info=True)
@@ -1,14 +1,24 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
 import datetime as dt
 from datetime import datetime, timedelta
+import logging
+import time
 from typing import Literal
 
 import bcrypt
 from jose import JWTError, jwt
+from prometheus_client import Counter
+from redis.asyncio import ConnectionPool
+from redis.asyncio import Redis as AsyncRedis
 from sqlalchemy import Integer, cast, delete, distinct, insert, or_, select, text, update
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
 
+from api.helpers._bloomfilter import BloomFilter
 from api.schemas.admin.organizations import Organization
 from api.schemas.admin.roles import Limit, LimitType, PermissionType, Role
 from api.schemas.admin.tokens import Token
@@ -17,6 +27,7 @@ from api.schemas.me.info import UserInfo
 from api.sql.models import Limit as LimitTable
 from api.sql.models import Organization as OrganizationTable
 from api.sql.models import Permission as PermissionTable
+from api.sql.models import RevokedToken as RevokedTokenTable
 from api.sql.models import Role as RoleTable
 from api.sql.models import Token as TokenTable
 from api.sql.models import User as UserTable
@@ -38,18 +49,55 @@ from api.utils.exceptions import (
     UserAlreadyExistsException,
     UserNotFoundException,
 )
+from api.utils.variables import PREFIX__REDIS_USER_INFO
 
+logger = logging.getLogger(__name__)
 settings = configuration.settings
 
+USER_INFO_CACHE_REQUESTS = Counter(
+    name="ogl_user_info_cache_requests",
+    documentation="Number of API key lookups in the user info cache of the API worker, by result (hit or miss).",
+    labelnames=["result"],
+)
+
+
+@dataclass
+class _CachedUserInfo:
+    user_info: UserInfo
+    key_name: str
+    expires: float
+
 
 class IdentityAccessManager:
     TOKEN_PREFIX = "sk-"
     PLAYGROUND_KEY_NAME = "playground"
 
-    def __init__(self, master_key: str, key_max_expiration_days: int | None = None, playground_session_duration: int = 3600):
+    USER_INFO_CHANNEL = f"{PREFIX__REDIS_USER_INFO}:invalidated"
+    REVOKED_TOKENS_CAPACITY = 100_000
+    REVOKED_TOKENS_SYNC_INTERVAL = 10  # seconds between two syncs of the revocation filter without invalidation
+    REVOKED_TOKENS_SYNC_MARGIN = 60  # seconds during which the revocations are read again, until their transaction is committed
+
+    def __init__(
+        self,
+        master_key: str,
+        key_max_expiration_days: int | None = None,
+        playground_session_duration: int = 3600,
+        redis_pool: ConnectionPool | None = None,
+        user_info_cache_ttl: int = 0,
+        user_info_cache_size: int = 10_000,
+    ):
         self.master_key = master_key
         self.key_max_expiration_days = key_max_expiration_days
         self.playground_session_duration = playground_session_duration
+        self.redis_pool = redis_pool
+        self.user_info_cache_ttl = user_info_cache_ttl
+        self.user_info_cache_size = user_info_cache_size
+        self.user_info_cache: OrderedDict[int, _CachedUserInfo] = OrderedDict()
+        self.user_info_cache_generation = 0
+        self.revoked_tokens = BloomFilter(capacity=self.REVOKED_TOKENS_CAPACITY)
+        self.revoked_tokens_offset = 0
+        self.revoked_tokens_synced = False
+        self.revoked_tokens_lock = asyncio.Lock()
 
     def _hash_password(self, password: str) -> str:
         return bcrypt.hashpw(password=password.encode("utf-8"), salt=bcrypt.gensalt()).decode("utf-8")
@@ -61,9 +109,9 @@ class IdentityAccessManager:
         token = token.split(IdentityAccessManager.TOKEN_PREFIX)[1]
         return jwt.decode(token=token, key=self.master_key, algorithms=["HS256"])
 
-    def _encode_token(self, user_id: int, token_id: int, expires: int | None = None) -> str:
+    def _encode_token(self, user_id: int, token_id: int, name: str, expires: int | None = None) -> str:
         return IdentityAccessManager.TOKEN_PREFIX + jwt.encode(
-            claims={"user_id": user_id, "token_id": token_id, "expires": expires},
+            claims={"user_id": user_id, "token_id": token_id, "name": name, "expires": expires},
             key=self.master_key,
             algorithm="HS256",
         )
@@ -74,6 +122,7 @@ class IdentityAccessManager:
         name: str,
         limits: list[Limit] = None,
         permissions: list[PermissionType] = None,
+        routing_weight: float = 1.0,
     ) -> int:
         if limits is None:
             limits = []
@@ -83,7 +132,9 @@ class IdentityAccessManager:
 
         # create the role
         try:
-            result = await postgres_session.execute(statement=insert(table=RoleTable).values(name=name).returning(RoleTable.id))
+            result = await postgres_session.execute(
+                statement=insert(table=RoleTable).values(name=name, routing_weight=routing_weight).returning(RoleTable.id)
+            )
             role_id = result.scalar_one()
             await postgres_session.commit()
         except IntegrityError:
@@ -124,6 +175,7 @@ class IdentityAccessManager:
         name: str | None = None,
         limits: list[Limit] | None = None,
         permissions: list[PermissionType] | None = None,
+        routing_weight: float | None = None,
     ) -> None:
         # check if role exists
         result = await postgres_session.execute(statement=select(RoleTable).where(RoleTable.id == role_id))
@@ -136,6 +188,9 @@ class IdentityAccessManager:
         if name is not None:
             await postgres_session.execute(statement=update(table=RoleTable).values(name=name).where(RoleTable.id == role.id))
 
+        if routing_weight is not None:
+            await postgres_session.execute(statement=update(table=RoleTable).values(routing_weight=routing_weight).where(RoleTable.id == role.id))
+
         if limits is not None:
             # delete the existing limits
             await postgres_session.execute(statement=delete(table=LimitTable).where(LimitTable.role_id == role.id))
@@ -156,6 +211,7 @@ class IdentityAccessManager:
                     await postgres_session.execute(statement=insert(table=PermissionTable).values(values))
 
         await postgres_session.commit()
+        await self.invalidate_user_info()  # the users of the role are not known, evict all the cached user info
 
     async def get_roles(
         self,
@@ -179,6 +235,7 @@ class IdentityAccessManager:
             select(
                 RoleTable.id,
                 RoleTable.name,
+                RoleTable.routing_weight,
                 cast(func.extract("epoch", RoleTable.created), Integer).label("created"),
                 cast(func.extract("epoch", RoleTable.updated), Integer).label("updated"),
                 func.count(distinct(UserTable.id)).label("users"),
@@ -201,6 +258,7 @@ class IdentityAccessManager:
             roles[row["id"]] = Role(
                 id=row["id"],
                 name=row["name"],
+                routing_weight=row["routing_weight"],
                 created=row["created"],
                 updated=row["updated"],
                 users=row["users"],
@@ -307,6 +365,7 @@ class IdentityAccessManager:
         # delete the user
         await postgres_session.execute(statement=delete(table=UserTable).where(UserTable.id == user_id))
         await postgres_session.commit()
+        await self.invalidate_user_info(user_id=user_id)
 
     async def update_user(
         self,
@@ -405,6 +464,7 @@ class IdentityAccessManager:
             .where(UserTable.id == user.id)
         )
         await postgres_session.commit()
+        await self.invalidate_user_info(user_id=user.id)
 
     async def get_users(
         self,
@@ -556,7 +616,7 @@ class IdentityAccessManager:
         await postgres_session.commit()
 
         # generate the token
-        token = self._encode_token(user_id=user.id, token_id=token_id, expires=expires)
+        token = self._encode_token(user_id=user.id, token_id=token_id, name=name, expires=expires)
 
         # update the token
         expires = func.to_timestamp(expires) if expires is not None else None
@@ -581,9 +641,11 @@ class IdentityAccessManager:
             Tuple containing the new token_id and token
         """
         # delete old for tokens with the same name and user_id
-        query = delete(TokenTable).where(TokenTable.user_id == user_id, TokenTable.name == name)
-        await postgres_session.execute(query)
+        query = delete(TokenTable).where(TokenTable.user_id == user_id, TokenTable.name == name).returning(TokenTable.id, TokenTable.expires)
+        result = await postgres_session.execute(query)
+        await self._revoke_tokens(postgres_session=postgres_session, tokens=result.all())
         await postgres_session.commit()
+        await self.invalidate_user_info(user_id=user_id)
 
         if self.playground_session_duration is None:
             expires = None
@@ -604,8 +666,12 @@ class IdentityAccessManager:
             raise TokenNotFoundException()
 
         # delete the token
-        await postgres_session.execute(statement=delete(table=TokenTable).where(TokenTable.id == token_id))
+        result = await postgres_session.execute(
+            statement=delete(table=TokenTable).where(TokenTable.id == token_id).returning(TokenTable.id, TokenTable.expires)
+        )
+        await self._revoke_tokens(postgres_session=postgres_session, tokens=result.all())
         await postgres_session.commit()
+        await self.invalidate_user_info(token_id=token_id)
 
     async def delete_tokens(self, postgres_session: AsyncSession, user_id: int, name: str):
         """
@@ -616,10 +682,12 @@ class IdentityAccessManager:
             user_id: ID of the user whose tokens should be deleted
             name: name filter for tokens to delete
         """
-        query = delete(TokenTable).where(TokenTable.user_id == user_id).where(TokenTable.name == name)
+        query = delete(TokenTable).where(TokenTable.user_id == user_id).where(TokenTable.name == name).returning(TokenTable.id, TokenTable.expires)
 
-        await postgres_session.execute(query)
+        result = await postgres_session.execute(query)
+        await self._revoke_tokens(postgres_session=postgres_session, tokens=result.all())
         await postgres_session.commit()
+        await self.invalidate_user_info(user_id=user_id)
 
     async def get_tokens(
         self,
@@ -671,6 +739,14 @@ class IdentityAccessManager:
         except IndexError:  # malformed token (no token prefix)
             return None, None, None
 
+        if claims.get("expires") is not None and claims["expires"] < time.time():
+            return None, None, None
+
+        # tokens created before the revocation filter have no name claim, and may have been deleted without being revoked
+        if "name" in claims and self.revoked_tokens_synced and claims["token_id"] not in self.revoked_tokens:
+            return claims["user_id"], claims["token_id"], claims["name"]
+
+        # the revocation filter may return false positives, revoked tokens are confirmed in the database
         try:
             tokens = await self.get_tokens(postgres_session, user_id=claims["user_id"], token_id=claims["token_id"], exclude_expired=True, limit=1)
         except TokenNotFoundException:
@@ -678,6 +754,189 @@ class IdentityAccessManager:
 
         return claims["user_id"], claims["token_id"], tokens[0].name
 
+    async def get_token_user_info(self, postgres_session: AsyncSession, token: str) -> tuple[UserInfo | None, int | None, str | None]:
+        """
+        Resolve the user info of an API key. The user info is cached by token ID in the worker for `user_info_cache_ttl` seconds (at
+        most until the expiration of the token), and evicted from the caches of all the workers when the token is revoked or when the
+        user or its role is modified (see `invalidate_user_info`).
+
+        Args:
+            postgres_session(AsyncSession): Database postgres_session
+            token(str): The API key
+
+        Returns:
+            Tuple containing the user info, the token ID and the token name, or None values if the API key is invalid.
+        """
+        try:
+            claims = self._decode_token(token=token)
+        except JWTError:
+            return None, None, None
+        except IndexError:  # malformed token (no token prefix)
+            return None, None, None
+
+        if self.user_info_cache_ttl > 0:
+            cached = self.user_info_cache.get(claims["token_id"])
+            if cached is not None and cached.expires > time.time():
+                self.user_info_cache.move_to_end(claims["token_id"])
+                USER_INFO_CACHE_REQUESTS.labels(result="hit").inc()
+                return cached.user_info, claims["token_id"], cached.key_name
+            USER_INFO_CACHE_REQUESTS.labels(result="miss").inc()
+
+        # an invalidation received while the user info is read from the database discards the read user info
+        generation = self.user_info_cache_generation
+        user_id, token_id, key_name = await self.check_token(postgres_session=postgres_session, token=token)
+        if not user_id:
+            return None, None, None
+
+        try:
+            user_info = await self.get_user_info(postgres_session=postgres_session, user_id=user_id)
+        except UserNotFoundException:  # the tokens of a deleted user are deleted with the user, but not revoked
+            return None, None, None
+
+        if self.user_info_cache_ttl > 0 and generation == self.user_info_cache_generation:
+            expires = time.time() + self.user_info_cache_ttl
+            if claims.get("expires") is not None:
+                expires = min(expires, claims["expires"])
+            self.user_info_cache[token_id] = _CachedUserInfo(user_info=user_info, key_name=key_name, expires=expires)
+            self.user_info_cache.move_to_end(token_id)
+            while len(self.user_info_cache) > self.user_info_cache_size:
+                self.user_info_cache.popitem(last=False)
+
+        return user_info, token_id, key_name
+
+    def _evict_user_info(self, user_id: int | None = None, token_id: int | None = None) -> None:
+        self.user_info_cache_generation += 1
+        if token_id is not None:
+            self.user_info_cache.pop(token_id, None)
+        elif user_id is not None:
+            for key in [key for key, cached in self.user_info_cache.items() if cached.user_info.id == user_id]:
+                del self.user_info_cache[key]
+        else:
+            self.user_info_cache.clear()
+
+    async def invalidate_user_info(self, user_id: int | None = None, token_id: int | None = None) -> None:
+        """
+        Evict cached user info from the user info cache of all the workers. Must be called after each modification of a token, a user
+        or a role. Without a user ID or a token ID, all the cached user info are evicted.
+
+        Args:
+            user_id(int | None): Evict the cached user info of all the tokens of this user.
+            token_id(int | None): Evict the cached user info of this token.
+        """
+        self._evict_user_info(user_id=user_id, token_id=token_id)
+
+        if self.redis_pool is None:
+            return
+
+        message = f"token:{token_id}" if token_id is not None else f"user:{user_id}" if user_id is not None else "all"
+        redis_client = AsyncRedis(connection_pool=self.redis_pool)
+        try:
+            await redis_client.publish(self.USER_INFO_CHANNEL, message)
+        except Exception:
+            # the other workers evict the user info at the expiration of their cache entries
+            logger.warning("Failed to publish user info invalidation.", exc_info=True)
+        finally:
+            await redis_client.aclose()
+
+    async def _revoke_tokens(self, postgres_session: AsyncSession, tokens: list[tuple[int, dt.datetime | None]]) -> None:
+        """
+        Record revoked tokens in the transaction that deletes or expires them, the other workers add them to their revocation filter
+        at their next sync. The revocation of a token is kept until the expiration of the token, after which the token is rejected
+        from its claims (see `sync_revoked_tokens`).
+
+        Args:
+            postgres_session(AsyncSession): Database postgres_session
+            tokens(list[tuple[int, dt.datetime | None]]): The revoked tokens, as (token ID, expiration) tuples.
+        """
+        if not tokens:
+            return
+
+        values = [{"token_id": token_id, "expires": expires} for token_id, expires in tokens]
+        await postgres_session.execute(statement=insert(table=RevokedTokenTable).values(values))
+
+        for token_id, _ in tokens:
+            self.revoked_tokens.add(token_id)
+
+    async def sync_revoked_tokens(self, postgres_session: AsyncSession) -> None:
+        """
+        Add the tokens revoked since the last sync to the revocation filter of the worker. Until the first sync, the tokens are checked
+        in the database. When the filter is full, a filter twice as large as the revoked tokens is rebuilt from them. The revocations
+        of expired tokens are not needed, as these tokens are rejected from their claims: they are not read, and they are deleted at
+        the first sync and when the filter is rebuilt, so the revocation set only holds the tokens which are still valid.
+
+        The IDs of the revocations are allocated before their transaction is committed, so a revocation can be committed after a
+        revocation with a greater ID: the recent revocations are read again at each sync.
+
+        Args:
+            postgres_session(AsyncSession): Database postgres_session
+        """
+        async with self.revoked_tokens_lock:
+            if not self.revoked_tokens_synced:
+                await self._delete_expired_revocations(postgres_session=postgres_session)
+
+            revoked_tokens, offset = self.revoked_tokens, self.revoked_tokens_offset
+            recent = RevokedTokenTable.created >= func.now() - timedelta(seconds=self.REVOKED_TOKENS_SYNC_MARGIN)
+            valid = or_(RevokedTokenTable.expires.is_(None), RevokedTokenTable.expires >= func.now())
+            statement = select(RevokedTokenTable.id, RevokedTokenTable.token_id).where(valid)
+            result = await postgres_session.execute(statement=statement.where(or_(RevokedTokenTable.id > offset, recent)))
+            rows = result.all()
+            if revoked_tokens.count + len(rows) > revoked_tokens.capacity:
+                await self._delete_expired_revocations(postgres_session=postgres_session)
+                result = await postgres_session.execute(statement=statement)
+                rows = result.all()
+                revoked_tokens = BloomFilter(capacity=max(2 * len(rows), self.REVOKED_TOKENS_CAPACITY))
+
+            for revocation_id, token_id in rows:
+                if token_id not in revoked_tokens:  # do not count the recent revocations read again
+                    revoked_tokens.add(token_id)
+                offset = max(offset, revocation_id)
+
+            self.revoked_tokens, self.revoked_tokens_offset, self.revoked_tokens_synced = revoked_tokens, offset, True
+
+    async def _delete_expired_revocations(self, postgres_session: AsyncSession) -> None:
+        await postgres_session.execute(statement=delete(table=RevokedTokenTable).where(RevokedTokenTable.expires < func.now()))
+        await postgres_session.commit()
+
+    async def watch_invalidations(self, postgres_session_factory: sessionmaker) -> None:
+        """
+        Evict the cached user info invalidated by the other workers, and sync the revocation filter with the tokens they revoked, until
+        cancelled. The revocation filter is also synced every `REVOKED_TOKENS_SYNC_INTERVAL` seconds, so a revocation is applied by all
+        the workers even if its invalidation is lost. Run as a background task in lifespan.
+
+        Args:
+            postgres_session_factory(sessionmaker): Database session factory
+        """
+        redis_client = AsyncRedis(connection_pool=self.redis_pool)
+        try:
+            while True:
+                try:
+                    async with redis_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                        await pubsub.subscribe(self.USER_INFO_CHANNEL)
+                        # invalidations published while the subscription was down are lost
+                        self._evict_user_info()
+                        while True:
+                            async with postgres_session_factory() as postgres_session:
+                                await self.sync_revoked_tokens(postgres_session=postgres_session)
+
+                            message = await pubsub.get_message(timeout=self.REVOKED_TOKENS_SYNC_INTERVAL)
+                            if message is None:
+                                continue
+                            data = message["data"].decode() if isinstance(message["data"], bytes) else message["data"]
+                            scope, _, value = data.partition(":")
+                            if scope == "token":
+                                self._evict_user_info(token_id=int(value))
+                            elif scope == "user":
+                                self._evict_user_info(user_id=int(value))
+                            else:
+                                self._evict_user_info()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.error("Invalidations subscription failed, retrying.", exc_info=True)
+                    await asyncio.sleep(1)
+        finally:
+            await redis_client.aclose()
+
     async def invalidate_token(self, postgres_session: AsyncSession, token_id: int, user_id: int) -> None:
         """
         Invalidate a token by setting its expires to the current timestamp
@@ -687,10 +946,17 @@ class IdentityAccessManager:
             token_id: ID of the token to invalidate
             user_id: ID of the user who owns the token (for security)
         """
+        # the revocation lasts until the expiration of the token claims, read before the token is expired
+        result = await postgres_session.execute(
+            select(TokenTable.id, TokenTable.expires).where(TokenTable.id == token_id).where(TokenTable.user_id == user_id).with_for_update()
+        )
+        tokens = result.all()
         await postgres_session.execute(
             update(TokenTable).where(TokenTable.id == token_id).where(TokenTable.user_id == user_id).values(expires=func.now())
         )
+        await self._revoke_tokens(postgres_session=postgres_session, tokens=tokens)
         await postgres_session.commit()
+        await self.invalidate_user_info(token_id=token_id)
 
     async def get_user(
         self,
@@ -757,6 +1023,7 @@ class IdentityAccessManager:
                 created=user.created,
                 updated=user.updated,
                 priority=user.priority,
+                routing_weight=role.routing_weight,
             )
 
         return user
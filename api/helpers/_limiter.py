@@ -1,4 +1,7 @@
+import asyncio
+from dataclasses import dataclass
 import logging
+import time
 
 from limits import RateLimitItemPerDay, RateLimitItemPerMinute
 from limits.aio import storage, strategies
@@ -13,9 +16,136 @@ from api.utils.variables import PREFIX__REDIS_RATE_LIMIT
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class _LocalBudget:
+    requests: float  # requests left in the leased blocks
+    tokens: float  # tokens left in the leased blocks
+    block_requests: float  # requests leased by block
+    block_tokens: float  # tokens leased by block
+    expires: float  # monotonic time after which the unused budget is discarded
+    refilling: bool = False
+
+
 class Limiter:
-    def __init__(self, redis_pool: ConnectionPool, strategy: LimitingStrategy):
+    # Check and consume all the limits of a request in a single round trip, with the same keys as the strategies of the `limits`
+    # library. The limits are consumed only if none of them is exceeded. KEYS: key and previous window key (sliding window) of each
+    # limit. ARGV: strategy, timestamp, then amount, expiry and cost of each limit, then optionally the amount given back on each limit
+    # before it is checked (unused local budget, see `_release_local_budget`). Returns the index of the first exceeded limit (0 if
+    # none) followed by the remaining amount of each limit.
+    HIT_SCRIPT = """
+local strategy = ARGV[1]
+local now = tonumber(ARGV[2])
+local count = #KEYS / 2
+local remaining = {}
+local exceeded = 0
+
+local function refund(key, amount)
+    if strategy == 'moving_window' then
+        redis.call('LTRIM', key, amount, -1)
+    else
+        local current = tonumber(redis.call('GET', key)) or 0
+        if current > 0 then
+            redis.call('DECRBY', key, math.min(amount, current))
+        end
+    end
+end
+
+local function get_moving_window(key, amount, expiry)
+    local low, high, oldest = 0, amount - 1, -1
+    while low <= high do
+        local mid = math.floor((low + high) / 2)
+        local entry = tonumber(redis.call('LINDEX', key, mid))
+        if entry and entry >= now - expiry then
+            oldest = mid
+            low = mid + 1
+        else
+            high = mid - 1
+        end
+    end
+    return oldest + 1
+end
+
+local function get_sliding_window(key, previous_key, expiry)
+    local current_ttl = tonumber(redis.call('PTTL', key))
+    if current_ttl > 0 and current_ttl < expiry then
+        redis.call('RENAME', key, previous_key)
+        redis.call('SET', key, 0, 'PX', current_ttl + expiry)
+    end
+    local previous_count = tonumber(redis.call('GET', previous_key)) or 0
+    local previous_ttl = math.max(tonumber(redis.call('PTTL', previous_key)), 0)
+    local current_count = tonumber(redis.call('GET', key)) or 0
+    return math.floor(previous_count * previous_ttl / expiry) + current_count
+end
+
+for i = 1, count do
+    local key, previous_key = KEYS[2 * i - 1], KEYS[2 * i]
+    local amount, expiry, cost = tonumber(ARGV[3 * i]), tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2])
+    local given_back = tonumber(ARGV[3 * count + 2 + i]) or 0
+    local used
+    if given_back > 0 then
+        if strategy == 'sliding_window' then
+            get_sliding_window(key, previous_key, expiry * 1000)
+        end
+        refund(key, given_back)
+    end
+    if strategy == 'moving_window' then
+        used = get_moving_window(key, amount, expiry)
+    elseif strategy == 'sliding_window' then
+        used = get_sliding_window(key, previous_key, expiry * 1000)
+    else
+        used = tonumber(redis.call('GET', key)) or 0
+    end
+    remaining[i] = amount - used
+    if exceeded == 0 and cost > 0 and used + cost > amount then
+        exceeded = i
+    end
+end
+
+if exceeded > 0 then
+    return {exceeded, unpack(remaining)}
+end
+
+for i = 1, count do
+    local key = KEYS[2 * i - 1]
+    local amount, expiry, cost = tonumber(ARGV[3 * i]), tonumber(ARGV[3 * i + 1]), tonumber(ARGV[3 * i + 2])
+    if strategy == 'moving_window' then
+        local entries = {}
+        for j = 1, cost do
+            entries[j] = now
+        end
+        for j = 1, #entries, 5000 do
+            redis.call('LPUSH', key, unpack(entries, j, math.min(j + 4999, #entries)))
+        end
+        redis.call('LTRIM', key, 0, amount - 1)
+        redis.call('EXPIRE', key, expiry)
+    elseif strategy == 'sliding_window' then
+        if redis.call('EXISTS', key) == 1 then
+            redis.call('INCRBY', key, cost)
+        else
+            redis.call('SET', key, cost, 'PX', expiry * 2000)
+        end
+    else
+        redis.call('INCRBY', key, cost)
+        if redis.call('TTL', key) < 0 then
+            redis.call('EXPIRE', key, expiry)
+        end
+    end
+    remaining[i] = remaining[i] - cost
+end
+
+return {0, unpack(remaining)}
+"""
+
+    def __init__(self, redis_pool: ConnectionPool, strategy: LimitingStrategy, local_share: float = 0.0, local_ttl: float = 10.0):
         self.redis_pool = redis_pool
+        self.strategy_type = strategy
+
+        # local pre-admission tier: each worker leases blocks of `local_share` of the limits of a user in Redis and admits the
+        # requests of the user locally until the block is spent, see `_hit_local_limits`
+        self.local_share = local_share
+        self.local_ttl = local_ttl
+        self.local_budgets: dict[tuple, _LocalBudget] = {}
+        self.refill_tasks: set[asyncio.Task] = set()
         self.redis_storage = storage.RedisStorage(uri=self.redis_pool.url, connection_pool=self.redis_pool, implementation="redispy")
         self.redis_client = Redis(connection_pool=redis_pool)
 
@@ -93,6 +223,172 @@ class Limiter:
         except Exception:
             logger.debug(msg="Error during rate limit remaining.", exc_info=True)
 
+    async def hit_limits(self, user_id: int, router_id: int, limits: list[tuple[LimitType, int, int]], refunds: list[int] | None = None) -> tuple[LimitType | None, list[int | None]]:  # fmt: off
+        """
+        Check and consume several limits of the user for the given router at once, in a single Redis round trip. The limits are
+        consumed only if none of them is exceeded.
+
+        Args:
+            user_id(int): The user ID to check the limits for.
+            router_id (int): The router ID to check the limits for.
+            limits(list[tuple[LimitType, int, int]]): The limits to check, tuples of (type, value, cost).
+            refunds(list[int] | None): The amount given back on each limit before it is checked, whether the limits are exceeded or not.
+
+        Returns:
+            tuple[LimitType | None, list[int | None]]: The type of the first exceeded limit (None if no limit is exceeded) and the remaining
+                amount of each limit (None if the limits could not be checked).
+        """
+        keys, args = [], [self.strategy_type.value, time.time()]
+        for type, value, cost in limits:
+            limit = await self._get_limit(type=type, value=value)
+            key = limit.key_for(f"{PREFIX__REDIS_RATE_LIMIT}:{type.value}:{user_id}:{router_id}")
+            if self.strategy_type == LimitingStrategy.SLIDING_WINDOW:  # current and previous window keys
+                keys.extend([f"LIMITS:{{{key}}}", f"LIMITS:{{{key}}}/-1"])
+            else:
+                keys.extend([f"LIMITS:{key}", f"LIMITS:{key}"])
+            args.extend([value, limit.get_expiry(), cost])
+        if refunds:
+            args.extend(refunds)
+
+        try:
+            exceeded, *remaining = await self.redis_client.eval(self.HIT_SCRIPT, len(keys), *keys, *args)
+        except Exception:
+            logger.error(msg="Error during rate limit hit.", exc_info=True)
+            return None, [None] * len(limits)
+
+        return (limits[int(exceeded) - 1][0] if int(exceeded) > 0 else None), [int(value) for value in remaining]
+
+    async def _lease_local_budget(self, user_id: int, router_id: int, values: dict[LimitType, int | None], tokens: int, release: _LocalBudget | None = None) -> _LocalBudget | None:  # fmt: off
+        """
+        Lease a block of the request and token limits of the user for the given router, consumed in Redis at once. The block is a
+        `local_share` of the per minute limits (or of the per day limits if the former are not defined), at least one request and the
+        tokens of the current request. Token limits are leased only if the request carries tokens.
+
+        Args:
+            user_id(int): The user ID.
+            router_id(int): The router ID.
+            values(dict[LimitType, int | None]): The limits of the user for the router.
+            tokens(int): The tokens of the current request.
+            release(_LocalBudget | None): A budget replaced by the block, whose unused part is given back in the same round trip.
+
+        Returns:
+            _LocalBudget | None: The leased budget, None if the block exceeds a limit (the user is close to its limits).
+        """
+        request_values = [value for value in (values[LimitType.RPM], values[LimitType.RPD]) if value is not None]
+        token_values = [value for value in (values[LimitType.TPM], values[LimitType.TPD]) if value is not None]
+        block_requests = max(1, int(request_values[0] * self.local_share)) if request_values else float("inf")
+        if not token_values:
+            block_tokens = float("inf")
+        else:
+            block_tokens = max(tokens, int(token_values[0] * self.local_share)) if tokens > 0 else 0
+
+        costs = {LimitType.RPM: block_requests, LimitType.RPD: block_requests, LimitType.TPM: block_tokens, LimitType.TPD: block_tokens}
+        unused = self._get_unused_budget(budget=release) if release is not None else {}
+        types = [type for type in costs if values[type] is not None and (costs[type] > 0 or unused.get(type, 0) > 0)]
+        if types:
+            limits = [(type, values[type], costs[type]) for type in types]
+            refunds = [unused.get(type, 0) for type in types] if unused else None
+            exceeded, _ = await self.hit_limits(user_id=user_id, router_id=router_id, limits=limits, refunds=refunds)
+            if exceeded is not None:
+                return None
+
+        expires = time.monotonic() + self.local_ttl
+        return _LocalBudget(requests=block_requests, tokens=block_tokens, block_requests=block_requests, block_tokens=block_tokens, expires=expires)
+
+    @staticmethod
+    def _get_unused_budget(budget: _LocalBudget) -> dict[LimitType, int]:
+        requests = int(max(budget.requests, 0)) if budget.requests != float("inf") else 0
+        tokens = int(max(budget.tokens, 0)) if budget.tokens != float("inf") else 0
+        return {LimitType.RPM: requests, LimitType.RPD: requests, LimitType.TPM: tokens, LimitType.TPD: tokens}
+
+    async def _release_local_budget(self, key: tuple, budget: _LocalBudget) -> None:
+        """
+        Give the unused requests and tokens of a local budget back in Redis, so they are not lost for the other workers.
+
+        Args:
+            key(tuple): The key of the budget in `local_budgets`.
+            budget(_LocalBudget): The released budget, no longer in `local_budgets`.
+        """
+        user_id, router_id, values = key[0], key[1], dict(key[2])
+        unused = self._get_unused_budget(budget=budget)
+        types = [type for type in unused if values[type] is not None and unused[type] > 0]
+        if types:
+            limits = [(type, values[type], 0) for type in types]
+            await self.hit_limits(user_id=user_id, router_id=router_id, limits=limits, refunds=[unused[type] for type in types])
+
+    async def _refill_local_budget(self, key: tuple, user_id: int, router_id: int, values: dict[LimitType, int | None], tokens: int) -> None:
+        budget = self.local_budgets.get(key)
+        try:
+            block = await self._lease_local_budget(user_id=user_id, router_id=router_id, values=values, tokens=tokens)
+            if block is not None:
+                if budget is not None and budget is self.local_budgets.get(key):
+                    budget.requests += block.requests
+                    budget.tokens += block.tokens
+                    budget.expires = block.expires
+                else:  # the budget has been replaced or released meanwhile
+                    await self._release_local_budget(key=key, budget=block)
+        except Exception:
+            logger.error(msg="Error during local rate limit refill.", exc_info=True)
+        finally:
+            if budget is not None:
+                budget.refilling = False
+
+    async def _hit_local_limits(self, user_id: int, router_id: int, values: dict[LimitType, int | None], tokens: int) -> bool:
+        """
+        Admit a request with the budget leased locally by the worker for the user and the router, without Redis round trip. A block
+        is leased synchronously if the budget is missing, expired or spent, and the next block is leased in background once half of
+        the block is spent. The unused part of a budget is given back in Redis when it is replaced, or when it expires after
+        `local_ttl` seconds (see `run`), so the requests admitted in excess of a limit within a window are bounded by `local_share` of
+        the limit per worker, and the budget leased but not spent is not lost for the other workers.
+
+        Returns:
+            bool: True if the request is admitted locally, False if the user is close to its limits and the request must be checked
+                exactly in Redis.
+        """
+        key = (user_id, router_id, tuple(values.items()))  # a change of the limits of the user leases a new budget
+        budget = self.local_budgets.get(key)
+
+        if budget is None or budget.expires < time.monotonic() or budget.requests < 1 or budget.tokens < tokens:
+            # the replaced budget is removed before the round trip, so its unused part is given back only once
+            self.local_budgets.pop(key, None)
+            block = await self._lease_local_budget(user_id=user_id, router_id=router_id, values=values, tokens=tokens, release=budget)
+            if block is None:
+                return False
+
+            budget = self.local_budgets.get(key)
+            if budget is None:
+                budget = self.local_budgets[key] = block
+            else:  # leased concurrently by another request
+                budget.requests += block.requests
+                budget.tokens += block.tokens
+                budget.expires = max(budget.expires, block.expires)
+
+        budget.requests -= 1
+        budget.tokens -= tokens
+
+        if not budget.refilling and (budget.requests < budget.block_requests / 2 or budget.tokens < budget.block_tokens / 2):
+            budget.refilling = True
+            task = asyncio.create_task(self._refill_local_budget(key=key, user_id=user_id, router_id=router_id, values=values, tokens=tokens))
+            self.refill_tasks.add(task)
+            task.add_done_callback(self.refill_tasks.discard)
+
+        return True
+
+    async def run(self) -> None:
+        """
+        Give the unused part of the expired local budgets back in Redis until cancelled. Run as a background task in lifespan.
+        """
+        while True:
+            await asyncio.sleep(self.local_ttl)
+            await self._release_expired_local_budgets()
+
+    async def _release_expired_local_budgets(self) -> None:
+        now = time.monotonic()
+        for key, budget in list(self.local_budgets.items()):
+            if budget.expires < now and self.local_budgets.get(key) is budget:
+                del self.local_budgets[key]
+                await self._release_local_budget(key=key, budget=budget)
+
     async def check_user_limits(self, user_info: UserInfo, router_id: int, prompt_tokens: int | None = None) -> None:
         if user_info.id == 0:
             return
@@ -118,29 +414,29 @@ class Limiter:
         if 0 in [tpm, tpd, rpm, rpd]:
             raise InsufficientPermissionException(detail="Insufficient permissions to access the model.")
 
-        # RPM
-        check = await self.hit(user_id=user_info.id, router_id=router_id, type=LimitType.RPM, value=rpm)
-        if not check:
-            remaining = await self.remaining(user_id=user_info.id, router_id=router_id, type=LimitType.RPM, value=rpm)
-            raise RateLimitExceeded(detail=f"{str(rpm)} requests per minute exceeded (remaining: {remaining}).")
+        if self.local_share > 0:
+            values = {LimitType.RPM: rpm, LimitType.RPD: rpd, LimitType.TPM: tpm, LimitType.TPD: tpd}
+            if await self._hit_local_limits(user_id=user_info.id, router_id=router_id, values=values, tokens=prompt_tokens or 0):
+                return
 
-        # RPD
-        check = await self.hit(user_id=user_info.id, router_id=router_id, type=LimitType.RPD, value=rpd)
-        if not check:
-            remaining = await self.remaining(user_id=user_info.id, router_id=router_id, type=LimitType.RPD, value=rpd)
-            raise RateLimitExceeded(detail=f"{str(rpd)} requests per day exceeded (remaining: {remaining}).")
+        limits = [(LimitType.RPM, rpm, 1), (LimitType.RPD, rpd, 1)]
+        if prompt_tokens:
+            limits.extend([(LimitType.TPM, tpm, prompt_tokens), (LimitType.TPD, tpd, prompt_tokens)])
+        limits = [(type, value, cost) for type, value, cost in limits if value is not None]
+        if not limits:
+            return
 
-        if not prompt_tokens:
+        exceeded, remaining = await self.hit_limits(user_id=user_info.id, router_id=router_id, limits=limits)
+        if exceeded is None:
             return
 
-        # TPM
-        check = await self.hit(user_id=user_info.id, router_id=router_id, type=LimitType.TPM, value=tpm, cost=prompt_tokens)
-        if not check:
-            remaining = await self.remaining(user_id=user_info.id, router_id=router_id, type=LimitType.TPM, value=tpm)
-            raise RateLimitExceeded(detail=f"{str(tpm)} input tokens per minute exceeded (remaining: {remaining}).")
-
-        # TPD
-        check = await self.hit(user_id=user_info.id, router_id=router_id, type=LimitType.TPD, value=tpd, cost=prompt_tokens)
-        if not check:
-            remaining = await self.remaining(user_id=user_info.id, router_id=router_id, type=LimitType.TPD, value=tpd)
-            raise RateLimitExceeded(detail=f"{str(tpd)} input tokens per day exceeded (remaining: {remaining}).")
+        value, remaining = [(value, remaining) for (type, value, _), remaining in zip(limits, remaining) if type == exceeded][0]
+        match exceeded:
+            case LimitType.RPM:
+                raise RateLimitExceeded(detail=f"{str(value)} requests per minute exceeded (remaining: {remaining}).")
+            case LimitType.RPD:
+                raise RateLimitExceeded(detail=f"{str(value)} requests per day exceeded (remaining: {remaining}).")
+            case LimitType.TPM:
+                raise RateLimitExceeded(detail=f"{str(value)} input tokens per minute exceeded (remaining: {remaining}).")
+            case LimitType.TPD:
+                raise RateLimitExceeded(detail=f"{str(value)} input tokens per day exceeded (remaining: {remaining}).")
@@ -0,0 +1,132 @@
+import asyncio
+from collections import deque
+import logging
+import math
+import os
+import socket
+import time
+
+from redis.asyncio import ConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers._metricsamples import add_metric_samples
+from api.helpers._quantilesketch import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsAggregator:
+    """
+    Write-behind aggregator of the provider performance metrics. Samples are recorded in process, in a bounded ring buffer by
+    time series, and summarized every `flush_interval` milliseconds in at most `precision` data points per time series, written
+    to Redis time series in a single `TS.MADD`. The data points are evenly spaced quantiles of the recorded samples, written in the
+    series of the worker (key suffixed and `worker` label set with the host and the process ID), as the data points of several
+    workers flushed at the same time have the same timestamps. The quantile sketches read by the least busy load balancing strategy
+    are updated with all the recorded samples, and the peak EWMA read by the peak EWMA load balancing strategy with the raw samples
+    recorded with `record_peak_ewma`, in arrival order with their timestamp.
+
+    Args:
+        flush_interval(int): Number of milliseconds between two flushes.
+        precision(int): Maximum number of data points written by time series on each flush.
+        buffer_size(int): Maximum number of samples kept by time series between two flushes, older samples are dropped.
+        peak_ewma_half_life(float | None): The half-life in seconds of the peak EWMA of the providers latency, None to skip the update.
+    """
+
+    def __init__(self, flush_interval: int, precision: int, buffer_size: int = 4096, peak_ewma_half_life: float | None = None) -> None:
+        self.flush_interval = flush_interval
+        self.precision = precision
+        self.peak_ewma_half_life = peak_ewma_half_life
+        self.buffer_size = buffer_size
+        self.buffers: dict[str, deque[float]] = {}
+        self.sketches: dict[str, QuantileSketch] = {}
+        self.latencies: deque[tuple[str, int, float]] = deque(maxlen=buffer_size)
+        self.created_keys: set[str] = set()
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+
+    def record(self, key: str, value: float) -> None:
+        """
+        Record a sample, written to Redis on the next flush.
+
+        Args:
+            key(str): The time series key.
+            value(float): The sample value.
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = deque(maxlen=self.buffer_size)
+        buffer.append(value)
+
+        timestamp = int(time.time() * 1000)
+        sketch_key = QuantileSketch.get_key(timeserie_key=key, timestamp=timestamp)
+        self.sketches.setdefault(sketch_key, QuantileSketch()).add(value=value)
+
+    def record_peak_ewma(self, key: str, value: float) -> None:
+        """
+        Record a latency sample of the peak EWMA of a provider, written to Redis on the next flush.
+
+        Args:
+            key(str): The latency time series key of the provider.
+            value(float): The sample value.
+        """
+        # the peak EWMA follows the spikes, it would be the maximum of the flush interval if updated with the summarized samples
+        if self.peak_ewma_half_life is not None:
+            self.latencies.append((key, int(time.time() * 1000), value))
+
+    def summarize(self, values: list[float]) -> list[float]:
+        """
+        Summarize samples in at most `precision` values, evenly spaced quantiles of the samples including the minimum and the maximum.
+
+        Args:
+            values(list[float]): The samples.
+
+        Returns:
+            list[float]: The sorted summarized values.
+        """
+        values = sorted(values)
+        if len(values) <= self.precision:
+            return values
+
+        if self.precision == 1:
+            return [values[math.ceil(len(values) / 2) - 1]]
+
+        step = (len(values) - 1) / (self.precision - 1)
+        return [values[round(i * step)] for i in range(self.precision)]
+
+    async def flush(self, redis_client: AsyncRedis) -> None:
+        """
+        Write the summarized samples recorded since the last flush in Redis. The data points of a time series are written with
+        distinct timestamps ending at the flush time, as the time series keep the last value of duplicate timestamps.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+        """
+        buffers, self.buffers = self.buffers, {}
+        sketches, self.sketches = self.sketches, {}
+        latencies, self.latencies = list(self.latencies), deque(maxlen=self.buffer_size)
+        timestamp = int(time.time() * 1000)
+
+        samples = []
+        for key, buffer in buffers.items():
+            values = self.summarize(values=list(buffer))
+            start = timestamp - len(values) + 1
+            samples.extend((key, start + i, value) for i, value in enumerate(values))
+
+        await add_metric_samples(redis_client=redis_client, samples=samples, created_keys=self.created_keys, sketches=sketches, peak_ewma_half_life=self.peak_ewma_half_life, latencies=latencies, worker=self.worker)  # fmt: off
+
+    async def run(self, redis_pool: ConnectionPool) -> None:
+        """
+        Flush the recorded samples periodically until cancelled, then flush the remaining samples.
+
+        Args:
+            redis_pool(ConnectionPool): The redis connection pool.
+        """
+        redis_client = AsyncRedis(connection_pool=redis_pool)
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval / 1000)
+                await self.flush(redis_client=redis_client)
+        except asyncio.CancelledError:
+            await self.flush(redis_client=redis_client)
+            raise
+        finally:
+            await redis_client.aclose()
@@ -0,0 +1,78 @@
+import logging
+
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers._peakewma import PeakEwma
+from api.helpers._quantilesketch import QuantileSketch
+from api.schemas.core.models import Metric
+from api.utils.variables import REDIS__TIMESERIE_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+async def add_metric_samples(
+    redis_client: AsyncRedis,
+    samples: list[tuple[str, int, float]],
+    created_keys: set[str],
+    sketches: dict[str, QuantileSketch] | None = None,
+    peak_ewma_half_life: float | None = None,
+    latencies: list[tuple[str, int, float]] | None = None,
+    worker: str | None = None,
+) -> None:
+    """
+    Add performance metric samples to Redis time series and their quantile sketches in a single pipeline. The samples are added
+    with `TS.MADD`, the time series are created (labelled by metric and provider ID) in the same pipeline on first use and
+    remembered in `created_keys`, so they are not created again on the next call. The sketch slots are incremented with `HINCRBY`
+    and expire after the retention window. The latency samples also update the peak EWMA of their provider, in order.
+
+    Args:
+        redis_client: The Redis client to use
+        samples: The samples to add, as (key, timestamp in milliseconds, value) tuples
+        created_keys: The time series keys already created by the process, updated in place
+        sketches: The sketches to add by sketch key, built from the samples if not provided
+        peak_ewma_half_life: The half-life in seconds of the peak EWMA of the providers latency, None to skip the update
+        latencies: The raw latency samples updating the peak EWMA, in arrival order, the latency samples of `samples` if not provided
+        worker: The worker writing the samples, added to the time series keys and labels so the series written by several workers with
+            the same timestamps do not overwrite each other, None to write in the series shared by the workers
+    """
+    if not samples:
+        return
+
+    if sketches is None:
+        sketches = QuantileSketch.from_samples(samples=samples)
+
+    series = {key: key if worker is None else f"{key}:{worker}" for key, _, _ in samples}
+    new_keys = list(dict.fromkeys(key for key, _, _ in samples if series[key] not in created_keys))
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for key in new_keys:
+            # labels allow to query the series of several providers or workers at once (eg. `TS.MRANGE ... FILTER metric=ttft`)
+            _, metric, provider_id = key.rsplit(":", 2)
+            labels = {"metric": metric, "provider_id": provider_id} | ({"worker": worker} if worker is not None else {})
+            pipeline.ts().create(series[key], retention_msecs=REDIS__TIMESERIE_RETENTION_SECONDS * 1000, duplicate_policy="LAST", labels=labels)  # fmt: off
+            pipeline.ts().alter(series[key], labels=labels)  # label the series created without labels
+        for key, sketch in sketches.items():
+            for field, count in sketch.to_redis().items():
+                pipeline.hincrby(key, field, count)
+            pipeline.expire(key, REDIS__TIMESERIE_RETENTION_SECONDS + 2 * QuantileSketch.SLOT_SECONDS)
+        if peak_ewma_half_life is not None:
+            if latencies is None:
+                latencies = [sample for sample in samples if sample[0].rsplit(":", 2)[1] == Metric.LATENCY.value]
+            for key, timestamp, value in latencies:
+                provider_id = key.rsplit(":", 1)[1]
+                PeakEwma.queue_update(pipeline=pipeline, provider_id=provider_id, latency=value, timestamp=timestamp, half_life=peak_ewma_half_life)  # fmt: off
+        pipeline.ts().madd(ktv_tuples=[(series[key], timestamp, value) for key, timestamp, value in samples])
+        results = await pipeline.execute(raise_on_error=False)
+    except Exception:
+        logger.error(f"Failed to add {len(samples)} metric samples in redis", exc_info=True)
+        return
+
+    # creation errors are expected if the time series already exists (created by another process)
+    created_keys.update(series[key] for key in new_keys)
+
+    madd_results = results[-1] if isinstance(results[-1], list) else [results[-1]] * len(samples)
+    for (key, _, _), result in zip(samples, madd_results):
+        if isinstance(result, Exception):
+            # time series may have been deleted (eg. Redis flush), create it again on next call
+            created_keys.discard(series[key])
+            logger.error(f"Failed to add time series sample {key} in redis: {result}")
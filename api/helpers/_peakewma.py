@@ -0,0 +1,78 @@
+from api.utils.variables import PREFIX__REDIS_METRIC_EWMA, REDIS__TIMESERIE_RETENTION_SECONDS
+
+
+class PeakEwma:
+    """
+    Peak exponentially weighted moving average (peak EWMA) of the latency of a provider. A sample higher than the average replaces
+    it immediately, lower samples are averaged with a weight decaying with the time elapsed since the last update, so the average
+    follows latency spikes at once and recovers within a few half-lives. The state is stored in a Redis hash by provider and updated
+    atomically by a Lua script, so concurrent updates of several API workers are not lost. As a provider avoided after a spike gets
+    no new sample, the average is also decayed when it is read (see `get_decayed`).
+    """
+
+    SCRIPT = """
+local ewma = tonumber(redis.call('HGET', KEYS[1], 'ewma'))
+local last = tonumber(redis.call('HGET', KEYS[1], 'timestamp'))
+local sample = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local half_life = tonumber(ARGV[3])
+
+if ewma == nil or last == nil or sample > ewma then
+    ewma = sample
+else
+    local weight = math.pow(0.5, math.max(now - last, 0) / half_life)
+    ewma = ewma * weight + sample * (1 - weight)
+end
+
+redis.call('HSET', KEYS[1], 'ewma', tostring(ewma), 'timestamp', now, 'half_life', half_life)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return tostring(ewma)
+"""
+
+    @staticmethod
+    def get_key(provider_id: int | str) -> str:
+        """
+        Get the Redis key of the peak EWMA of a provider.
+
+        Args:
+            provider_id(int | str): The provider ID.
+
+        Returns:
+            str: The Redis key.
+        """
+        return f"{PREFIX__REDIS_METRIC_EWMA}:{provider_id}"
+
+    @staticmethod
+    def get_decayed(ewma: float, timestamp: float, half_life: float, target: float, now: float) -> float:
+        """
+        Decay a peak EWMA toward a target value with the time elapsed since its last update, as if the provider had been sampled at
+        the target latency meanwhile, so the average of a provider without new sample does not stay frozen.
+
+        Args:
+            ewma(float): The peak EWMA read in Redis.
+            timestamp(float): The timestamp of the last update in milliseconds.
+            half_life(float): The half-life of the decay in milliseconds.
+            target(float): The value toward which the average decays.
+            now(float): The current timestamp in milliseconds.
+
+        Returns:
+            float: The decayed peak EWMA.
+        """
+        weight = 0.5 ** (max(now - timestamp, 0) / half_life)
+        return ewma * weight + target * (1 - weight)
+
+    @classmethod
+    def queue_update(cls, pipeline, provider_id: int | str, latency: float, timestamp: int, half_life: float) -> None:
+        """
+        Queue the update of the peak EWMA of a provider with a latency sample in a Redis pipeline. The state of a provider without
+        update during the retention window expires, so a provider avoided because of a past spike is tried again.
+
+        Args:
+            pipeline: The Redis pipeline.
+            provider_id(int | str): The provider ID.
+            latency(float): The latency sample in milliseconds.
+            timestamp(int): The timestamp of the sample in milliseconds.
+            half_life(float): The half-life of the decay in seconds.
+        """
+        args = [latency, timestamp, half_life * 1000, REDIS__TIMESERIE_RETENTION_SECONDS * 1000]
+        pipeline.eval(cls.SCRIPT, 1, cls.get_key(provider_id=provider_id), *args)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+
+from redis.asyncio import ConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+
+from api.clients.model import BaseModelProvider as ModelProvider
+from api.helpers.models import ModelRegistry
+from api.schemas.admin.providers import Provider
+from api.utils.variables import PREFIX__REDIS_METRIC_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderMetricsScraper:
+    """
+    Background scraper of the metrics exposed by the model providers (eg. vLLM and TEI Prometheus endpoints). Every `interval`
+    seconds, the backend metrics (requests waiting and running, KV cache usage) of the providers of the routing catalog are
+    scraped concurrently and cached in a Redis hash by provider, read by the `least_loaded` load balancing strategy and the
+    backend QoS metrics. A Redis lock ensures that a single API worker scrapes the providers on each interval, and the cached
+    metrics expire if they are not refreshed, so a provider that cannot be scraped is not judged on stale values.
+
+    Args:
+        model_registry(ModelRegistry): The model registry, its routing catalog gives the providers to scrape.
+        interval(float): Number of seconds between two scrapes.
+    """
+
+    LOCK_KEY = f"{PREFIX__REDIS_METRIC_BACKEND}:lock"
+
+    def __init__(self, model_registry: ModelRegistry, interval: float) -> None:
+        self.model_registry = model_registry
+        self.interval = interval
+
+    @staticmethod
+    def get_key(provider_id: int) -> str:
+        """
+        Get the Redis key of the backend metrics of a provider.
+
+        Args:
+            provider_id(int): The provider ID.
+
+        Returns:
+            str: The Redis key.
+        """
+        return f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}"
+
+    async def scrape(self, redis_client: AsyncRedis) -> None:
+        """
+        Scrape the metrics of all the providers supporting it and cache them in Redis, unless another worker already did it for
+        the current interval.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+        """
+        catalog = self.model_registry.catalog
+        if catalog is None:
+            return
+
+        providers = [provider for providers in catalog.providers.values() for provider in providers]
+        providers = [provider for provider in providers if ModelProvider.import_module(type=provider.type).METRICS_ENDPOINT is not None]
+        if not providers:
+            return
+
+        if not await redis_client.set(self.LOCK_KEY, 1, nx=True, px=int(self.interval * 1000 * 0.9)):
+            return
+
+        results = await asyncio.gather(*[self._scrape_provider(provider=provider) for provider in providers])
+
+        pipeline = redis_client.pipeline(transaction=False)
+        for provider, metrics in zip(providers, results):
+            if metrics:
+                pipeline.hset(self.get_key(provider_id=provider.id), mapping=metrics)
+                pipeline.pexpire(self.get_key(provider_id=provider.id), int(self.interval * 1000 * 3))
+        await pipeline.execute()
+
+    async def run(self, redis_pool: ConnectionPool) -> None:
+        """
+        Scrape the providers metrics periodically until cancelled.
+
+        Args:
+            redis_pool(ConnectionPool): The redis connection pool.
+        """
+        redis_client = AsyncRedis(connection_pool=redis_pool)
+        try:
+            while True:
+                try:
+                    await self.scrape(redis_client=redis_client)
+                except Exception:
+                    logger.error("Failed to scrape providers metrics.", exc_info=True)
+                await asyncio.sleep(self.interval)
+        finally:
+            await redis_client.aclose()
+
+    async def _scrape_provider(self, provider: Provider) -> dict[str, float]:
+        model_provider = ModelProvider.import_module(type=provider.type)(
+            url=provider.url,
+            key=provider.key,
+            timeout=provider.timeout,
+            model_name=provider.model_name,
+            model_hosting_zone=provider.model_hosting_zone,
+            model_total_params=provider.model_total_params,
+            model_active_params=provider.model_active_params,
+        )
+        try:
+            return await model_provider.get_backend_metrics()
+        except Exception as e:
+            logger.debug(f"Failed to scrape metrics of provider {provider.id} ({provider.url}): {e}")
+            return {}
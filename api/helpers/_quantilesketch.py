@@ -0,0 +1,166 @@
+import math
+
+from api.utils.variables import PREFIX__REDIS_METRIC_SKETCH, PREFIX__REDIS_METRIC_TIMESERIE, REDIS__TIMESERIE_RETENTION_SECONDS
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (DDSketch) of a performance metric. Values are counted in logarithmic buckets, so any quantile is
+    estimated with a bounded relative error and the size of the sketch does not depend on the number of values. In Redis, a sketch
+    is stored as a hash of bucket counts by time slot of `SLOT_SECONDS` seconds; the sketch of the retention window is the merge of
+    the slots of the window, so a routing decision reads a bounded amount of data whatever the traffic.
+
+    Args:
+        buckets(dict[int, int] | None): The counts by bucket index.
+        zero_count(int): The count of values lower than or equal to zero.
+    """
+
+    RELATIVE_ACCURACY = 0.01
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    SLOT_SECONDS = 10
+    ZERO_FIELD = "z"
+
+    def __init__(self, buckets: dict[int, int] | None = None, zero_count: int = 0) -> None:
+        self.buckets = buckets or {}
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        """
+        Add a value to the sketch.
+
+        Args:
+            value(float): The value to add.
+            count(int): The number of occurrences of the value.
+        """
+        if value <= 0:
+            self.zero_count += count
+            return
+
+        index = math.ceil(math.log(value, self.GAMMA))
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        Merge another sketch into this sketch.
+
+        Args:
+            other(QuantileSketch): The sketch to merge.
+        """
+        self.zero_count += other.zero_count
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate a quantile (nearest rank) of the values of the sketch.
+
+        Args:
+            q(float): The quantile to estimate, between 0 and 1.
+
+        Returns:
+            float | None: The estimated quantile, None if the sketch is empty.
+        """
+        count = self.count
+        if count == 0:
+            return None
+
+        rank = max(math.ceil(q * count) - 1, 0)
+        cumulated = self.zero_count
+        if rank < cumulated:
+            return 0.0
+
+        for index in sorted(self.buckets):
+            cumulated += self.buckets[index]
+            if rank < cumulated:
+                return 2 * self.GAMMA**index / (self.GAMMA + 1)
+
+        return 2 * self.GAMMA ** max(self.buckets) / (self.GAMMA + 1)
+
+    def to_redis(self) -> dict[str, int]:
+        """
+        Get the hash fields of the sketch to increment in Redis.
+
+        Returns:
+            dict[str, int]: The counts by field.
+        """
+        fields = {str(index): count for index, count in self.buckets.items()}
+        if self.zero_count:
+            fields[self.ZERO_FIELD] = self.zero_count
+
+        return fields
+
+    @classmethod
+    def from_redis(cls, hashes: list[dict]) -> "QuantileSketch":
+        """
+        Merge the hashes of the time slots of a sketch read from Redis.
+
+        Args:
+            hashes(list[dict]): The results of `HGETALL` on the slot keys, missing slots are empty.
+
+        Returns:
+            QuantileSketch: The merged sketch.
+        """
+        sketch = cls()
+        for fields in hashes:
+            for field, count in (fields or {}).items():
+                field = field.decode() if isinstance(field, bytes) else field
+                if field == cls.ZERO_FIELD:
+                    sketch.zero_count += int(count)
+                else:
+                    sketch.buckets[int(field)] = sketch.buckets.get(int(field), 0) + int(count)
+
+        return sketch
+
+    @classmethod
+    def from_samples(cls, samples: list[tuple[str, int, float]]) -> dict[str, "QuantileSketch"]:
+        """
+        Build the sketches of time series samples, by Redis sketch key.
+
+        Args:
+            samples(list[tuple[str, int, float]]): The samples, as (time series key, timestamp in milliseconds, value) tuples.
+
+        Returns:
+            dict[str, QuantileSketch]: The sketches by Redis key.
+        """
+        sketches = {}
+        for key, timestamp, value in samples:
+            sketch_key = cls.get_key(timeserie_key=key, timestamp=timestamp)
+            sketches.setdefault(sketch_key, cls()).add(value=value)
+
+        return sketches
+
+    @classmethod
+    def get_key(cls, timeserie_key: str, timestamp: int) -> str:
+        """
+        Get the Redis key of the sketch slot of a time series sample.
+
+        Args:
+            timeserie_key(str): The time series key (`<prefix>:<metric>:<provider_id>`).
+            timestamp(int): The timestamp of the sample in milliseconds.
+
+        Returns:
+            str: The Redis key of the sketch slot.
+        """
+        name = timeserie_key.removeprefix(f"{PREFIX__REDIS_METRIC_TIMESERIE}:")
+        return f"{PREFIX__REDIS_METRIC_SKETCH}:{name}:{timestamp // 1000 // cls.SLOT_SECONDS}"
+
+    @classmethod
+    def get_window_keys(cls, metric: str, provider_id: int, timestamp: int) -> list[str]:
+        """
+        Get the Redis keys of the sketch slots covering the retention window.
+
+        Args:
+            metric(str): The metric name.
+            provider_id(int): The provider ID.
+            timestamp(int): The end of the window in milliseconds.
+
+        Returns:
+            list[str]: The Redis keys of the sketch slots.
+        """
+        last_slot = timestamp // 1000 // cls.SLOT_SECONDS
+        first_slot = (timestamp // 1000 - REDIS__TIMESERIE_RETENTION_SECONDS) // cls.SLOT_SECONDS
+        return [f"{PREFIX__REDIS_METRIC_SKETCH}:{metric}:{provider_id}:{slot}" for slot in range(first_slot, last_slot + 1)]
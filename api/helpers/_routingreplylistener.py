@@ -0,0 +1,99 @@
+import asyncio
+import logging
+
+from redis.asyncio import ConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+
+from api.utils.variables import PREFIX__REDIS_ROUTING_REPLY
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingReplyListener:
+    """
+    Dispatcher of the results of the routing tasks to the requests awaiting them. A routing task pushes its result on the reply key of
+    the request and publishes the task ID on a Redis channel (see `send_routing_reply`); each API worker listens to the channel with a
+    single connection and wakes up the request awaiting this task, which pops its result with a non-blocking LPOP. Queued requests do
+    not hold a connection of the redis pool while they wait, whatever the length of the routing queue.
+    """
+
+    CHANNEL = f"{PREFIX__REDIS_ROUTING_REPLY}:replies"
+    POLL_INTERVAL = 5  # seconds between two checks of the reply key if a notification is missed (subscription down)
+
+    def __init__(self) -> None:
+        self.waiters: dict[str, asyncio.Future] = {}
+
+    async def wait(self, task_id: str, key: str, timeout: float, redis_client: AsyncRedis) -> bytes | str | None:
+        """
+        Wait for the result of a routing task, or until the timeout.
+
+        Args:
+            task_id(str): The routing task ID.
+            key(str): The reply key on which the task pushes its result.
+            timeout(float): Maximum number of seconds to wait.
+            redis_client(AsyncRedis): The redis client used to pop the result.
+
+        Returns:
+            bytes | str | None: The result of the routing task, None on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while True:
+            # the waiter is registered before the reply key is checked, so a result published in between is not missed
+            future = loop.create_future()
+            self.waiters[task_id] = future
+            try:
+                reply = await redis_client.lpop(key)
+                if reply is not None:
+                    return reply
+
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    return None
+
+                try:
+                    await asyncio.wait_for(future, timeout=min(remaining, self.POLL_INTERVAL))
+                except TimeoutError:
+                    pass
+            finally:
+                if self.waiters.get(task_id) is future:
+                    del self.waiters[task_id]
+
+    def wake(self, task_id: str | None = None) -> None:
+        """
+        Wake up the request awaiting the routing task, or all the waiting requests.
+
+        Args:
+            task_id(str | None): The routing task whose result has been published, None to wake up all the waiting requests.
+        """
+        futures = list(self.waiters.values()) if task_id is None else [self.waiters.get(task_id)]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def run(self, redis_pool: ConnectionPool) -> None:
+        """
+        Listen to the routing results published by the routing tasks until cancelled. Run as a background task in lifespan.
+
+        Args:
+            redis_pool(ConnectionPool): The redis connection pool.
+        """
+        redis_client = AsyncRedis(connection_pool=redis_pool)
+        try:
+            while True:
+                try:
+                    async with redis_client.pubsub() as pubsub:
+                        await pubsub.subscribe(self.CHANNEL)
+                        # results published while the subscription was down are checked by the waiting requests
+                        self.wake()
+                        async for message in pubsub.listen():
+                            if message["type"] == "message":
+                                data = message["data"]
+                                self.wake(task_id=data.decode() if isinstance(data, bytes) else data)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.error("Routing reply listener subscription failed, retrying.", exc_info=True)
+                    await asyncio.sleep(1)
+        finally:
+            await redis_client.aclose()
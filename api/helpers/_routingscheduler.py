@@ -0,0 +1,159 @@
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers._admissioncontroller import AdmissionController
+from api.utils.variables import PREFIX__REDIS_ROUTING_SCHEDULER
+
+
+class RoutingScheduler:
+    """
+    Queue of the requests waiting for a provider slot of a router, stored in a Redis sorted set by router and shared by all the API
+    workers. Requests are ordered by user priority, then by start-time fair queuing between flows (users or organizations) of the
+    same priority, and only the request at the head of the queue may acquire a slot. When the head leaves the queue (admitted, timed
+    out or cancelled) and requests are still waiting, the new head is published on the channel of the `AdmissionController`, so only
+    the worker of this request wakes it up at once.
+
+    Fair queuing: each request gets a virtual start time, the maximum of the virtual time of the router (start time of the last
+    admitted request) and of the virtual finish time of the previous request of its flow, and the finish time of the flow is
+    increased by `1 / weight`. A flow submitting many requests therefore waits behind the requests of lighter flows instead of
+    starving them, and a flow with a weight of 2 is admitted twice as often as a flow with a weight of 1. The fair queuing state of a
+    router is reset when its queue is empty.
+
+    Each request is a member `<deadline>:<ticket>` of the sorted set: the members of crashed API workers are removed once their
+    deadline (arrival time plus the maximum waiting time) is passed, so they cannot block the queue. Members with the same score are
+    sorted by deadline, so by arrival time.
+    """
+
+    ENQUEUE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[2])
+end
+local virtual = tonumber(redis.call('HGET', KEYS[2], '_virtual') or '0')
+local finish = tonumber(redis.call('HGET', KEYS[2], ARGV[4]) or '0')
+local start = math.max(virtual, finish)
+redis.call('HSET', KEYS[2], ARGV[4], tostring(start + 1 / tonumber(ARGV[5])))
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+
+local member = string.format('%d:%s', now + tonumber(ARGV[2]), ARGV[3])
+redis.call('ZADD', KEYS[1], string.format('%.17g', start - tonumber(ARGV[1]) * 1e9), member)
+return {member, tostring(start)}
+"""
+
+    HEAD_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+
+while true do
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if not head then
+        return 0
+    end
+    local deadline = tonumber(string.match(head, '^(%d+):'))
+    if deadline ~= nil and deadline < now then
+        redis.call('ZREM', KEYS[1], head)
+    else
+        return head == ARGV[1] and 1 or 0
+    end
+end
+"""
+
+    DEQUEUE_SCRIPT = """
+local rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+if rank == false then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if ARGV[2] ~= '' then
+    local virtual = tonumber(redis.call('HGET', KEYS[2], '_virtual') or '0')
+    redis.call('HSET', KEYS[2], '_virtual', tostring(math.max(virtual, tonumber(ARGV[2]))))
+end
+if rank > 0 then
+    return 0
+end
+
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+while true do
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if not head then
+        return 0
+    end
+    local deadline = tonumber(string.match(head, '^(%d+):'))
+    if deadline ~= nil and deadline < now then
+        redis.call('ZREM', KEYS[1], head)
+    else
+        redis.call('PUBLISH', ARGV[3], ARGV[4] .. head)
+        return 1
+    end
+end
+"""
+
+    @staticmethod
+    def get_keys(router_id: int) -> list[str]:
+        """
+        Get the Redis keys of the queue of a router and of its fair queuing state.
+
+        Args:
+            router_id(int): The router ID.
+
+        Returns:
+            list[str]: The Redis keys.
+        """
+        key = f"{PREFIX__REDIS_ROUTING_SCHEDULER}:{router_id}"
+        return [key, f"{key}:fq"]
+
+    @classmethod
+    async def enqueue(
+        cls, redis_client: AsyncRedis, router_id: int, ticket: str, priority: int, timeout: float, flow: str, weight: float = 1.0
+    ) -> tuple[str, float]:
+        """
+        Add a request to the queue of a router.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+            router_id(int): The router ID.
+            ticket(str): A unique ID of the request.
+            priority(int): The priority of the request, higher priority requests are admitted first.
+            timeout(float): Maximum number of seconds the request waits in the queue.
+            flow(str): The fair queuing flow of the request (user or organization).
+            weight(float): The fair queuing weight of the flow.
+
+        Returns:
+            tuple[str, float]: The member of the request in the queue and its virtual start time.
+        """
+        keys = cls.get_keys(router_id=router_id)
+        member, start = await redis_client.eval(cls.ENQUEUE_SCRIPT, 2, *keys, priority, int(timeout * 1000), ticket, flow, weight)
+        member = member.decode() if isinstance(member, bytes) else member
+        return member, float(start)
+
+    @classmethod
+    async def is_head(cls, redis_client: AsyncRedis, router_id: int, member: str) -> bool:
+        """
+        Check if a request is at the head of the queue of a router, after removing the expired requests from the head.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+            router_id(int): The router ID.
+            member(str): The member of the request in the queue.
+
+        Returns:
+            bool: True if the request is at the head of the queue.
+        """
+        return bool(await redis_client.eval(cls.HEAD_SCRIPT, 1, cls.get_keys(router_id=router_id)[0], member))
+
+    @classmethod
+    async def dequeue(cls, redis_client: AsyncRedis, router_id: int, member: str, start: float | None = None) -> None:
+        """
+        Remove a request from the queue of a router and, if it was the head of the queue, wake up the next request of the queue.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+            router_id(int): The router ID.
+            member(str): The member of the request in the queue.
+            start(float | None): The virtual start time of the request if admitted, to advance the virtual time of the router.
+        """
+        keys = cls.get_keys(router_id=router_id)
+        args = [member, "" if start is None else start, AdmissionController.CHANNEL, AdmissionController.MEMBER_PREFIX]
+        await redis_client.eval(cls.DEQUEUE_SCRIPT, 2, *keys, *args)
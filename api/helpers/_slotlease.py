@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from uuid import uuid4
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers._admissioncontroller import AdmissionController
+from api.schemas.core.models import Metric
+from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+
+logger = logging.getLogger(__name__)
+
+
+class SlotLease:
+    """
+    Lease of an inflight request slot of a provider. The leases of a provider are stored in a Redis sorted set scored by their
+    expiration time, and the inflight requests gauge read by the QoS policy and the load balancing strategies is the number of
+    unexpired leases. The QoS limit check and the acquisition run in a single Lua script, so concurrent requests cannot exceed the
+    limit, and the lease of a request of a crashed API worker expires after `ttl` seconds instead of leaking an inflight request.
+
+    Each lease also holds the estimated tokens of its request (prompt tokens plus maximum completion tokens), stored in a Redis hash
+    by lease, and the inflight tokens gauge is the sum of the tokens of the unexpired leases. A token limit refuses a request if the
+    inflight tokens plus the tokens of the request exceed it, unless the provider has no inflight tokens, so a request larger than
+    the limit is not refused forever.
+
+    Args:
+        provider_id(int): The provider ID.
+        lease_id(str): The lease ID, member of the sorted set of the leases of the provider.
+        ttl(int): Number of seconds before the lease expires if not released or renewed.
+    """
+
+    # purge of the expired leases, shared by the scripts (KEYS: inflight gauge, leases, inflight tokens gauge, tokens of the leases)
+    _PURGE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    redis.call('HDEL', KEYS[4], unpack(expired))
+end
+local inflight = redis.call('ZCARD', KEYS[2])
+local inflight_tokens = 0
+for _, tokens in ipairs(redis.call('HVALS', KEYS[4])) do
+    inflight_tokens = inflight_tokens + tonumber(tokens)
+end
+"""
+
+    ACQUIRE_SCRIPT = (
+        _PURGE_SCRIPT
+        + """
+local ttl = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[4])
+local refused = ARGV[1] ~= '' and inflight > tonumber(ARGV[1])
+refused = refused or (ARGV[5] ~= '' and inflight_tokens > 0 and inflight_tokens + tokens > tonumber(ARGV[5]))
+if not refused then
+    redis.call('ZADD', KEYS[2], now + ttl, ARGV[3])
+    redis.call('HSET', KEYS[4], ARGV[3], tokens)
+    inflight = inflight + 1
+    inflight_tokens = inflight_tokens + tokens
+end
+
+for i = 1, 4 do
+    redis.call('PEXPIRE', KEYS[i], ttl)
+end
+redis.call('SET', KEYS[1], inflight, 'PX', ttl)
+redis.call('SET', KEYS[3], inflight_tokens, 'PX', ttl)
+return refused and -1 or inflight
+"""
+    )
+
+    RELEASE_SCRIPT = (
+        """
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[4], ARGV[1])
+"""
+        + _PURGE_SCRIPT
+        + """
+redis.call('SET', KEYS[1], inflight, 'PX', ARGV[2])
+redis.call('SET', KEYS[3], inflight_tokens, 'PX', ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return inflight
+"""
+    )
+
+    RENEW_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local ttl = tonumber(ARGV[2])
+
+if redis.call('ZADD', KEYS[2], 'XX', 'CH', now + ttl, ARGV[1]) == 1 then
+    for i = 1, 4 do
+        redis.call('PEXPIRE', KEYS[i], ttl)
+    end
+    return 1
+end
+return 0
+"""
+
+    def __init__(self, provider_id: int, lease_id: str, ttl: int) -> None:
+        self.provider_id = provider_id
+        self.lease_id = lease_id
+        self.ttl = ttl
+        self.renewed_at = time.monotonic()
+
+    @staticmethod
+    def get_keys(provider_id: int | str) -> list[str]:
+        """
+        Get the Redis keys of the inflight requests gauge, of the leases, of the inflight tokens gauge and of the tokens of the leases
+        of a provider.
+
+        Args:
+            provider_id(int | str): The provider ID.
+
+        Returns:
+            list[str]: The Redis keys.
+        """
+        gauge_key = f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT.value}:{provider_id}"
+        tokens_key = f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT_TOKENS.value}:{provider_id}"
+        return [gauge_key, f"{gauge_key}:leases", tokens_key, f"{tokens_key}:leases"]
+
+    @classmethod
+    def _get_acquire_args(cls, provider_id: int, ttl: int, limit: float | None, tokens: int, token_limit: float | None) -> tuple[list, str]:
+        lease_id = uuid4().hex
+        limits = ["" if limit is None else limit, "" if token_limit is None else token_limit]
+        args = [cls.ACQUIRE_SCRIPT, 4, *cls.get_keys(provider_id=provider_id), limits[0], ttl * 1000, lease_id, tokens, limits[1]]
+        return args, lease_id
+
+    @classmethod
+    async def acquire(cls, redis_client: AsyncRedis, provider_id: int, ttl: int, limit: float | None = None, tokens: int = 0, token_limit: float | None = None) -> "SlotLease | None":  # fmt: off
+        """
+        Acquire a slot of a provider if the number of inflight requests and the inflight tokens of the provider do not exceed the limits.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+            provider_id(int): The provider ID.
+            ttl(int): Number of seconds before the lease expires if not released or renewed.
+            limit(float | None): The maximum number of other inflight requests, None for no limit.
+            tokens(int): The estimated tokens of the request (prompt tokens plus maximum completion tokens).
+            token_limit(float | None): The maximum number of inflight tokens including the request, None for no limit.
+
+        Returns:
+            SlotLease | None: The lease, None if a limit is exceeded.
+        """
+        args, lease_id = cls._get_acquire_args(provider_id=provider_id, ttl=ttl, limit=limit, tokens=tokens, token_limit=token_limit)
+        inflight = await redis_client.eval(*args)
+        return cls(provider_id=provider_id, lease_id=lease_id, ttl=ttl) if int(inflight) >= 0 else None
+
+    @classmethod
+    def acquire_sync(cls, redis_client: Redis, provider_id: int, ttl: int, limit: float | None = None, tokens: int = 0, token_limit: float | None = None) -> "SlotLease | None":  # fmt: off
+        """
+        Synchronous version of `acquire`, for the Celery routing tasks.
+        """
+        args, lease_id = cls._get_acquire_args(provider_id=provider_id, ttl=ttl, limit=limit, tokens=tokens, token_limit=token_limit)
+        inflight = redis_client.eval(*args)
+        return cls(provider_id=provider_id, lease_id=lease_id, ttl=ttl) if int(inflight) >= 0 else None
+
+    async def release(self, redis_client: AsyncRedis) -> None:
+        """
+        Release the slot and publish the release, to wake up the requests waiting for a slot of the provider (see `AdmissionController`).
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+        """
+        keys = self.get_keys(provider_id=self.provider_id)
+        await redis_client.eval(self.RELEASE_SCRIPT, 4, *keys, self.lease_id, self.ttl * 1000, AdmissionController.CHANNEL, self.provider_id)
+
+    def release_sync(self, redis_client: Redis) -> None:
+        """
+        Synchronous version of `release`, for the Celery routing tasks.
+        """
+        keys = self.get_keys(provider_id=self.provider_id)
+        redis_client.eval(self.RELEASE_SCRIPT, 4, *keys, self.lease_id, self.ttl * 1000, AdmissionController.CHANNEL, self.provider_id)
+
+    async def renew(self, redis_client: AsyncRedis) -> None:
+        """
+        Extend the expiration of the lease by `ttl` seconds if more than half of the `ttl` has elapsed since the last renewal, to keep
+        the slot of long requests such as streams.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+        """
+        if time.monotonic() - self.renewed_at < self.ttl / 2:
+            return
+
+        self.renewed_at = time.monotonic()
+        keys = self.get_keys(provider_id=self.provider_id)
+        await redis_client.eval(self.RENEW_SCRIPT, 4, *keys, self.lease_id, self.ttl * 1000)
+
+    async def keep_alive(self, redis_client: AsyncRedis) -> None:
+        """
+        Renew the lease every half `ttl` until cancelled, to keep the slot of requests without progress to renew it on, such as
+        non-streamed requests longer than the `ttl`. Run as a background task during the request.
+
+        Args:
+            redis_client(AsyncRedis): The redis client to use.
+        """
+        while True:
+            await asyncio.sleep(self.ttl / 2)
+            try:
+                await self.renew(redis_client=redis_client)
+            except Exception:
+                logger.warning("Unable to renew the provider slot lease", exc_info=True)
@@ -0,0 +1,167 @@
+from json import JSONDecodeError, loads
+import logging
+import time
+
+from api.helpers._usagetokenizer import StreamTokenCounter
+
+logger = logging.getLogger(__name__)
+
+
+class StreamProcessor:
+    """
+    Incremental parser of a server-sent events (SSE) stream from a model provider. Raw bytes are fed as they are read from the
+    connection, events split across reads are reassembled, and only the state needed to build the final usage chunk is kept (time
+    to first token, response ID, last chunk, upstream usage), so the memory does not grow with the transcript. Completion deltas
+    are passed to the token counter as they arrive. The `\r\n` and `\r` line endings allowed by SSE are normalised to `\n`, so the
+    events of any provider are split and forwarded with `\n\n` separators.
+
+    Args:
+        token_counter(StreamTokenCounter | None): The counter of completion tokens, None to skip the count.
+        drop_usage(bool): Whether the usage chunk of the provider (chunk without choices) is not forwarded, when the usage has been
+            requested by the API and not by the client.
+    """
+
+    EVENT_SEPARATOR = b"\n\n"
+    DONE_DATA = "[DONE]"
+
+    def __init__(self, token_counter: StreamTokenCounter | None = None, drop_usage: bool = False) -> None:
+        self.token_counter = token_counter
+        self.drop_usage = drop_usage
+        self.start_time = time.perf_counter()
+        self.first_token_time: float | None = None
+        self.id: str | None = None
+        self.last_chunk: dict | None = None
+        self.usage: dict | None = None  # usage reported by the provider (eg. `stream_options.include_usage`)
+        self.done = False
+
+        self._tail = b""
+        self._carriage_return = False  # whether the last read ended with `\r`, which may be followed by `\n` in the next read
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        Feed raw bytes read from the provider response and return the complete events to forward to the client. Incomplete event
+        at the end of the data is kept until the next read. Once the `[DONE]` event is reached, `done` is set and the `[DONE]` event
+        and anything after it are not returned, so a chunk can be inserted before the end of the stream.
+
+        Args:
+            data(bytes): The raw bytes read from the provider response.
+
+        Returns:
+            bytes: The complete events to forward, with their separators.
+        """
+        if self.done:
+            return b""
+
+        if self._carriage_return:
+            data = b"\r" + data
+        self._carriage_return = data.endswith(b"\r")
+        if self._carriage_return:
+            data = data[:-1]
+        self._tail += data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        end = self._tail.rfind(self.EVENT_SEPARATOR)
+        if end == -1:
+            return b""
+
+        end += len(self.EVENT_SEPARATOR)
+        events, self._tail = self._tail[:end], self._tail[end:]
+
+        forwarded = []
+        position = 0
+        while position < len(events):
+            separator = events.find(self.EVENT_SEPARATOR, position) + len(self.EVENT_SEPARATOR)
+            event = events[position:separator]
+            done, forward = self._process_event(event=event)
+            if done:
+                self.done = True
+                self._tail = b""
+                break
+            if forward:
+                forwarded.append(event)
+            position = separator
+
+        return b"".join(forwarded)
+
+    def flush(self) -> bytes:
+        """
+        Process the remaining bytes when the provider closes the stream without a final event separator.
+
+        Returns:
+            bytes: The remaining bytes to forward with a final event separator, so a chunk can be inserted after them, empty if the stream
+                ended with `[DONE]`.
+        """
+        tail, self._tail = self._tail, b""
+        self._carriage_return = False
+        if self.done or not tail.strip():
+            return b""
+
+        done, forward = self._process_event(event=tail)
+        if done:
+            self.done = True
+            return b""
+        if not forward:
+            return b""
+
+        return tail.rstrip(b"\r\n") + self.EVENT_SEPARATOR
+
+    def get_ttft(self) -> int | None:
+        """
+        Get the time to first token in milliseconds.
+
+        Returns:
+            int | None: The time to first token in milliseconds, None if no chunk has been received.
+        """
+        if self.first_token_time is None:
+            return None
+
+        return int((self.first_token_time - self.start_time) * 1000)
+
+    def finish(self) -> None:
+        """
+        Mark the end of the stream. If no token content has been detected, the time to first token falls back to the end of the stream.
+        """
+        if self.first_token_time is None and self.last_chunk is not None:
+            self.first_token_time = time.perf_counter()
+
+    def _process_event(self, event: bytes) -> tuple[bool, bool]:
+        """
+        Parse a single SSE event and update the stream state.
+
+        Args:
+            event(bytes): The raw event, with or without trailing separator.
+
+        Returns:
+            tuple[bool, bool]: Whether the event is the `[DONE]` event, and whether the event is forwarded to the client.
+        """
+        lines = [line.strip() for line in event.decode(encoding="utf-8", errors="replace").splitlines()]
+        data = "\n".join(line.removeprefix("data:").strip() for line in lines if line.startswith("data:"))
+        if not data:
+            return False, True
+
+        if data == self.DONE_DATA:
+            return True, False
+
+        try:
+            chunk = loads(data)
+        except JSONDecodeError as e:
+            logger.debug(f"Failed to decode JSON from streaming response ({e}) on the following chunk: {data}.")
+            return False, True
+
+        if not isinstance(chunk, dict):
+            return False, True
+
+        if self.id is None:
+            self.id = chunk.get("id")
+        self.last_chunk = chunk
+        if isinstance(chunk.get("usage"), dict):
+            self.usage = chunk["usage"]
+
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            content = delta.get("content")
+            if content and self.token_counter is not None:
+                self.token_counter.add(index=choice.get("index", 0), content=content)
+            if self.first_token_time is None and (content or delta.get("tool_calls")):
+                self.first_token_time = time.perf_counter()
+
+        return False, not (self.drop_usage and not chunk.get("choices") and isinstance(chunk.get("usage"), dict))
@@ -2,17 +2,92 @@ import logging
 
 import tiktoken
 
-from api.schemas.chat import ChatCompletion, ChatCompletionChunk
+from api.schemas.chat import ChatCompletion
 from api.schemas.core.configuration import Tokenizer
+from api.utils.context import request_context
 from api.utils.variables import ENDPOINT__CHAT_COMPLETIONS, ENDPOINT__EMBEDDINGS, ENDPOINT__OCR, ENDPOINT__RERANK, ENDPOINT__SEARCH
 
 logger = logging.getLogger(__name__)
 
 
+class StreamTokenCounter:
+    """
+    Count the completion tokens of a streaming response while the deltas pass through. The text of each choice is encoded by
+    segments cut before a space that follows a non-space character, which is a boundary of the tiktoken pre-tokenizer, so the
+    count matches the encoding of the whole text while only a short pending segment is kept in memory. A text without such a
+    boundary (e.g. CJK text, long URL) is cut anyway once `MAX_PENDING_SIZE` characters are pending, which may change the count by
+    one token at the cut.
+
+    A lazy counter only keeps the deltas and encodes them when the count is requested, for the streams whose usage is expected from
+    the provider: the text is encoded only if the provider does not report the usage.
+    """
+
+    SEGMENT_SIZE = 256  # minimum number of pending characters before encoding a segment
+    MAX_PENDING_SIZE = 4 * SEGMENT_SIZE  # maximum number of pending characters, encoded without boundary beyond
+
+    def __init__(self, tokenizer: tiktoken.Encoding, lazy: bool = False) -> None:
+        self.tokenizer = tokenizer
+        self.lazy = lazy
+        self.tokens = 0
+        self.pending: dict[int, list[str]] = {}  # deltas by choice, joined only when a segment is searched
+        self.pending_size: dict[int, int] = {}
+        self.next_split: dict[int, int] = {}  # pending size of the next search of a segment by choice
+
+    def add(self, index: int, content: str) -> None:
+        """
+        Add a delta content of a choice.
+
+        Args:
+            index(int): The choice index.
+            content(str): The delta content.
+        """
+        self.pending.setdefault(index, []).append(content)
+        size = self.pending_size[index] = self.pending_size.get(index, 0) + len(content)
+        if self.lazy or size < self.next_split.get(index, self.SEGMENT_SIZE):
+            return
+
+        text = "".join(self.pending[index])
+        split = self._find_split(text=text)
+        if split == 0 and size >= self.MAX_PENDING_SIZE:
+            split = size
+        if split > 0:
+            self.tokens += len(self.tokenizer.encode(text[:split]))
+            text = text[split:]
+
+        self.pending[index] = [text] if text else []
+        self.pending_size[index] = len(text)
+        # without boundary, the text is searched again once another segment is pending, so the deltas are not joined on each add
+        self.next_split[index] = self.SEGMENT_SIZE if split > 0 else min(len(text) + self.SEGMENT_SIZE, self.MAX_PENDING_SIZE)
+
+    def count(self) -> int:
+        """
+        Encode the pending segments and get the total number of completion tokens of all choices.
+
+        Returns:
+            int: The number of completion tokens.
+        """
+        for pending in self.pending.values():
+            if pending:
+                self.tokens += len(self.tokenizer.encode("".join(pending)))
+        self.pending, self.pending_size, self.next_split = {}, {}, {}
+
+        return self.tokens
+
+    @staticmethod
+    def _find_split(text: str) -> int:
+        split = text.rfind(" ")
+        while split > 0 and text[split - 1].isspace():
+            split = text.rfind(" ", 0, split)
+
+        return max(split, 0)
+
+
 class UsageTokenizer:
     USAGE_ENDPOINTS = [ENDPOINT__CHAT_COMPLETIONS, ENDPOINT__EMBEDDINGS, ENDPOINT__OCR, ENDPOINT__RERANK, ENDPOINT__SEARCH]
 
-    def __init__(self, tokenizer: Tokenizer):
+    def __init__(self, tokenizer: Tokenizer, sampling_rate: float = 0.0):
+        self.sampling_rate = sampling_rate  # ratio of the upstream usages checked with the tokenizer (routers with sampling usage source)
+
         if tokenizer == Tokenizer.TIKTOKEN_O200K_BASE:
             self.tokenizer = tiktoken.get_encoding("o200k_base")
         elif tokenizer == Tokenizer.TIKTOKEN_P50K_BASE:
@@ -27,55 +102,70 @@ class UsageTokenizer:
             self.tokenizer = tiktoken.get_encoding("gpt2")
 
     def get_prompt_tokens(self, endpoint: str, body: dict) -> int:
+        """
+        Get the prompt tokens for the given endpoint and body. The counts are memoized in the request context by endpoint and prompt
+        texts, so the prompt of a request is tokenized once for the rate limits, the routing and the usage, whatever the copy of the
+        body. A prompt modified during the request (e.g. with search results) is tokenized again.
+
+        Args:
+            endpoint (str): The endpoint to get the prompt tokens for.
+            body (dict): The body of the request.
+        """
         try:
-            if endpoint == ENDPOINT__CHAT_COMPLETIONS:
-                contents = [message.get("content") for message in body["messages"] if message.get("content")]
-                prompt_tokens = sum([len(self.tokenizer.encode(content)) for content in contents])
+            texts = self._get_prompt_texts(endpoint=endpoint, body=body)
+            key = (endpoint, *texts)
+            memo = request_context.get().prompt_tokens
+            if memo is None:  # outside of a request
+                memo = {}
+
+            if key not in memo:
+                memo[key] = sum([len(self.tokenizer.encode(text)) for text in texts])
+            prompt_tokens = memo[key]
+        except Exception:  # to avoid request format error before schema validation
+            prompt_tokens = 0
 
-            elif endpoint == ENDPOINT__EMBEDDINGS:
-                prompt_tokens = sum([len(self.tokenizer.encode(str(input))) for input in body.get("input", [])])
+        return prompt_tokens
 
-            elif endpoint == ENDPOINT__RERANK:
-                prompt_tokens = sum([len(self.tokenizer.encode(str(input))) for input in body.get("input", [])])
+    @staticmethod
+    def _get_prompt_texts(endpoint: str, body: dict) -> list[str]:
+        if endpoint == ENDPOINT__CHAT_COMPLETIONS:
+            return [message.get("content") for message in body["messages"] if message.get("content")]
 
-            elif endpoint == ENDPOINT__SEARCH:
-                prompt_tokens = len(self.tokenizer.encode(str(body.get("prompt", ""))))
+        elif endpoint in [ENDPOINT__EMBEDDINGS, ENDPOINT__RERANK]:
+            return [str(input) for input in body.get("input", [])]
 
-            elif endpoint == ENDPOINT__OCR:
-                prompt_tokens = len(self.tokenizer.encode(str(body.get("prompt", ""))))
-            else:  # for other endpoints, we don't count the tokens
-                prompt_tokens = 0
-        except Exception:  # to avoid request format error before schema validation
-            prompt_tokens = 0
+        elif endpoint in [ENDPOINT__SEARCH, ENDPOINT__OCR]:
+            return [str(body.get("prompt", ""))]
 
-        return prompt_tokens
+        # for other endpoints, we don't count the tokens
+        return []
+
+    def get_stream_token_counter(self, lazy: bool = False) -> StreamTokenCounter:
+        """
+        Get a counter to count the completion tokens of a streaming response incrementally.
+
+        Args:
+            lazy(bool): Whether the deltas are encoded only when the count is requested (see `StreamTokenCounter`).
+
+        Returns:
+            StreamTokenCounter: A new counter, one per stream.
+        """
+        return StreamTokenCounter(tokenizer=self.tokenizer, lazy=lazy)
 
-    def get_completion_tokens(self, endpoint: str, response_data: dict | list[dict], stream: bool = False) -> int:
+    def get_completion_tokens(self, endpoint: str, response_data: dict | StreamTokenCounter, stream: bool = False) -> int:
         """
         Get the completion tokens for the given endpoint and body.
 
         Args:
             endpoint (str): The endpoint to get the completion tokens for.
-            response_data (dict | list[dict]): The response data of the request (must be a ChatCompletion or a list of ChatCompletionChunk).
+            response_data (dict | StreamTokenCounter): The response data of the request (must be a ChatCompletion), or the counter fed during the stream if stream.
             stream (bool): Whether the request is a stream.
         """
         completion_tokens = 0
 
         if endpoint == ENDPOINT__CHAT_COMPLETIONS:
             if stream:
-                contents = dict()
-                for chunk in response_data:
-                    chunk = ChatCompletionChunk(**chunk)
-                    for choice in chunk.choices:
-                        index = choice.index
-                        delta = choice.delta
-                        if index not in contents:
-                            contents[index] = ""
-                        content = delta.content
-                        if content:
-                            contents[index] += content
-
-                completion_tokens = sum([len(self.tokenizer.encode(contents[index])) for index in contents.keys()])
+                completion_tokens = response_data.count() if response_data is not None else 0
 
             else:
                 response = ChatCompletion(**response_data)
@@ -1,5 +1,15 @@
 from ._baseloadbalancingstrategy import BaseLoadBalancingStrategy
 from ._leastbusyloadbalancingstrategy import LeastBusyLoadBalancingStrategy
+from ._leastloadedloadbalancingstrategy import LeastLoadedLoadBalancingStrategy
+from ._peakewmaloadbalancingstrategy import PeakEwmaLoadBalancingStrategy
+from ._poweroftwoloadbalancingstrategy import PowerOfTwoLoadBalancingStrategy
 from ._shuffleloadbalancingstrategy import ShuffleLoadBalancingStrategy
 
-__all__ = ["BaseLoadBalancingStrategy", "LeastBusyLoadBalancingStrategy", "ShuffleLoadBalancingStrategy"]
+__all__ = [
+    "BaseLoadBalancingStrategy",
+    "LeastBusyLoadBalancingStrategy",
+    "LeastLoadedLoadBalancingStrategy",
+    "PeakEwmaLoadBalancingStrategy",
+    "PowerOfTwoLoadBalancingStrategy",
+    "ShuffleLoadBalancingStrategy",
+]
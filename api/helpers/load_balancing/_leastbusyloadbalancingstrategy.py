@@ -1,15 +1,14 @@
-from datetime import datetime, timedelta
 import logging
-import math
 import random
+import time
 
 from redis import Redis
 from redis.asyncio import Redis as AsyncRedis
 
+from api.helpers._quantilesketch import QuantileSketch
 from api.helpers.load_balancing import BaseLoadBalancingStrategy
 from api.schemas.core.models import Metric
 from api.utils.redis import safe_redis_reset
-from api.utils.variables import PREFIX__REDIS_METRIC_TIMESERIE, REDIS__TIMESERIE_RETENTION_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -34,59 +33,84 @@ class LeastBusyLoadBalancingStrategy(BaseLoadBalancingStrategy):
         self.percentile = 0.95
 
     def apply_sync_strategy(self, candidates: list[int]) -> tuple[int, float]:
-        scores = {}
-        for provider_id in candidates:
-            cutoff = datetime.now() - timedelta(seconds=REDIS__TIMESERIE_RETENTION_SECONDS)
-            key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{self.metric}:{provider_id}"  # currently only TTFT is supported
-            try:
-                result = self.redis_client.ts().range(key, from_time=int(cutoff.timestamp() * 1000) if cutoff else 0, to_time="+")
-                series = [(ts, val) for ts, val in result]
-
-            except Exception as e:
-                logger.error(f"Failed to fetch timeseries for {key}: {e}", exc_info=True)
-                self.redis_client.reset()
-                series = []
+        keys = self._get_keys(candidates=candidates)
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for provider_keys in keys.values():
+                for key in provider_keys:
+                    pipeline.hgetall(key)
+            results = pipeline.execute()
 
-            if not series:
-                scores[provider_id] = float("inf")
-                continue
+        except Exception as e:
+            logger.error(f"Failed to fetch quantile sketches of providers {candidates} ({self.metric.value}): {e}", exc_info=True)
+            self.redis_client.reset()
+            results = []
 
-            values = [v for _, v in series]
-            values.sort()
+        return self._select(keys=keys, results=results)
 
-            idx = math.ceil(self.percentile * len(values)) - 1
-            scores[provider_id] = values[idx]
-
-        min_value = min(scores.values())
-        candidates = [k for k, v in scores.items() if v == min_value]
+    async def apply_async_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        keys = self._get_keys(candidates=candidates)
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for provider_keys in keys.values():
+                for key in provider_keys:
+                    pipeline.hgetall(key)
+            results = await pipeline.execute()
+
+        except Exception as e:
+            logger.debug(f"Failed to fetch quantile sketches of providers {candidates} ({self.metric.value}): {e}", exc_info=True)
+            await safe_redis_reset(self.redis_client)
+            results = []
+
+        return self._select(keys=keys, results=results)
+
+    def _get_keys(self, candidates: list[int]) -> dict[int, list[str]]:
+        """
+        Get the keys of the sketch slots of the retention window of each candidate, read in a single pipeline for all the candidates.
 
-        return random.choice(candidates), min_value
+        Args:
+            candidates(list[int]): The provider IDs.
 
-    async def apply_async_strategy(self, candidates: list[int]) -> tuple[int, float]:
-        scores = {}
-        for provider_id in candidates:
-            cutoff = datetime.now() - timedelta(seconds=REDIS__TIMESERIE_RETENTION_SECONDS)
-            key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{self.metric}:{provider_id}"  # currently only TTFT is supported
-            try:
-                result = await self.redis_client.ts().range(key, from_time=int(cutoff.timestamp() * 1000) if cutoff else 0, to_time="+")
-                series = [(ts, val) for ts, val in result]
+        Returns:
+            dict[int, list[str]]: The sketch slot keys by provider ID.
+        """
+        timestamp = int(time.time() * 1000)
 
-            except Exception as e:
-                logger.debug(f"Failed to fetch timeseries for {key}: {e}", exc_info=True)
-                await safe_redis_reset(self.redis_client)
-                series = []
+        return {provider_id: QuantileSketch.get_window_keys(metric=self.metric.value, provider_id=provider_id, timestamp=timestamp) for provider_id in candidates}  # fmt: off
 
-            if not series:
-                scores[provider_id] = float("inf")
-                continue
+    def _select(self, keys: dict[int, list[str]], results: list[dict]) -> tuple[int, float]:
+        """
+        Select the provider with the lowest score, randomly between ties.
 
-            values = [v for _, v in series]
-            values.sort()
+        Args:
+            keys(dict[int, list[str]]): The sketch slot keys by provider ID, in pipeline order.
+            results(list[dict]): The pipeline results, empty if the sketches could not be fetched.
 
-            idx = math.ceil(self.percentile * len(values)) - 1
-            scores[provider_id] = values[idx]
+        Returns:
+            tuple[int, float]: The chosen provider ID and its score.
+        """
+        scores = {}
+        position = 0
+        for provider_id, provider_keys in keys.items():
+            hashes = results[position : position + len(provider_keys)]
+            position += len(provider_keys)
+            scores[provider_id] = self._get_score(sketch=QuantileSketch.from_redis(hashes=hashes))
 
         min_value = min(scores.values())
         candidates = [k for k, v in scores.items() if v == min_value]
 
         return random.choice(candidates), min_value
+
+    def _get_score(self, sketch: QuantileSketch) -> float:
+        """
+        Get the score of a provider from the sketch of its metric over the retention window, infinite if there is no sample.
+
+        Args:
+            sketch(QuantileSketch): The sketch of the provider metric.
+
+        Returns:
+            float: The percentile of the metric.
+        """
+        score = sketch.quantile(q=self.percentile)
+
+        return float("inf") if score is None else score
@@ -0,0 +1,78 @@
+import logging
+import random
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers.load_balancing import BaseLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils.redis import safe_redis_reset
+from api.utils.variables import PREFIX__REDIS_METRIC_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+class LeastLoadedLoadBalancingStrategy(BaseLoadBalancingStrategy):
+    def __init__(self, redis_client: AsyncRedis | Redis) -> None:
+        """
+        Least loaded strategy: choose the provider with the fewest requests waiting in its own queue, then with the lowest KV cache
+        usage, as scraped from the provider metrics endpoint (see `ProviderMetricsScraper`). Unlike the gateway side metrics, the
+        queue of the provider includes the requests of the other clients of the provider and the KV cache pressure is seen before
+        the time to first token degrades.
+
+        Args:
+            redis_client (AsyncRedis | Redis): Redis client instance, required to read the scraped provider metrics
+        """
+        self.redis_client = redis_client
+        self.fields = [Metric.WAITING.value, Metric.KV_CACHE.value]
+
+    def apply_sync_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for provider_id in candidates:
+                pipeline.hmget(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", self.fields)
+            results = pipeline.execute()
+        except Exception as e:
+            logger.error(f"Failed to fetch backend metrics of providers {candidates}: {e}", exc_info=True)
+            self.redis_client.reset()
+            results = []
+
+        return self._select(candidates=candidates, results=results)
+
+    async def apply_async_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for provider_id in candidates:
+                pipeline.hmget(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", self.fields)
+            results = await pipeline.execute()
+        except Exception as e:
+            logger.debug(f"Failed to fetch backend metrics of providers {candidates}: {e}", exc_info=True)
+            await safe_redis_reset(self.redis_client)
+            results = []
+
+        return self._select(candidates=candidates, results=results)
+
+    def _select(self, candidates: list[int], results: list) -> tuple[int, float]:
+        """
+        Select the provider with the lowest score (requests waiting plus KV cache usage ratio), randomly between ties. Providers
+        without scraped metrics are given the mean score of the others.
+
+        Args:
+            candidates(list[int]): The provider IDs.
+            results(list): The backend metrics (waiting, KV cache usage) by candidate, empty if they could not be fetched.
+
+        Returns:
+            tuple[int, float]: The chosen provider ID and its score.
+        """
+        scores = {}
+        for provider_id, (waiting, kv_cache) in zip(candidates, results):
+            if waiting is not None or kv_cache is not None:
+                scores[provider_id] = float(waiting or 0) + float(kv_cache or 0)
+
+        default = sum(scores.values()) / len(scores) if scores else 0.0
+        scores = {provider_id: scores.get(provider_id, default) for provider_id in candidates}
+
+        min_value = min(scores.values())
+        candidates = [k for k, v in scores.items() if v == min_value]
+
+        return random.choice(candidates), min_value
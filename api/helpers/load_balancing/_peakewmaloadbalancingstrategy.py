@@ -0,0 +1,95 @@
+import logging
+import random
+import time
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers._peakewma import PeakEwma
+from api.helpers.load_balancing import BaseLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils.redis import safe_redis_reset
+from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+
+logger = logging.getLogger(__name__)
+
+
+class PeakEwmaLoadBalancingStrategy(BaseLoadBalancingStrategy):
+    def __init__(self, redis_client: AsyncRedis | Redis) -> None:
+        """
+        Peak EWMA strategy: choose the provider with the lowest peak EWMA of its latency multiplied by its inflight requests plus one.
+        The peak EWMAs and the inflight gauges of all the candidates are read in a single pipeline, and the peak EWMAs are decayed
+        toward the mean of the known averages with the time elapsed since their last update.
+
+        Args:
+            redis_client (AsyncRedis | Redis): Redis client instance, required to read the peak EWMAs and the inflight gauges
+        """
+        self.redis_client = redis_client
+
+    def apply_sync_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            self._queue_reads(pipeline=pipeline, candidates=candidates)
+            results = pipeline.execute()
+        except Exception as e:
+            logger.error(f"Failed to fetch peak EWMAs of providers {candidates}: {e}", exc_info=True)
+            self.redis_client.reset()
+            results = []
+
+        return self._select(candidates=candidates, results=results)
+
+    async def apply_async_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            self._queue_reads(pipeline=pipeline, candidates=candidates)
+            results = await pipeline.execute()
+        except Exception as e:
+            logger.debug(f"Failed to fetch peak EWMAs of providers {candidates}: {e}", exc_info=True)
+            await safe_redis_reset(self.redis_client)
+            results = []
+
+        return self._select(candidates=candidates, results=results)
+
+    def _queue_reads(self, pipeline, candidates: list[int]) -> None:
+        for provider_id in candidates:
+            pipeline.hmget(PeakEwma.get_key(provider_id=provider_id), ["ewma", "timestamp", "half_life"])
+            pipeline.get(f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT.value}:{provider_id}")
+
+    def _select(self, candidates: list[int], results: list) -> tuple[int, float]:
+        """
+        Select the provider with the lowest score, randomly between ties. Providers without latency average (no request during the
+        retention window) are given the mean of the known averages, so they receive traffic again. The known averages decay toward
+        this mean with the time elapsed since their last update, so a provider avoided after a latency spike is tried again within a
+        few half-lives.
+
+        Args:
+            candidates(list[int]): The provider IDs.
+            results(list): The pipeline results (peak EWMA state, inflight gauge) by candidate, empty if they could not be fetched.
+
+        Returns:
+            tuple[int, float]: The chosen provider ID and its score.
+        """
+        if not results:
+            return random.choice(candidates), 0.0
+
+        states = {provider_id: results[2 * i] or [None, None, None] for i, provider_id in enumerate(candidates)}
+        inflights = {provider_id: max(int(results[2 * i + 1] or 0), 0) for i, provider_id in enumerate(candidates)}
+
+        known = [float(ewma) for ewma, _, _ in states.values() if ewma is not None]
+        default = sum(known) / len(known) if known else 1.0
+
+        now = time.time() * 1000
+        ewmas = {}
+        for provider_id, (ewma, timestamp, half_life) in states.items():
+            if ewma is None:
+                ewmas[provider_id] = None
+            elif timestamp is None or half_life is None:
+                ewmas[provider_id] = float(ewma)
+            else:
+                ewmas[provider_id] = PeakEwma.get_decayed(ewma=float(ewma), timestamp=float(timestamp), half_life=float(half_life), target=default, now=now)  # fmt: off
+
+        scores = {provider_id: (default if ewma is None else ewma) * (inflights[provider_id] + 1) for provider_id, ewma in ewmas.items()}
+        min_value = min(scores.values())
+        candidates = [k for k, v in scores.items() if v == min_value]
+
+        return random.choice(candidates), min_value
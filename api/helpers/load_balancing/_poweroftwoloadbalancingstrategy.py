@@ -0,0 +1,72 @@
+import logging
+import random
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from api.helpers.load_balancing import BaseLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils.redis import safe_redis_reset
+from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+
+logger = logging.getLogger(__name__)
+
+
+class PowerOfTwoLoadBalancingStrategy(BaseLoadBalancingStrategy):
+    def __init__(self, redis_client: AsyncRedis | Redis) -> None:
+        """
+        Power of two choices strategy: sample two providers at random and choose the one with the fewest inflight requests. The
+        inflight gauges are updated by the providers on each request, so the strategy reacts immediately to load bursts.
+
+        Args:
+            redis_client (AsyncRedis | Redis): Redis client instance, required to read the inflight gauges
+        """
+        self.redis_client = redis_client
+
+    def apply_sync_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        sampled = self._sample(candidates=candidates)
+        try:
+            values = self.redis_client.mget(self._get_keys(candidates=sampled))
+        except Exception as e:
+            logger.error(f"Failed to fetch inflight gauges of providers {sampled}: {e}", exc_info=True)
+            self.redis_client.reset()
+            values = []
+
+        return self._select(candidates=sampled, values=values)
+
+    async def apply_async_strategy(self, candidates: list[int]) -> tuple[int, float]:
+        sampled = self._sample(candidates=candidates)
+        try:
+            values = await self.redis_client.mget(self._get_keys(candidates=sampled))
+        except Exception as e:
+            logger.debug(f"Failed to fetch inflight gauges of providers {sampled}: {e}", exc_info=True)
+            await safe_redis_reset(self.redis_client)
+            values = []
+
+        return self._select(candidates=sampled, values=values)
+
+    def _sample(self, candidates: list[int]) -> list[int]:
+        return random.sample(candidates, k=min(2, len(candidates)))
+
+    def _get_keys(self, candidates: list[int]) -> list[str]:
+        return [f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT.value}:{provider_id}" for provider_id in candidates]
+
+    def _select(self, candidates: list[int], values: list) -> tuple[int, float]:
+        """
+        Select the sampled provider with the fewest inflight requests, randomly between ties. Missing gauges count as zero.
+
+        Args:
+            candidates(list[int]): The sampled provider IDs.
+            values(list): The inflight gauges of the sampled providers, empty if they could not be fetched.
+
+        Returns:
+            tuple[int, float]: The chosen provider ID and its inflight requests.
+        """
+        scores = {provider_id: float(value or 0) for provider_id, value in zip(candidates, values)}
+        if not scores:
+            return random.choice(candidates), 0.0
+
+        min_value = min(scores.values())
+        candidates = [k for k, v in scores.items() if v == min_value]
+
+        return random.choice(candidates), min_value
@@ -1,16 +1,21 @@
+import asyncio
 from contextvars import ContextVar
 import logging
+import time
 from typing import Literal
 
 from redis.asyncio import Redis as AsyncRedis
 from sqlalchemy import Integer, and_, cast, delete, func, insert, or_, select, text, update
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
 from api.clients.model import BaseModelProvider as ModelProvider
+from api.helpers.models._routingcatalog import RoutingCatalog
 from api.schemas.admin.providers import Provider, ProviderCarbonFootprintZone, ProviderType
-from api.schemas.admin.routers import Router, RouterLoadBalancingStrategy
+from api.schemas.admin.routers import Router, RouterLoadBalancingStrategy, RouterUsageSource
 from api.schemas.core.configuration import Model as ModelConfiguration
+from api.schemas.core.configuration import RoutingFairQueuingKey
 from api.schemas.core.context import RequestContext
 from api.schemas.core.models import Metric
 from api.schemas.me.info import UserInfo
@@ -21,6 +26,7 @@ from api.sql.models import Router as RouterTable
 from api.sql.models import RouterAlias as RouterAliasTable
 from api.sql.models import User as UserTable
 from api.tasks import add_model_queue_to_running_worker
+from api.utils.context import global_context
 from api.utils.exceptions import (
     InconsistentModelMaxContextLengthException,
     InconsistentModelVectorSizeException,
@@ -35,7 +41,7 @@ from api.utils.exceptions import (
     RouterNotFoundException,
     WrongModelTypeException,
 )
-from api.utils.routing import apply_routing_with_queuing, apply_routing_without_queuing
+from api.utils.routing import apply_routing_with_queuing, apply_routing_with_scheduling, apply_routing_without_queuing
 from api.utils.variables import (
     ENDPOINT__AUDIO_TRANSCRIPTIONS,
     ENDPOINT__CHAT_COMPLETIONS,
@@ -44,6 +50,7 @@ from api.utils.variables import (
     ENDPOINT__OCR_BETA,
     ENDPOINT__RERANK,
     PREFIX__CELERY_QUEUE_ROUTING,
+    PREFIX__REDIS_ROUTING_CATALOG,
 )
 
 logger = logging.getLogger(__name__)
@@ -99,12 +106,27 @@ class ModelRegistry:
         max_priority: int,
         max_retries: int,
         retry_countdown: int,
+        catalog_refresh_interval: float = 10.0,
+        peak_ewma_half_life: float | None = None,
+        slot_lease_ttl: int = 600,
+        scheduling_enabled: bool = False,
+        fair_queuing_key: RoutingFairQueuingKey = RoutingFairQueuingKey.USER,
     ) -> None:
         self.app_title = app_title
         self.queuing_enabled = queuing_enabled
         self.max_priority = max_priority
         self.max_retries = max_retries
         self.retry_countdown = retry_countdown
+        self.catalog_refresh_interval = catalog_refresh_interval
+        self.peak_ewma_half_life = peak_ewma_half_life
+        self.slot_lease_ttl = slot_lease_ttl
+        self.scheduling_enabled = scheduling_enabled
+        self.fair_queuing_key = fair_queuing_key
+
+        # in-memory routing catalog, None until loaded (hot path falls back to the database)
+        self.catalog: RoutingCatalog | None = None
+        self.catalog_version_key = f"{PREFIX__REDIS_ROUTING_CATALOG}:version"
+        self.catalog_channel = f"{PREFIX__REDIS_ROUTING_CATALOG}:invalidations"
 
     async def setup(self, models: list[ModelConfiguration], postgres_session: AsyncSession) -> None:
         """
@@ -124,6 +146,7 @@ class ModelRegistry:
                     load_balancing_strategy=model.load_balancing_strategy,
                     cost_prompt_tokens=model.cost_prompt_tokens,
                     cost_completion_tokens=model.cost_completion_tokens,
+                    usage_source=model.usage_source,
                     user_id=0,  # setup as master user
                     postgres_session=postgres_session,
                 )
@@ -175,6 +198,67 @@ class ModelRegistry:
                 for router in routers:
                     add_model_queue_to_running_worker(queue_name=f"{PREFIX__CELERY_QUEUE_ROUTING}.{router.id}")
 
+    async def load_catalog(self, postgres_session: AsyncSession, redis_client: AsyncRedis) -> None:
+        """
+        Load the routers and providers from the database into a new in-memory routing catalog snapshot.
+
+        Args:
+            postgres_session(AsyncSession): Database postgres_session
+            redis_client(AsyncRedis): Redis client
+        """
+        # read the version before the database, so a concurrent invalidation always triggers a new load
+        version = int(await redis_client.get(self.catalog_version_key) or 0)
+        routers = await self.get_routers(router_id=None, name=None, postgres_session=postgres_session)
+        providers = await self.get_providers(router_id=None, provider_id=None, postgres_session=postgres_session)
+
+        self.catalog = RoutingCatalog.build(version=version, routers=routers, providers=providers)
+        logger.debug(f"Routing catalog loaded (version: {version}, routers: {len(routers)}, providers: {len(providers)})")
+
+    async def invalidate_catalog(self, postgres_session: AsyncSession, redis_client: AsyncRedis) -> None:
+        """
+        Bump the routing catalog version and notify the other workers, then reload the local catalog. Must be called after each
+        routers or providers modification.
+
+        Args:
+            postgres_session(AsyncSession): Database postgres_session
+            redis_client(AsyncRedis): Redis client
+        """
+        version = await redis_client.incr(self.catalog_version_key)
+        await redis_client.publish(self.catalog_channel, version)
+        await self.load_catalog(postgres_session=postgres_session, redis_client=redis_client)
+
+    async def watch_catalog(self, redis_client: AsyncRedis, postgres_session_factory: sessionmaker) -> None:
+        """
+        Reload the routing catalog when another worker invalidates it. Pub/sub messages are not persisted, so the version is also
+        polled every `catalog_refresh_interval` seconds to bound the staleness of the catalog. Run as a background task in lifespan.
+
+        Args:
+            redis_client(AsyncRedis): Redis client dedicated to the subscription, closed when the task is cancelled
+            postgres_session_factory(sessionmaker): Database session factory
+        """
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.catalog_channel)
+            while True:
+                try:
+                    message = await pubsub.get_message(timeout=self.catalog_refresh_interval)
+                    if message is not None:
+                        version = int(message["data"])
+                    else:
+                        version = int(await redis_client.get(self.catalog_version_key) or 0)
+
+                    if self.catalog is None or self.catalog.version != version:
+                        async with postgres_session_factory() as postgres_session:
+                            await self.load_catalog(postgres_session=postgres_session, redis_client=redis_client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.warning("Failed to refresh routing catalog.", exc_info=True)
+                    await asyncio.sleep(self.catalog_refresh_interval)
+        finally:
+            await pubsub.aclose()
+            await redis_client.aclose()
+
     async def create_router(
         self,
         name: str,
@@ -185,6 +269,7 @@ class ModelRegistry:
         cost_completion_tokens: float,
         user_id: int,
         postgres_session: AsyncSession,
+        usage_source: RouterUsageSource = RouterUsageSource.UPSTREAM,
     ) -> int:
         """
         Create a new model router without any provider.
@@ -198,6 +283,7 @@ class ModelRegistry:
             cost_completion_tokens(float): The cost of a million completion tokens
             user_id(int): The user ID of owner of the router
             postgres_session(AsyncSession): The database postgres_session
+            usage_source(RouterUsageSource): The source of the token usage of the requests
 
         Returns:
             The router ID
@@ -215,6 +301,7 @@ class ModelRegistry:
                     load_balancing_strategy=load_balancing_strategy.value,
                     cost_prompt_tokens=cost_prompt_tokens,
                     cost_completion_tokens=cost_completion_tokens,
+                    usage_source=usage_source.value,
                 )
                 .returning(RouterTable.id)
             )
@@ -279,6 +366,7 @@ class ModelRegistry:
         cost_prompt_tokens: float | None,
         cost_completion_tokens: float | None,
         postgres_session: AsyncSession,
+        usage_source: RouterUsageSource | None = None,
     ) -> None:
         """
         Update a model router.
@@ -292,6 +380,7 @@ class ModelRegistry:
             cost_prompt_tokens(Optional[float]): Optional new cost of a million prompt tokens
             cost_completion_tokens(Optional[float]): Optional new cost of a million completion tokens
             postgres_session(AsyncSession): Database postgres_session
+            usage_source(Optional[RouterUsageSource]): Optional new source of the token usage of the requests
 
         """
         # Check if model exists
@@ -317,6 +406,8 @@ class ModelRegistry:
             update_values["cost_prompt_tokens"] = cost_prompt_tokens
         if cost_completion_tokens is not None:
             update_values["cost_completion_tokens"] = cost_completion_tokens
+        if usage_source is not None:
+            update_values["usage_source"] = usage_source.value
 
         if update_values:
             await postgres_session.execute(update(RouterTable).where(RouterTable.id == router_id).values(**update_values))
@@ -381,6 +472,7 @@ class ModelRegistry:
                     RouterTable.load_balancing_strategy,
                     RouterTable.cost_prompt_tokens,
                     RouterTable.cost_completion_tokens,
+                    RouterTable.usage_source,
                     first_provider_subquery.c.max_context_length,
                     first_provider_subquery.c.vector_size,
                     provider_count_subquery.label("providers"),
@@ -433,6 +525,7 @@ class ModelRegistry:
                     max_context_length=row["max_context_length"],
                     cost_prompt_tokens=row["cost_prompt_tokens"] or 0.0,
                     cost_completion_tokens=row["cost_completion_tokens"] or 0.0,
+                    usage_source=RouterUsageSource(row["usage_source"]),
                     providers=row["providers"],
                     created=row["created"],
                     updated=row["updated"],
@@ -812,6 +905,25 @@ class ModelRegistry:
 
         return router_id
 
+    @staticmethod
+    def _get_request_tokens(endpoint: str, body: dict) -> int:
+        """
+        Estimate the tokens of a request for the inflight tokens QoS metric: the prompt tokens counted by the usage tokenizer plus the
+        maximum completion tokens of the request (0 if not provided).
+
+        Args:
+            endpoint(str): The type of endpoint called
+            body(dict): The request body
+
+        Returns:
+            int: The estimated tokens of the request
+        """
+        tokenizer = getattr(global_context, "tokenizer", None)
+        prompt_tokens = tokenizer.get_prompt_tokens(endpoint=endpoint, body=body) if tokenizer is not None else 0
+        completion_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or 0
+
+        return prompt_tokens + int(completion_tokens)
+
     async def get_model_provider(
         self,
         model: str,
@@ -819,9 +931,11 @@ class ModelRegistry:
         postgres_session: AsyncSession,
         redis_client: AsyncRedis,
         request_context: ContextVar[RequestContext],
+        body: dict | None = None,
     ) -> ModelProvider:
         """
-        Get a model provider for a given model, endpoint, user priority, postgres_session and redis client.
+        Get a model provider for a given model, endpoint, user priority, postgres_session and redis client. The request is refused with a
+        503 error if no provider is available before its deadline (request timeout header, or the longest timeout of the providers).
 
         Args:
             model(str): The model name
@@ -829,15 +943,20 @@ class ModelRegistry:
             postgres_session(AsyncSession): Database postgres_session
             redis_client(AsyncRedis): Redis client
             request_context(ContextVar[RequestContext]): Request context
+            body(dict | None): The request body, to estimate the tokens of the request for the inflight tokens QoS metric
         Returns:
             ModelProvider: The chosen provider
         """
+        catalog = self.catalog  # keep the same snapshot for the whole request
         try:
-            routers = await self.get_routers(router_id=None, name=model, postgres_session=postgres_session)
+            if catalog is not None:
+                router = catalog.get_router(name=model)
+            else:
+                routers = await self.get_routers(router_id=None, name=model, postgres_session=postgres_session)
+                router = routers[0]
         except RouterNotFoundException:
             raise ModelNotFoundException()
 
-        router = routers[0]
         request_context.get().router_id = router.id
         request_context.get().router_name = router.name
 
@@ -847,15 +966,50 @@ class ModelRegistry:
         if (router.cost_prompt_tokens != 0 or router.cost_completion_tokens != 0) and request_context.get().user_info.budget == 0:
             raise InsufficientBudgetException()
 
-        providers = await self.get_providers(router_id=router.id, provider_id=None, postgres_session=postgres_session)
+        if catalog is not None:
+            providers = catalog.get_providers(router_id=router.id)
+        else:
+            providers = await self.get_providers(router_id=router.id, provider_id=None, postgres_session=postgres_session)
 
         if len(providers) == 0:
             raise ModelNotFoundException()
 
+        # ensure priority is between 0 and max_priority
+        user_info = request_context.get().user_info
+        priority = max(0, min(int(user_info.priority), self.max_priority)) if user_info is not None else 0
+
+        tokens = 0
+        if body is not None and any(provider.qos_metric == Metric.INFLIGHT_TOKENS for provider in providers):
+            tokens = self._get_request_tokens(endpoint=endpoint, body=body)
+
+        # a request not started after the provider timeout is not forwarded, even if the request timeout header is longer
+        deadline = time.time() + max(provider.timeout for provider in providers)
+        if request_context.get().deadline is not None:
+            deadline = min(deadline, request_context.get().deadline)
+
+        if self.scheduling_enabled:
+            if user_info is not None and self.fair_queuing_key == RoutingFairQueuingKey.ORGANIZATION and user_info.organization is not None:
+                flow = f"organization:{user_info.organization}"
+            else:
+                flow = f"user:{user_info.id if user_info is not None else 0}"
+            lease = await apply_routing_with_scheduling(
+                router_id=router.id,
+                providers=providers,
+                load_balancing_strategy=router.load_balancing_strategy,
+                load_balancing_metric=Metric.TTFT,
+                retry_countdown=self.retry_countdown,
+                max_retries=self.max_retries,
+                redis_client=redis_client,
+                priority=priority,
+                slot_lease_ttl=self.slot_lease_ttl,
+                flow=flow,
+                weight=user_info.routing_weight if user_info is not None else 1.0,
+                tokens=tokens,
+                deadline=deadline,
+            )
+
         elif self.queuing_enabled:
-            # ensure priority is between 0 and max_priority
-            priority = max(0, min(int(request_context.get().user_info.priority), self.max_priority))
-            provider_id = await apply_routing_with_queuing(
+            lease = await apply_routing_with_queuing(
                 providers=providers,
                 load_balancing_strategy=router.load_balancing_strategy,
                 load_balancing_metric=Metric.TTFT,
@@ -863,20 +1017,36 @@ class ModelRegistry:
                 max_retries=self.max_retries,
                 queue_name=f"{PREFIX__CELERY_QUEUE_ROUTING}.{router.id}",
                 priority=priority,
+                redis_client=redis_client,
+                slot_lease_ttl=self.slot_lease_ttl,
+                tokens=tokens,
+                deadline=deadline,
             )
 
         else:
-            provider_id = await apply_routing_without_queuing(
+            lease = await apply_routing_without_queuing(
                 providers=providers,
                 load_balancing_strategy=router.load_balancing_strategy,
                 load_balancing_metric=Metric.TTFT,
                 retry_countdown=self.retry_countdown,
                 max_retries=self.max_retries,
                 redis_client=redis_client,
+                priority=priority,
+                slot_lease_ttl=self.slot_lease_ttl,
+                tokens=tokens,
+                deadline=deadline,
             )
 
-        providers = await self.get_providers(router_id=router.id, provider_id=provider_id, postgres_session=postgres_session)
-        provider = providers[0]
+        # released at the end of the request if the request is not forwarded (see `release_slot_leases`)
+        if request_context.get().slot_leases is not None:
+            request_context.get().slot_leases.append(lease)
+
+        provider_id = lease.provider_id
+        if catalog is not None:
+            provider = catalog.get_provider(router_id=router.id, provider_id=provider_id)
+        else:
+            providers = await self.get_providers(router_id=router.id, provider_id=provider_id, postgres_session=postgres_session)
+            provider = providers[0]
 
         model_provider = ModelProvider.import_module(type=provider.type)(
             url=provider.url,
@@ -890,6 +1060,10 @@ class ModelRegistry:
         model_provider.id = provider.id
         model_provider.cost_prompt_tokens = router.cost_prompt_tokens
         model_provider.cost_completion_tokens = router.cost_completion_tokens
+        model_provider.usage_source = router.usage_source
+        model_provider.peak_ewma_half_life = self.peak_ewma_half_life
+        model_provider.slot_lease_ttl = self.slot_lease_ttl
+        model_provider.slot_lease = lease
 
         request_context.get().provider_id = provider.id
         request_context.get().provider_model_name = provider.model_name
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+
+from api.schemas.admin.providers import Provider
+from api.schemas.admin.routers import Router
+from api.utils.exceptions import ProviderNotFoundException, RouterNotFoundException
+
+
+@dataclass(frozen=True)
+class RoutingCatalog:
+    """
+    Immutable in-memory snapshot of the routers and their providers, used on the inference hot path to resolve a model name
+    without any database round trip. A new snapshot is built on each invalidation and swapped atomically in the model registry.
+
+    Args:
+        version(int): Catalog version in Redis at load time.
+        routers(dict[int, Router]): Routers by ID.
+        names(dict[str, int]): Router ID by router name and alias.
+        providers(dict[int, tuple[Provider, ...]]): Providers by router ID, ordered by provider ID.
+    """
+
+    version: int
+    routers: dict[int, Router] = field(default_factory=dict)
+    names: dict[str, int] = field(default_factory=dict)
+    providers: dict[int, tuple[Provider, ...]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, version: int, routers: list[Router], providers: list[Provider]) -> "RoutingCatalog":
+        """
+        Build a catalog snapshot from the routers and providers loaded from the database.
+
+        Args:
+            version(int): Catalog version in Redis at load time.
+            routers(list[Router]): All the routers.
+            providers(list[Provider]): All the providers.
+
+        Returns:
+            RoutingCatalog: The catalog snapshot.
+        """
+        names = {}
+        for router in routers:
+            names[router.name] = router.id
+            for alias in router.aliases or []:
+                names[alias] = router.id
+
+        providers_by_router = {router.id: [] for router in routers}
+        for provider in sorted(providers, key=lambda provider: provider.id):
+            providers_by_router.setdefault(provider.router_id, []).append(provider)
+
+        return cls(
+            version=version,
+            routers={router.id: router for router in routers},
+            names=names,
+            providers={router_id: tuple(router_providers) for router_id, router_providers in providers_by_router.items()},
+        )
+
+    def get_router(self, name: str) -> Router:
+        """
+        Get a router by name or alias.
+
+        Args:
+            name(str): The router name or alias.
+
+        Returns:
+            Router: The router.
+
+        Raises:
+            RouterNotFoundException: If no router matches the name.
+        """
+        router_id = self.names.get(name)
+        if router_id is None:
+            raise RouterNotFoundException()
+
+        return self.routers[router_id]
+
+    def get_providers(self, router_id: int) -> list[Provider]:
+        """
+        Get the providers of a router.
+
+        Args:
+            router_id(int): The router ID.
+
+        Returns:
+            list[Provider]: The providers of the router, empty if the router has no provider.
+        """
+        return list(self.providers.get(router_id, ()))
+
+    def get_provider(self, router_id: int, provider_id: int) -> Provider:
+        """
+        Get a provider of a router by ID.
+
+        Args:
+            router_id(int): The router ID.
+            provider_id(int): The provider ID.
+
+        Returns:
+            Provider: The provider.
+
+        Raises:
+            ProviderNotFoundException: If the provider does not belong to the router.
+        """
+        provider = next((provider for provider in self.providers.get(router_id, ()) if provider.id == provider_id), None)
+        if provider is None:
+            raise ProviderNotFoundException()
+
+        return provider
@@ -37,6 +37,7 @@ class PostgresRolesRepository(RoleRepository):
             select(
                 RoleTable.id,
                 RoleTable.name,
+                RoleTable.routing_weight,
                 cast(func.extract("epoch", RoleTable.created), Integer).label("created"),
                 cast(func.extract("epoch", RoleTable.updated), Integer).label("updated"),
                 func.count(distinct(UserTable.id)).label("users"),
@@ -59,6 +60,7 @@ class PostgresRolesRepository(RoleRepository):
             roles[row["id"]] = Role(
                 id=row["id"],
                 name=row["name"],
+                routing_weight=row["routing_weight"],
                 created=row["created"],
                 updated=row["updated"],
                 users=row["users"],
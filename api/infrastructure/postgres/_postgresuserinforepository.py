@@ -65,6 +65,7 @@ class PostgresUserInfoRepository(UserInfoRepository):
                 select(
                     RoleTable.id,
                     RoleTable.name,
+                    RoleTable.routing_weight,
                     cast(func.extract("epoch", RoleTable.created), Integer).label("created"),
                     cast(func.extract("epoch", RoleTable.updated), Integer).label("updated"),
                     func.count(distinct(UserTable.id)).label("users"),
@@ -86,6 +87,7 @@ class PostgresUserInfoRepository(UserInfoRepository):
                 roles[row["id"]] = Role(
                     id=row["id"],
                     name=row["name"],
+                    routing_weight=row["routing_weight"],
                     created=row["created"],
                     updated=row["updated"],
                     users=row["users"],
@@ -135,6 +137,7 @@ class PostgresUserInfoRepository(UserInfoRepository):
                 created=user.created,
                 updated=user.updated,
                 priority=user.priority,
+                routing_weight=role.routing_weight,
             )
 
         return user
@@ -5,6 +5,7 @@ import pkgutil
 from fastapi import Depends, FastAPI, Request
 from prometheus_fastapi_instrumentator import Instrumentator
 import sentry_sdk
+from starlette.background import BackgroundTasks
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.responses import JSONResponse
 
@@ -13,9 +14,9 @@ from api.schemas.admin.roles import PermissionType
 from api.schemas.core.context import RequestContext
 from api.schemas.usage import Usage
 from api.utils.configuration import configuration
-from api.utils.context import request_context
+from api.utils.context import get_request_deadline, release_slot_leases, request_context
 from api.utils.lifespan import lifespan
-from api.utils.variables import ROUTER__MONITORING
+from api.utils.variables import HEADER__REQUEST_TIMEOUT, ROUTER__MONITORING
 
 logger = logging.getLogger(__name__)
 
@@ -42,9 +43,22 @@ app.add_middleware(SessionMiddleware, secret_key=configuration.settings.session_
 @app.middleware("http")
 async def set_request_context(request: Request, call_next):
     """Middleware to set request context."""
-    request_context.set(RequestContext(method=request.method, endpoint=request.url.path, usage=Usage()))
-
-    return await call_next(request)
+    deadline = get_request_deadline(timeout=request.headers.get(HEADER__REQUEST_TIMEOUT))
+    context = RequestContext(method=request.method, endpoint=request.url.path, usage=Usage(), deadline=deadline, prompt_tokens={}, slot_leases=[])  # fmt: off
+    request_context.set(context)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await release_slot_leases(context=context)
+        raise
+
+    # the provider slots not released by the forward of the request are released once the response is sent (or the client is gone)
+    background = BackgroundTasks(tasks=[response.background] if response.background is not None else [])
+    background.add_task(release_slot_leases, context=context)
+    response.background = background
+
+    return response
 
 
 # add routers to the app (legacy code)
@@ -31,6 +31,7 @@ class RoleUpdateRequest(BaseModel):
     name: constr(strip_whitespace=True, min_length=1) | None = Field(default=None, description="The new role name.")
     permissions: list[PermissionType] | None = Field(default=None, description="The new permissions.")
     limits: list[Limit] | None = Field(default=None, description="The new limits.")
+    routing_weight: float | None = Field(default=None, gt=0.0, description="The new routing weight. If None, unchanged.")
 
     @field_validator("limits", mode="after")
     def check_duplicate_limits(cls, limits):
@@ -52,6 +53,11 @@ class CreateRole(BaseModel):
     name: constr(strip_whitespace=True, min_length=1)
     permissions: list[PermissionType] | None = []
     limits: list[Limit] = []
+    routing_weight: float = Field(
+        default=1.0,
+        gt=0.0,
+        description="Weight of the users of the role in the fair queuing of the routing queues: when a router is saturated, a user with a weight of 2 is admitted twice as often as a user with a weight of 1 of the same priority.",
+    )
 
     @field_validator("limits", mode="after")
     def check_duplicate_limits(cls, limits):
@@ -71,6 +77,7 @@ class Role(BaseModel):
     name: str
     permissions: list[PermissionType]
     limits: list[Limit]
+    routing_weight: float = 1.0
     users: int = 0
     created: int = Field(default_factory=lambda: int(dt.datetime.now().timestamp()))
     updated: int = Field(default_factory=lambda: int(dt.datetime.now().timestamp()))
@@ -10,6 +10,15 @@ from api.schemas.models import ModelType
 class RouterLoadBalancingStrategy(str, Enum):
     SHUFFLE = "shuffle"
     LEAST_BUSY = "least_busy"
+    POWER_OF_TWO = "power_of_two"
+    PEAK_EWMA = "peak_ewma"
+    LEAST_LOADED = "least_loaded"
+
+
+class RouterUsageSource(str, Enum):
+    UPSTREAM = "upstream"
+    LOCAL = "local"
+    SAMPLING = "sampling"
 
 
 class CreateRouter(BaseModel):
@@ -19,6 +28,7 @@ class CreateRouter(BaseModel):
     load_balancing_strategy: RouterLoadBalancingStrategy = Field(default=RouterLoadBalancingStrategy.SHUFFLE, description="Routing strategy for load balancing between providers of the model. It will be used to identify the model type.", examples=["least_busy"])  # fmt: off
     cost_prompt_tokens: float = Field(default=0.0, ge=0.0, description="Cost of a million prompt tokens (decrease user budget)")
     cost_completion_tokens: float = Field(default=0.0, ge=0.0, description="Cost of a million completion tokens (decrease user budget)")
+    usage_source: RouterUsageSource = Field(default=RouterUsageSource.UPSTREAM, description="Source of the token usage of the requests: `upstream` uses the usage returned by the providers (local tokenizer as fallback if missing), `local` always counts the tokens with the API tokenizer, `sampling` uses the upstream usage and checks a sample of the requests with the API tokenizer.", examples=["upstream"])  # fmt: off
 
 
 class CreateRouterResponse(BaseModel):
@@ -32,6 +42,7 @@ class UpdateRouter(BaseModel):
     load_balancing_strategy: RouterLoadBalancingStrategy | None = Field(default=None, description="Routing strategy for load balancing between providers of the model. It will be used to identify the model type.", examples=["least_busy"])  # fmt: off
     cost_prompt_tokens: float | None = Field(default=None, ge=0.0, description="Cost of a million prompt tokens (decrease user budget)")
     cost_completion_tokens: float | None = Field(default=None, ge=0.0, description="Cost of a million completion tokens (decrease user budget)")
+    usage_source: RouterUsageSource | None = Field(default=None, description="Source of the token usage of the requests: `upstream` uses the usage returned by the providers (local tokenizer as fallback if missing), `local` always counts the tokens with the API tokenizer, `sampling` uses the upstream usage and checks a sample of the requests with the API tokenizer.", examples=["upstream"])  # fmt: off
 
 
 class Router(BaseModel):
@@ -46,6 +57,7 @@ class Router(BaseModel):
     max_context_length: int | None = Field(default=None, description="Maximum amount of tokens a context could contains. Make sure it is the same for all models.")  # fmt: off
     cost_prompt_tokens: float = Field(description="Cost of a million prompt tokens (decrease user budget)")
     cost_completion_tokens: float = Field(description="Cost of a million completion tokens (decrease user budget)")
+    usage_source: RouterUsageSource = Field(default=RouterUsageSource.UPSTREAM, description="Source of the token usage of the requests: `upstream` uses the usage returned by the providers (local tokenizer as fallback if missing), `local` always counts the tokens with the API tokenizer, `sampling` uses the upstream usage and checks a sample of the requests with the API tokenizer.", examples=["upstream"])  # fmt: off
     providers: int = Field(default=0, description="Number of providers in the router.")  # fmt: off
     created: int = Field(..., description="Time of creation, as Unix timestamp.")  # fmt: off
     updated: int = Field(..., description="Time of last update, as Unix timestamp.")  # fmt: off
@@ -12,7 +12,7 @@ from pydantic_settings import BaseSettings
 import yaml
 
 from api.schemas.admin.providers import ProviderCarbonFootprintZone, ProviderType
-from api.schemas.admin.routers import RouterLoadBalancingStrategy
+from api.schemas.admin.routers import RouterLoadBalancingStrategy, RouterUsageSource
 from api.schemas.core.models import Metric
 from api.schemas.models import ModelType
 from api.utils.variables import DEFAULT_APP_NAME, DEFAULT_TIMEOUT, ROUTER__ADMIN, ROUTER__AUTH, ROUTERS
@@ -129,6 +129,7 @@ class Model(ConfigBaseModel):
     load_balancing_strategy: RouterLoadBalancingStrategy = Field(default=RouterLoadBalancingStrategy.SHUFFLE, description="Routing strategy for load balancing between providers of the model.", examples=["least_busy"])  # fmt: off
     cost_prompt_tokens: float = Field(default=0.0, ge=0.0, description="Model costs prompt tokens for user budget computation. The cost is by 1M tokens.", examples=[0.1])  # fmt: off
     cost_completion_tokens: float = Field(default=0.0, ge=0.0, description="Model costs completion tokens for user budget computation. The cost is by 1M tokens. Set to `0.0` to disable budget computation for this model.", examples=[0.1])  # fmt: off
+    usage_source: RouterUsageSource = Field(default=RouterUsageSource.UPSTREAM, description="Source of the token usage of the requests: `upstream` uses the usage returned by the providers (API tokenizer as fallback if missing), `local` always counts the tokens with the API tokenizer, `sampling` uses the upstream usage and checks a sample of the requests (see `usage_sampling_rate` setting) with the API tokenizer.", examples=["upstream"])  # fmt: off
     providers: list[ModelProvider] = Field(..., description="API providers of the model. If there are multiple providers, the model will be load balanced between them according to the routing strategy. The different models have to the same type.")  # fmt: off
 
 
@@ -313,6 +314,16 @@ class LimitingStrategy(str, Enum):
     SLIDING_WINDOW = "sliding_window"
 
 
+class RoutingQueueType(str, Enum):
+    CELERY = "celery"
+    REDIS = "redis"
+
+
+class RoutingFairQueuingKey(str, Enum):
+    USER = "user"
+    ORGANIZATION = "organization"
+
+
 class Tokenizer(str, Enum):
     TIKTOKEN_GPT2 = "tiktoken_gpt2"
     TIKTOKEN_R50K_BASE = "tiktoken_r50k_base"
@@ -330,12 +341,33 @@ class Settings(ConfigBaseModel):
     app_title: str | None = Field(default=DEFAULT_APP_NAME, description="Display title of your API in swagger UI, see https://fastapi.tiangolo.com/tutorial/metadata for more information.", examples=["My API"])  # fmt: off
 
     # routing
+    routing_queue: RoutingQueueType = Field(default=RoutingQueueType.CELERY, description="Queue of the requests waiting for a provider. `celery` routes the requests in the Celery workers, if the celery dependency is provided (otherwise the requests are routed without queue). `redis` queues the requests in a Redis sorted set by router, ordered by user priority and arrival time, and admits them in the API workers as provider slots are released.")  # fmt: off
+    routing_fair_queuing_key: RoutingFairQueuingKey = Field(default=RoutingFairQueuingKey.USER, description="Flows between which the requests of the same priority are fairly admitted by the `redis` routing queue, weighted by the routing weight of the user roles. With `organization`, users without organization are their own flow.")  # fmt: off
     routing_max_retries: int = Field(default=3, ge=1, description="Maximum number of retries for routing tasks.")  # fmt: off
     routing_retry_countdown: int = Field(default=3, ge=1, description="Number of seconds before retrying a failed routing task.")  # fmt: off
     routing_max_priority: int = Field(default=4, ge=0, le=10, description="Maximum allowed priority in routing tasks.")  # fmt: off
+    routing_peak_ewma_half_life: float = Field(default=5.0, gt=0.0, description="Half-life in seconds of the decay of the providers latency average used by the `peak_ewma` load balancing strategy. Lower values react faster to a provider recovering from a latency spike.")  # fmt: off
+    routing_slot_lease_ttl: int = Field(default=600, ge=1, description="Number of seconds after which a provider slot acquired for a request is released if the request has not ended, so the inflight requests of a crashed API worker are not counted forever. Requests renew their slot while they are running.")  # fmt: off
+    routing_catalog_refresh_interval: float = Field(default=10.0, gt=0.0, description="Maximum number of seconds before a worker reloads the in-memory routing catalog (routers and providers) if an invalidation message from another worker was missed.")  # fmt: off
+
+    # metrics aggregator
+    metrics_aggregator_enabled: bool = Field(default=False, description="If true, the providers performance metrics (time to first token, latency) are aggregated in process and written in Redis periodically instead of on each request, in time series by worker (`worker` label).")  # fmt: off
+    metrics_aggregator_flush_interval: int = Field(default=1000, ge=10, description="Number of milliseconds between two writes of the aggregated performance metrics in Redis.")  # fmt: off
+    metrics_aggregator_precision: int = Field(default=20, ge=1, description="Maximum number of data points written in Redis by provider and metric on each write of the aggregated performance metrics. Higher values preserve more precisely the distribution of the metrics used by the least busy load balancing strategy.")  # fmt: off
+
+    # providers http clients
+    provider_http_max_connections: int = Field(default=100, ge=1, description="Maximum number of concurrent connections opened by the API to each model provider.")  # fmt: off
+    provider_http_max_keepalive_connections: int = Field(default=20, ge=0, description="Maximum number of idle connections kept alive to each model provider, to reuse connections between requests.")  # fmt: off
+    provider_http_keepalive_expiry: float = Field(default=5.0, ge=0.0, description="Number of seconds an idle connection to a model provider is kept alive before being closed.")  # fmt: off
+    provider_http_http2: bool = Field(default=False, description="If true, connect to model providers with HTTP/2 when they support it (requires `h2` package).")  # fmt: off
+
+    # providers metrics
+    provider_metrics_enabled: bool = Field(default=False, description="If true, the metrics endpoints of the vLLM and TEI providers (requests waiting and running, KV cache usage) are scraped periodically, for the `least_loaded` load balancing strategy and the `waiting` and `kv_cache` QoS metrics.")  # fmt: off
+    provider_metrics_interval: float = Field(default=5.0, gt=0.0, description="Number of seconds between two scrapes of the providers metrics endpoints.")  # fmt: off
 
     # usage tokenizer
     usage_tokenizer: Tokenizer = Field(default=Tokenizer.TIKTOKEN_GPT2, description="Tokenizer used to compute usage of the API.")  # fmt: off
+    usage_sampling_rate: float = Field(default=0.01, ge=0.0, le=1.0, description="Ratio of the requests of the models with `sampling` usage source for which the upstream usage is checked with the API tokenizer. A warning is logged if the counts differ.")  # fmt: off
 
     # logging
     log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = Field(default="INFO", description="Logging level of the API.")  # fmt: off
@@ -357,9 +389,13 @@ class Settings(ConfigBaseModel):
     auth_master_key: constr(strip_whitespace=True, min_length=1) = Field(default="changeme", description="Master key for the API. It should be a random string with at least 32 characters. This key has all permissions and cannot be modified or deleted. This key is used to create the first role and the first user. This key is also used to encrypt user tokens, watch out if you modify the master key, you'll need to update all user API keys.")  # fmt: off
     auth_key_max_expiration_days: int | None = Field(default=None, ge=1, description="Maximum number of days for a new API key to be valid.")  # fmt: off
     auth_playground_session_duration: int = Field(default=3600, ge=1, description="Duration of the playground postgres_session in seconds.")  # fmt: off
+    auth_user_info_cache_ttl: int = Field(default=30, ge=0, description="Duration in seconds of the cache of the user info of the API keys in each API worker. The cached user info are evicted from all the workers when a key is revoked or when its user or role is modified. Set to 0 to disable the cache.")  # fmt: off
+    auth_user_info_cache_size: int = Field(default=10000, ge=1, description="Maximum number of API keys in the user info cache of each API worker, the least recently used keys are evicted first.")  # fmt: off
 
     # rate_limiting
     rate_limiting_strategy: LimitingStrategy = Field(default=LimitingStrategy.FIXED_WINDOW, description="Rate limiting strategy for the API.")  # fmt: off
+    rate_limiting_local_share: float = Field(default=0.0, ge=0.0, lt=1.0, description="Share of the rate limits of a user leased at once by each API worker, to admit the requests of the user locally without checking the limits in Redis for each request. The requests admitted in excess of a limit are bounded by this share of the limit per worker, and the limits are checked exactly in Redis when a user is close to them. If 0, the limits are checked in Redis for each request.")  # fmt: off
+    rate_limiting_local_ttl: float = Field(default=10.0, gt=0.0, description="Number of seconds after which the unused share of the rate limits leased by an API worker is given back (see `rate_limiting_local_share`).")  # fmt: off
 
     # monitoring
     monitoring_postgres_enabled: bool = Field(default=True, description="If true, the log usage will be written in the PostgreSQL database.")  # fmt: off
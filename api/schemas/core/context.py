@@ -13,10 +13,15 @@ class GlobalContext(BaseModel):
     document_manager: Any | None = None
     identity_access_manager: Any | None = None
     limiter: Any | None = None
+    admission_controller: Any | None = None
+    routing_reply_listener: Any | None = None
     usage_manager: Any | None = None
     model_registry: Any | None = None
     parser_manager: Any | None = None
     tokenizer: Any | None = None
+    http_client_pool: Any | None = None
+    metrics_aggregator: Any | None = None
+    provider_metrics_scraper: Any | None = None
     redis_pool: Any | None = None
     postgres_session_factory: Any | None = None
 
@@ -35,10 +40,13 @@ class RequestContext(BaseModel):
     key_name: str | None = None
     router_id: int | None = None
     provider_id: int | None = None
+    deadline: float | None = None  # timestamp after which the request is not forwarded to a provider anymore
+    slot_leases: list[Any] | None = None  # provider slots acquired by the routing and not released yet, see release_slot_leases
 
     # request body
     router_name: str | None = None
     provider_model_name: str | None = None
+    prompt_tokens: dict[tuple, int] | None = None  # prompt tokens by endpoint and prompt texts, see UsageTokenizer.get_prompt_tokens
 
     # response
     usage: Usage | None = None
@@ -24,7 +24,10 @@ class Metric(str, Enum):
     TTFT = "ttft"  # time to first token
     LATENCY = "latency"  # requests latency
     INFLIGHT = "inflight"  # requests concurrency
+    INFLIGHT_TOKENS = "inflight_tokens"  # estimated tokens of the inflight requests (prompt tokens plus maximum completion tokens)
     PERFORMANCE = "performance"  # custom performance metric
+    WAITING = "waiting"  # requests waiting in the provider queue (scraped from the provider metrics)
+    KV_CACHE = "kv_cache"  # KV cache usage of the provider, between 0 and 1 (scraped from the provider metrics)
 
 
 # TEI
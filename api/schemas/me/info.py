@@ -17,6 +17,7 @@ class UserInfo(BaseModel):
     limits: list[Limit] = Field(description="The user rate limits.")
     expires: int | None = Field(default=None, description="The user expiration timestamp. If None, the user will never expire.")
     priority: int = Field(default=0,description="The user priority (higher = higher priority). This value influences scheduling/queue priority for non-streaming model invocations.")  # fmt: off
+    routing_weight: float = Field(default=1.0, description="The routing weight of the user role, used by the fair queuing of the routing queues.")  # fmt: off
     created: int = Field(description="The user creation timestamp.")
     updated: int = Field(description="The user update timestamp.")
 
@@ -7,7 +7,7 @@ from sqlalchemy.orm import Mapped, declarative_base, mapped_column, relationship
 
 from api.schemas.admin.providers import ProviderCarbonFootprintZone, ProviderType
 from api.schemas.admin.roles import LimitType, PermissionType
-from api.schemas.admin.routers import RouterLoadBalancingStrategy
+from api.schemas.admin.routers import RouterLoadBalancingStrategy, RouterUsageSource
 from api.schemas.collections import CollectionVisibility
 from api.schemas.core.models import Metric
 from api.schemas.models import ModelType
@@ -64,6 +64,7 @@ class Role(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(unique=True, index=True)
+    routing_weight: Mapped[float] = mapped_column(default=1.0)  # Weight of the users of the role in the fair queuing of the routing queues
     created: Mapped[dt.datetime] = mapped_column(insert_default=func.now())
     updated: Mapped[dt.datetime] = mapped_column(insert_default=func.now(), onupdate=func.now())
 
@@ -146,6 +147,15 @@ class Token(Base):
     usage: Mapped[list["Usage"]] = relationship(back_populates="token", passive_deletes=True)
 
 
+class RevokedToken(Base):
+    __tablename__ = "revoked_token"
+
+    id: Mapped[int] = mapped_column(primary_key=True)  # order of the revocations, the workers sync their revocation filter from it
+    token_id: Mapped[int] = mapped_column(index=True)
+    expires: Mapped[dt.datetime | None] = mapped_column(index=True)  # expiration of the token, after which the revocation is deleted
+    created: Mapped[dt.datetime] = mapped_column(insert_default=func.now(), index=True)
+
+
 class Organization(Base):
     __tablename__ = "organization"
 
@@ -193,6 +203,7 @@ class Router(Base):
     load_balancing_strategy: Mapped[RouterLoadBalancingStrategy]
     cost_prompt_tokens: Mapped[float] = mapped_column(default=0.0)
     cost_completion_tokens: Mapped[float] = mapped_column(default=0.0)
+    usage_source: Mapped[RouterUsageSource] = mapped_column(default=RouterUsageSource.UPSTREAM)
     created: Mapped[dt.datetime] = mapped_column(insert_default=func.now())
     updated: Mapped[dt.datetime] = mapped_column(insert_default=func.now(), onupdate=func.now())
 
@@ -1,18 +1,88 @@
+from json import dumps
 import logging
+import time
 from typing import Any
 
 from billiard.exceptions import SoftTimeLimitExceeded
 from celery.exceptions import MaxRetriesExceededError, Retry
 
+from api.helpers._routingreplylistener import RoutingReplyListener
+from api.helpers._slotlease import SlotLease
 from api.schemas.admin.routers import RouterLoadBalancingStrategy
 from api.schemas.core.models import Metric
 from api.tasks import app, create_model_queue, get_redis_client
 from api.utils.load_balancing import apply_sync_load_balancing
 from api.utils.qos import apply_sync_qos_policy
+from api.utils.variables import PREFIX__REDIS_ROUTING_REPLY, REDIS__ROUTING_REPLY_TTL_SECONDS
 
 logger = logging.getLogger(__name__)
 
 
+def get_routing_reply_key(task_id: str) -> str:
+    """
+    Get the Redis key of the list on which the result of a routing task is pushed.
+
+    Args:
+        task_id (str): The routing task ID
+
+    Returns:
+        str: The Redis key
+    """
+    return f"{PREFIX__REDIS_ROUTING_REPLY}:{task_id}"
+
+
+def get_routing_abandoned_key(task_id: str) -> str:
+    """
+    Get the Redis key set by the API when it stops waiting for the result of a routing task.
+
+    Args:
+        task_id (str): The routing task ID
+
+    Returns:
+        str: The Redis key
+    """
+    return f"{PREFIX__REDIS_ROUTING_REPLY}:{task_id}:abandoned"
+
+
+# the result is not pushed if the API stopped waiting, checked atomically with the push (KEYS: reply key, abandoned key)
+REPLY_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return 1
+"""
+
+
+def send_routing_reply(task_id: str, result: dict[str, Any], lease: SlotLease | None = None) -> dict[str, Any]:
+    """
+    Push the result of a routing task on its reply key and notify the API workers (see `RoutingReplyListener`). The key expires if the
+    API is not waiting anymore. If the API already stopped waiting (see `apply_routing_with_queuing`), the result is not pushed and the slot
+    acquired for the request is released, so it is not held until the expiration of its lease.
+
+    Args:
+        task_id (str): The routing task ID
+        result (dict[str, Any]): The result of the routing task
+        lease (SlotLease | None): The lease of the slot acquired for the request, if any
+
+    Returns:
+        dict[str, Any]: The result of the routing task, also stored in the result backend
+    """
+    try:
+        redis_client = get_redis_client()
+        keys = [get_routing_reply_key(task_id=task_id), get_routing_abandoned_key(task_id=task_id)]
+        sent = redis_client.eval(REPLY_SCRIPT, 2, *keys, dumps(result), REDIS__ROUTING_REPLY_TTL_SECONDS, RoutingReplyListener.CHANNEL, task_id)  # fmt: off
+        if not int(sent) and lease is not None:
+            logger.info(f"Task {task_id}: Request abandoned, releasing the provider slot")
+            lease.release_sync(redis_client=redis_client)
+    except Exception:
+        logger.exception(f"Task {task_id}: Unable to send the routing reply")
+
+    return result
+
+
 @app.task(name="routing.apply", bind=True)
 def apply_routing(
     self,
@@ -21,6 +91,9 @@ def apply_routing(
     load_balancing_metric: Metric,
     task_retry_countdown: int,
     task_max_retries: int,
+    slot_lease_ttl: int = 600,
+    tokens: int = 0,
+    deadline: float | None = None,
 ) -> dict[str, Any]:
     """
     Apply load balancing and qos policy to the candidates.
@@ -32,12 +105,23 @@ def apply_routing(
         load_balancing_metric (Metric): The metric type to use for performance evaluation
         task_retry_countdown (int): The countdown to wait before retrying the task
         task_max_retries (int): The maximum number of retries
+        slot_lease_ttl (int): The number of seconds before the slot acquired for the request is released if the request is not completed
+        tokens (int): The estimated tokens of the request, counted by the inflight tokens QoS metric
+        deadline (float | None): The timestamp after which the request is refused instead of being forwarded to a provider
 
     Returns:
-        dict[str, Any]: A dictionary containing the status code and the provider ID
+        dict[str, Any]: A dictionary containing the status code, the provider ID and the ID of the lease of the provider slot
     """
     try:
+        if deadline is not None and time.time() > deadline:
+            logger.info(f"Task {self.request.id}: Request deadline exceeded")
+            return send_routing_reply(task_id=self.request.id, result={"status_code": 503, "body": {"detail": "Request deadline exceeded"}})
+
         redis_client = get_redis_client()
+        if redis_client.exists(get_routing_abandoned_key(task_id=self.request.id)):
+            logger.info(f"Task {self.request.id}: Request abandoned")
+            return {"status_code": 503, "body": {"detail": "Request abandoned"}}
+
         provider_id, _ = apply_sync_load_balancing(
             load_balancing_strategy=load_balancing_strategy,
             candidates=[provider_id for provider_id, _, _ in candidates],
@@ -45,23 +129,36 @@ def apply_routing(
             load_balancing_metric=load_balancing_metric,
         )
         qos_metric, qos_limit = [(metric, value) for id, metric, value in candidates if id == provider_id][0]
-        can_be_forwarded = apply_sync_qos_policy(provider_id=provider_id, qos_metric=qos_metric, qos_limit=qos_limit, redis_client=redis_client)
+        # the inflight limits are checked atomically with the acquisition of the slot
+        if qos_metric == Metric.INFLIGHT:
+            lease = SlotLease.acquire_sync(redis_client=redis_client, provider_id=provider_id, ttl=slot_lease_ttl, limit=qos_limit, tokens=tokens)
+        elif qos_metric == Metric.INFLIGHT_TOKENS:
+            lease = SlotLease.acquire_sync(redis_client=redis_client, provider_id=provider_id, ttl=slot_lease_ttl, tokens=tokens, token_limit=qos_limit)  # fmt: off
+        elif apply_sync_qos_policy(provider_id=provider_id, qos_metric=qos_metric, qos_limit=qos_limit, redis_client=redis_client):
+            lease = SlotLease.acquire_sync(redis_client=redis_client, provider_id=provider_id, ttl=slot_lease_ttl, tokens=tokens)
+        else:
+            lease = None
 
-        if can_be_forwarded:
-            return {"status_code": 200, "provider_id": provider_id}
+        if lease is not None:
+            result = {"status_code": 200, "provider_id": provider_id, "lease_id": lease.lease_id}
+            return send_routing_reply(task_id=self.request.id, result=result, lease=lease)
         else:
+            # the retry is not started after the deadline of the request
+            countdown = task_retry_countdown if deadline is None else min(task_retry_countdown, max(0, deadline - time.time()))
             raise self.retry(
-                countdown=task_retry_countdown, max_retries=task_max_retries, declare=[create_model_queue(self.request.delivery_info["routing_key"])]
+                countdown=countdown, max_retries=task_max_retries, declare=[create_model_queue(self.request.delivery_info["routing_key"])]
             )
 
     except Retry:
         raise
     except MaxRetriesExceededError:
         logger.error(f"Task {self.request.id}: Max retries exceeded", exc_info=True)
-        return {"status_code": 503, "body": {"detail": "Max retries exceeded"}}
+        return send_routing_reply(task_id=self.request.id, result={"status_code": 503, "body": {"detail": "Max retries exceeded"}})
     except SoftTimeLimitExceeded:
         logger.error(f"Task {self.request.id}: Soft time limit exceeded", exc_info=True)
-        return {"status_code": 504, "body": {"detail": "Model invocation exceeded the soft time limit"}}
+        return send_routing_reply(
+            task_id=self.request.id, result={"status_code": 504, "body": {"detail": "Model invocation exceeded the soft time limit"}}
+        )
     except Exception as e:  # pragma: no cover - defensive
         logger.exception(f"Task {self.request.id}: An unexpected error occurred", exc_info=True)
-        return {"status_code": 500, "body": {"detail": type(e).__name__}}
+        return send_routing_reply(task_id=self.request.id, result={"status_code": 500, "body": {"detail": type(e).__name__}})
@@ -0,0 +1,218 @@
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from redis.exceptions import ResponseError
+
+from api.clients.model._vllmmodelprovider import VllmModelProvider
+from api.helpers._slotlease import SlotLease
+from api.schemas.admin.providers import ProviderCarbonFootprintZone
+from api.schemas.admin.routers import RouterUsageSource
+from api.schemas.core.context import RequestContext
+from api.schemas.core.models import RequestContent
+from api.schemas.usage import Usage
+from api.utils.context import request_context
+from api.utils.exceptions import ModelIsTooBusyException
+from api.utils.variables import ENDPOINT__CHAT_COMPLETIONS, ENDPOINT__EMBEDDINGS, PREFIX__REDIS_METRIC_TIMESERIE
+
+
+@pytest.fixture
+def model_provider():
+    model_provider = VllmModelProvider(
+        url="http://localhost:8000",
+        key=None,
+        timeout=10,
+        model_name="test-model",
+        model_hosting_zone=ProviderCarbonFootprintZone.WOR,
+        model_total_params=0,
+        model_active_params=0,
+    )
+    model_provider.id = 1
+    model_provider.cost_prompt_tokens = 0.0
+    model_provider.cost_completion_tokens = 0.0
+
+    return model_provider
+
+
+@pytest.fixture
+def tokenizer():
+    tokenizer = MagicMock()
+    tokenizer.USAGE_ENDPOINTS = [ENDPOINT__CHAT_COMPLETIONS, ENDPOINT__EMBEDDINGS]
+    tokenizer.sampling_rate = 1.0
+    tokenizer.get_prompt_tokens.return_value = 10
+    tokenizer.get_completion_tokens.return_value = 20
+
+    return tokenizer
+
+
+@pytest.fixture
+def request_content():
+    request_context.set(RequestContext(usage=Usage()))
+    return RequestContent(method="POST", endpoint=ENDPOINT__CHAT_COMPLETIONS, json={"messages": []}, model="test-model")
+
+
+def _get_usage(model_provider, tokenizer, request_content, upstream_usage):
+    with patch("api.clients.model._basemodelprovider.global_context", MagicMock(tokenizer=tokenizer)):
+        return model_provider._get_usage(request_content=request_content, response_data={}, stream=False, upstream_usage=upstream_usage)
+
+
+def test_get_usage_upstream_skips_tokenizer(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.UPSTREAM
+
+    usage = _get_usage(model_provider, tokenizer, request_content, upstream_usage={"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12})
+
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (5, 7, 12)
+    tokenizer.get_prompt_tokens.assert_not_called()
+    tokenizer.get_completion_tokens.assert_not_called()
+
+
+def test_get_usage_upstream_falls_back_to_tokenizer(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.UPSTREAM
+
+    usage = _get_usage(model_provider, tokenizer, request_content, upstream_usage=None)
+
+    assert (usage.prompt_tokens, usage.completion_tokens) == (10, 20)
+
+
+def test_get_usage_upstream_without_completion_tokens(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.UPSTREAM
+
+    usage = _get_usage(model_provider, tokenizer, request_content, upstream_usage={"prompt_tokens": 5, "total_tokens": 5})
+
+    assert (usage.prompt_tokens, usage.completion_tokens) == (5, 0)
+
+
+def test_get_usage_local_ignores_upstream(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.LOCAL
+
+    usage = _get_usage(model_provider, tokenizer, request_content, upstream_usage={"prompt_tokens": 5, "completion_tokens": 7})
+
+    assert (usage.prompt_tokens, usage.completion_tokens) == (10, 20)
+
+
+def test_get_usage_sampling_checks_and_keeps_upstream(model_provider, tokenizer, request_content, caplog):
+    model_provider.usage_source = RouterUsageSource.SAMPLING
+
+    usage = _get_usage(model_provider, tokenizer, request_content, upstream_usage={"prompt_tokens": 5, "completion_tokens": 7})
+
+    assert (usage.prompt_tokens, usage.completion_tokens) == (5, 7)
+    tokenizer.get_prompt_tokens.assert_called_once()
+    assert "differs from the API tokenizer count" in caplog.text
+
+
+def _prepare_stream_usage(model_provider, tokenizer, request_content):
+    with patch("api.clients.model._basemodelprovider.global_context", MagicMock(tokenizer=tokenizer)):
+        return model_provider._prepare_stream_usage(request_content=request_content)
+
+
+def test_prepare_stream_usage_upstream_requests_usage(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.UPSTREAM
+
+    token_counter, drop_usage, sampled = _prepare_stream_usage(model_provider, tokenizer, request_content)
+
+    # the completion is not counted while streamed, only if the provider does not report the usage
+    tokenizer.get_stream_token_counter.assert_called_once_with(lazy=True)
+    assert request_content.json["stream_options"] == {"include_usage": True}
+    assert (drop_usage, sampled) == (True, False)
+
+
+def test_prepare_stream_usage_upstream_keeps_usage_requested_by_client(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.UPSTREAM
+    request_content.json["stream_options"] = {"include_usage": True}
+
+    _, drop_usage, _ = _prepare_stream_usage(model_provider, tokenizer, request_content)
+
+    assert drop_usage is False
+
+
+def test_prepare_stream_usage_local_counts_completion(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.LOCAL
+
+    token_counter, drop_usage, sampled = _prepare_stream_usage(model_provider, tokenizer, request_content)
+
+    tokenizer.get_stream_token_counter.assert_called_once_with(lazy=False)
+    assert "stream_options" not in request_content.json
+    assert (drop_usage, sampled) == (False, False)
+
+
+def test_prepare_stream_usage_sampling_draws_before_stream(model_provider, tokenizer, request_content):
+    model_provider.usage_source = RouterUsageSource.SAMPLING
+
+    with patch("api.clients.model._basemodelprovider.random.random", return_value=0.5):
+        tokenizer.sampling_rate = 0.1
+        _, _, sampled = _prepare_stream_usage(model_provider, tokenizer, request_content)
+        assert sampled is False
+        tokenizer.get_stream_token_counter.assert_called_with(lazy=True)
+
+        tokenizer.sampling_rate = 1.0
+        _, _, sampled = _prepare_stream_usage(model_provider, tokenizer, request_content)
+        assert sampled is True
+        tokenizer.get_stream_token_counter.assert_called_with(lazy=False)
+
+
+@pytest.mark.asyncio
+async def test_log_performance_metric_creates_timeseries_once(model_provider, request_content):
+    model_provider.TIMESERIES_KEYS.clear()
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(side_effect=[[b"OK", ResponseError("key already exists"), [1, 1]], [[2, 2]]])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    await model_provider._log_performance_metric(redis_client=redis_client, ttft=100, latency=200)
+    await model_provider._log_performance_metric(redis_client=redis_client, ttft=100, latency=200)
+
+    assert pipeline.ts.return_value.create.call_count == 2  # only on first request
+    assert pipeline.ts.return_value.create.call_args.kwargs["labels"] == {"metric": "latency", "provider_id": "1"}
+    assert pipeline.ts.return_value.madd.call_count == 2
+    assert pipeline.execute.await_count == 2  # one round trip per request
+    assert model_provider.TIMESERIES_KEYS == {f"{PREFIX__REDIS_METRIC_TIMESERIE}:ttft:1", f"{PREFIX__REDIS_METRIC_TIMESERIE}:latency:1"}
+
+
+@pytest.mark.asyncio
+async def test_log_performance_metric_updates_peak_ewma_with_ttft_of_stream(model_provider, request_content):
+    metrics_aggregator = MagicMock()
+
+    with patch("api.clients.model._basemodelprovider.global_context", MagicMock(metrics_aggregator=metrics_aggregator)):
+        await model_provider._log_performance_metric(redis_client=MagicMock(), ttft=100, latency=5000)
+        await model_provider._log_performance_metric(redis_client=MagicMock(), ttft=None, latency=200)
+
+    key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:latency:1"
+    assert [call.kwargs for call in metrics_aggregator.record_peak_ewma.call_args_list] == [{"key": key, "value": 100}, {"key": key, "value": 200}]
+
+
+@pytest.mark.asyncio
+async def test_log_performance_metric_forgets_deleted_timeseries(model_provider, request_content):
+    model_provider.TIMESERIES_KEYS.clear()
+    key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:latency:1"
+    model_provider.TIMESERIES_KEYS.add(key)
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(return_value=[[ResponseError("the key does not exist")]])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    await model_provider._log_performance_metric(redis_client=redis_client, ttft=None, latency=200)
+
+    pipeline.ts.return_value.create.assert_not_called()
+    assert key not in model_provider.TIMESERIES_KEYS
+
+
+@pytest.mark.asyncio
+async def test_forward_request_releases_routing_lease_on_error(model_provider, request_content):
+    lease = SlotLease(provider_id=1, lease_id="abc", ttl=60)
+    model_provider.slot_lease = lease
+    request_context.get().slot_leases = [lease]
+    redis_client = AsyncMock()
+    async_client = AsyncMock()
+    async_client.request.side_effect = httpx.ConnectTimeout("timeout")
+
+    @asynccontextmanager
+    async def _get_http_client():
+        yield async_client
+
+    with patch.object(model_provider, "_get_http_client", _get_http_client), pytest.raises(ModelIsTooBusyException):
+        await model_provider.forward_request(request_content=request_content, redis_client=redis_client)
+
+    # released by the forward, not again at the end of the request
+    assert redis_client.eval.await_args.args[0] == SlotLease.RELEASE_SCRIPT
+    assert request_context.get().slot_leases == []
@@ -1,4 +1,5 @@
-from unittest.mock import AsyncMock, MagicMock
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from fastapi import Request
 import pytest
@@ -16,6 +17,14 @@ class MockUploadFile:
         self._content = content
 
 
+def _mock_json_request(body: bytes | None, headers: dict) -> MagicMock:
+    request = MagicMock(spec=Request)
+    request.body = AsyncMock(return_value=body)
+    request.json = AsyncMock(side_effect=lambda: json.loads(body))
+    request.headers = headers
+    return request
+
+
 class TestAccessController:
     @pytest.fixture
     def access_controller(self):
@@ -24,9 +33,7 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_valid_json(self, access_controller):
         """Test parsing valid JSON body"""
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=b'{"key": "value"}')
-        request.headers = {"content-type": "application/json"}
+        request = _mock_json_request(body=b'{"key": "value"}', headers={"content-type": "application/json"})
 
         result = await access_controller._safely_parse_body(request)
 
@@ -35,9 +42,7 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_empty_body(self, access_controller):
         """Test parsing empty body"""
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=b"")
-        request.headers = {"content-type": "application/json"}
+        request = _mock_json_request(body=b"", headers={"content-type": "application/json"})
 
         result = await access_controller._safely_parse_body(request)
 
@@ -87,9 +92,7 @@ class TestAccessController:
             b"<</Type/Catalog/Pages 2 0 R/Lang(fr-FR) /StructTreeRoot 50 0 R/MarkInfo<</Marked true>>>>\r\n"
         )
 
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=pdf_multipart_body)
-        request.headers = {"content-type": "application/json"}  # Mismatched content type
+        request = _mock_json_request(body=pdf_multipart_body, headers={"content-type": "application/json"})  # Mismatched content type
 
         # This should not raise UnicodeDecodeError anymore
         result = await access_controller._safely_parse_body(request)
@@ -111,9 +114,7 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_invalid_json(self, access_controller):
         """Test parsing invalid JSON"""
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=b'{"invalid": json}')
-        request.headers = {"content-type": "application/json"}
+        request = _mock_json_request(body=b'{"invalid": json}', headers={"content-type": "application/json"})
 
         result = await access_controller._safely_parse_body(request)
 
@@ -122,11 +123,9 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_utf8_with_replacement(self, access_controller):
         """Test that invalid UTF-8 bytes are replaced, not cause errors"""
-        request = MagicMock(spec=Request)
         # Create a string with invalid UTF-8 that would still be parseable as JSON after replacement
         invalid_utf8_json = b'{"message": "Hello \xb5 World"}'
-        request.body = AsyncMock(return_value=invalid_utf8_json)
-        request.headers = {"content-type": "application/json"}
+        request = _mock_json_request(body=invalid_utf8_json, headers={"content-type": "application/json"})
 
         result = await access_controller._safely_parse_body(request)
 
@@ -138,9 +137,7 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_none_body(self, access_controller):
         """Test parsing None body"""
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=None)
-        request.headers = {"content-type": "application/json"}
+        request = _mock_json_request(body=None, headers={"content-type": "application/json"})
 
         result = await access_controller._safely_parse_body(request)
 
@@ -149,11 +146,26 @@ class TestAccessController:
     @pytest.mark.asyncio
     async def test_safely_parse_body_no_content_type(self, access_controller):
         """Test parsing when no content-type header is present"""
-        request = MagicMock(spec=Request)
-        request.body = AsyncMock(return_value=b'{"key": "value"}')
-        request.headers = {}  # No content-type header
+        request = _mock_json_request(body=b'{"key": "value"}', headers={})  # No content-type header
 
         result = await access_controller._safely_parse_body(request)
 
         # Should default to JSON parsing
         assert result == {"key": "value"}
+
+    @pytest.mark.asyncio
+    async def test_safely_parse_body_reuses_endpoint_json_decoding(self, access_controller):
+        """Test that the JSON body already decoded for the endpoint is not decoded again"""
+        body = b'{"model": "my-model", "messages": []}'
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request(scope={"type": "http", "method": "POST", "headers": [(b"content-type", b"application/json")]}, receive=receive)
+        endpoint_body = await request.json()  # decoded by FastAPI before the dependencies
+
+        with patch("json.loads") as loads:
+            result = await access_controller._safely_parse_body(request)
+
+        loads.assert_not_called()
+        assert result is endpoint_body
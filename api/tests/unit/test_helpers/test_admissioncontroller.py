@@ -0,0 +1,137 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from api.helpers._admissioncontroller import AdmissionController
+from api.helpers._slotlease import SlotLease
+from api.schemas.admin.providers import Provider
+from api.schemas.admin.routers import RouterLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils import routing as routing_module
+from api.utils.exceptions import ModelIsTooBusyException
+
+
+@pytest.mark.asyncio
+async def test_wake_by_priority_then_arrival():
+    controller = AdmissionController()
+    low = asyncio.create_task(controller.wait(provider_ids=[1], priority=0, arrival=0.0, timeout=1))
+    late = asyncio.create_task(controller.wait(provider_ids=[1, 2], priority=2, arrival=2.0, timeout=1))
+    early = asyncio.create_task(controller.wait(provider_ids=[1, 2], priority=2, arrival=1.0, timeout=1))
+    other = asyncio.create_task(controller.wait(provider_ids=[3], priority=4, arrival=0.0, timeout=1))
+    await asyncio.sleep(0)
+
+    controller.wake(provider_id=1)
+    assert await early is True
+    controller.wake(provider_id=2)
+    assert await late is True
+    controller.wake(provider_id=1)
+    assert await low is True
+
+    assert not other.done()
+    other.cancel()
+
+
+@pytest.mark.asyncio
+async def test_wait_timeout():
+    controller = AdmissionController()
+    assert await controller.wait(provider_ids=[1], priority=0, arrival=0.0, timeout=0.01) is False
+    assert controller.waiters == []
+
+    controller.wake(provider_id=1)  # nobody is waiting anymore
+
+
+@pytest.mark.asyncio
+async def test_wake_member_wakes_only_the_new_head_of_the_queue():
+    controller = AdmissionController()
+    head = asyncio.create_task(controller.wait(provider_ids=[1], priority=0, arrival=2.0, timeout=1, member="123:head"))
+    other = asyncio.create_task(controller.wait(provider_ids=[1], priority=0, arrival=1.0, timeout=1, member="123:other"))
+    await asyncio.sleep(0)
+
+    controller.wake_member(member="123:head")
+    assert await head is True
+    controller.wake_member(member="123:unknown")  # waiting in another worker
+    await asyncio.sleep(0)
+
+    assert not other.done()
+    other.cancel()
+
+
+def _provider(provider_id: int) -> Provider:
+    return Provider.model_construct(id=provider_id, qos_metric=Metric.WAITING, qos_limit=1)
+
+
+async def _acquire(provider_id, ttl, **kwargs):
+    return SlotLease(provider_id=provider_id, lease_id="lease", ttl=ttl)
+
+
+@pytest.mark.asyncio
+async def test_routing_falls_back_to_admitted_provider():
+    async def qos(provider_id, **kwargs):
+        return provider_id == 2
+
+    with (
+        patch.object(routing_module, "apply_async_load_balancing", AsyncMock(return_value=(1, 0))) as load_balancing,
+        patch.object(routing_module, "apply_async_qos_policy", AsyncMock(side_effect=qos)),
+        patch.object(routing_module.SlotLease, "acquire", AsyncMock(side_effect=_acquire)),
+    ):
+        lease = await routing_module.apply_routing_without_queuing(
+            providers=[_provider(1), _provider(2)],
+            load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+            load_balancing_metric=Metric.TTFT,
+            max_retries=1,
+            retry_countdown=1,
+            redis_client=AsyncMock(),
+        )
+
+    assert lease.provider_id == 2
+    load_balancing.assert_awaited_once()  # a single provider accepts the request
+
+
+@pytest.mark.asyncio
+async def test_routing_admits_waiting_request_on_slot_release():
+    controller = AdmissionController()
+    released = False
+
+    async def qos(provider_id, **kwargs):
+        return released
+
+    with (
+        patch.object(routing_module, "apply_async_qos_policy", AsyncMock(side_effect=qos)),
+        patch.object(routing_module.SlotLease, "acquire", AsyncMock(side_effect=_acquire)),
+        patch.object(routing_module.global_context, "admission_controller", controller),
+    ):
+        task = asyncio.create_task(
+            routing_module.apply_routing_without_queuing(
+                providers=[_provider(1)],
+                load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+                load_balancing_metric=Metric.TTFT,
+                max_retries=10,
+                retry_countdown=10,
+                redis_client=AsyncMock(),
+                priority=1,
+            )
+        )
+        await asyncio.sleep(0.01)
+        assert len(controller.waiters) == 1
+
+        released = True
+        controller.wake(provider_id=1)
+        assert (await asyncio.wait_for(task, timeout=0.1)).provider_id == 1
+
+
+@pytest.mark.asyncio
+async def test_routing_too_busy_after_timeout():
+    with (
+        patch.object(routing_module, "apply_async_qos_policy", AsyncMock(return_value=False)),
+        patch.object(routing_module.global_context, "admission_controller", AdmissionController()),
+    ):
+        with pytest.raises(ModelIsTooBusyException):
+            await routing_module.apply_routing_without_queuing(
+                providers=[_provider(1)],
+                load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+                load_balancing_metric=Metric.TTFT,
+                max_retries=1,
+                retry_countdown=0.05,
+                redis_client=AsyncMock(),
+            )
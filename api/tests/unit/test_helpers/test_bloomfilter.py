@@ -0,0 +1,20 @@
+from api.helpers._bloomfilter import BloomFilter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom_filter = BloomFilter(capacity=1000)
+    for item in range(0, 2000, 2):
+        bloom_filter.add(item)
+
+    assert all(item in bloom_filter for item in range(0, 2000, 2))
+    assert bloom_filter.count == 1000
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for item in range(1000):
+        bloom_filter.add(item)
+
+    false_positives = sum(item in bloom_filter for item in range(1000, 11000))
+
+    assert false_positives < 200  # 1% expected on 10,000 items
@@ -0,0 +1,31 @@
+import pytest
+
+from api.helpers._httpclientpool import HttpClientPool
+
+
+@pytest.mark.asyncio
+async def test_get_client_reuses_client_by_url():
+    pool = HttpClientPool(max_connections=10, max_keepalive_connections=5, keepalive_expiry=5.0)
+
+    client_a = pool.get_client(url="http://provider-a:8000")
+    client_b = pool.get_client(url="http://provider-b:8000")
+
+    assert pool.get_client(url="http://provider-a:8000") is client_a
+    assert client_a is not client_b
+
+    await pool.close()
+
+    assert client_a.is_closed and client_b.is_closed
+    assert pool.clients == {}
+
+
+@pytest.mark.asyncio
+async def test_get_client_recreates_closed_client():
+    pool = HttpClientPool(max_connections=10, max_keepalive_connections=5, keepalive_expiry=5.0)
+
+    client = pool.get_client(url="http://provider-a:8000")
+    await client.aclose()
+
+    assert pool.get_client(url="http://provider-a:8000") is not client
+
+    await pool.close()
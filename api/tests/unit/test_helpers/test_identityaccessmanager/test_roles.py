@@ -138,8 +138,8 @@ async def test_get_roles_with_details(postgres_session: AsyncSession, iam: Ident
     ids_result = _Result(all_rows=[(1,), (2,)])
     # Step 2: roles with counts
     roles_rows = [
-        _RowDict({"id": 1, "name": "admin", "created": 1, "updated": 2, "users": 3}),
-        _RowDict({"id": 2, "name": "user", "created": 4, "updated": 5, "users": 0}),
+        _RowDict({"id": 1, "name": "admin", "routing_weight": 2.0, "created": 1, "updated": 2, "users": 3}),
+        _RowDict({"id": 2, "name": "user", "routing_weight": 1.0, "created": 4, "updated": 5, "users": 0}),
     ]
     roles_result = _Result(all_rows=roles_rows)
     # Step 3: limits
@@ -162,6 +162,7 @@ async def test_get_roles_with_details(postgres_session: AsyncSession, iam: Ident
     assert len(roles) == 2
     first = next(r for r in roles if r.id == 1)
     assert first.users == 3
+    assert first.routing_weight == 2.0
     assert any(limit.router == 1 and limit.type == LimitType.TPM for limit in first.limits)
     assert PermissionType.ADMIN in first.permissions
 
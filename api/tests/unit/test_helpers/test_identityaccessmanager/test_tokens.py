@@ -6,6 +6,7 @@ import pytest
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.helpers._bloomfilter import BloomFilter
 from api.helpers._identityaccessmanager import IdentityAccessManager
 from api.utils.exceptions import (
     InvalidTokenExpirationException,
@@ -89,7 +90,8 @@ async def test_refresh_token_updates_usage_and_deletes_old(postgres_session: Asy
     # old tokens with same name
     postgres_session.execute = AsyncMock()
     postgres_session.execute.side_effect = [
-        _Result(all_rows=[(10,), (11,)]),  # select old token ids
+        _Result(all_rows=[(10, None), (11, None)]),  # delete old tokens, returning ids and expirations
+        None,  # insert revoked tokens
         _Result(scalar_one=MagicMock(id=1)),  # select user in create_token
         _Result(scalar_one=100),  # insert new token id
         None,  # update new token with masked token
@@ -117,7 +119,7 @@ async def test_delete_token_not_found(postgres_session: AsyncSession):
 @pytest.mark.asyncio
 async def test_delete_token_success(postgres_session: AsyncSession):
     iam = IdentityAccessManager(master_key="secret")
-    postgres_session.execute = AsyncMock(side_effect=[_Result(scalar_one=1), None])
+    postgres_session.execute = AsyncMock(side_effect=[_Result(scalar_one=1), _Result(all_rows=[(2, None)]), None])
 
     await iam.delete_token(postgres_session, user_id=1, token_id=2)
     postgres_session.commit.assert_awaited()
@@ -126,7 +128,7 @@ async def test_delete_token_success(postgres_session: AsyncSession):
 @pytest.mark.asyncio
 async def test_delete_tokens_by_name(postgres_session: AsyncSession):
     iam = IdentityAccessManager(master_key="secret")
-    postgres_session.execute = AsyncMock(return_value=None)
+    postgres_session.execute = AsyncMock(return_value=_Result(all_rows=[(3, None)]))
     await iam.delete_tokens(postgres_session, user_id=1, name="ci")
     postgres_session.commit.assert_awaited()
 
@@ -205,7 +207,158 @@ async def test_check_token_invalid_or_expired(postgres_session: AsyncSession):
 @pytest.mark.asyncio
 async def test_invalidate_token_sets_now(postgres_session: AsyncSession):
     iam = IdentityAccessManager(master_key="secret")
-    postgres_session.execute = AsyncMock(return_value=None)
+    expires = dt.datetime(2030, 1, 1)
+    postgres_session.execute = AsyncMock(side_effect=[_Result(all_rows=[(1, expires)]), None, None])
 
     await iam.invalidate_token(postgres_session, token_id=1, user_id=2)
     postgres_session.commit.assert_awaited()
+
+    # the revocation is kept until the expiration of the token claims, not until the invalidation
+    insert = postgres_session.execute.await_args_list[2].kwargs["statement"]
+    assert insert.compile().params == {"token_id_m0": 1, "expires_m0": expires}
+
+
+@pytest.mark.asyncio
+async def test_get_token_user_info_cached_until_token_revoked(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret", user_info_cache_ttl=60)
+    user_info = MagicMock(id=1)
+    postgres_session.execute = AsyncMock(side_effect=[_Result(scalar_one=2), _Result(all_rows=[(2, None)]), None])
+
+    with (
+        patch.object(iam, "_decode_token", return_value={"user_id": 1, "token_id": 2, "expires": None}),
+        patch.object(iam, "check_token", AsyncMock(return_value=(1, 2, "dev"))) as check_token,
+        patch.object(iam, "get_user_info", AsyncMock(return_value=user_info)) as get_user_info,
+    ):
+        assert await iam.get_token_user_info(postgres_session, token="sk-abcdef") == (user_info, 2, "dev")
+        assert await iam.get_token_user_info(postgres_session, token="sk-abcdef") == (user_info, 2, "dev")
+        assert check_token.await_count == 1
+        assert get_user_info.await_count == 1
+
+        # a revoked token is resolved from the database again
+        await iam.delete_token(postgres_session, user_id=1, token_id=2)
+        check_token.return_value = (None, None, None)
+        assert await iam.get_token_user_info(postgres_session, token="sk-abcdef") == (None, None, None)
+
+
+@pytest.mark.asyncio
+async def test_get_token_user_info_not_cached_after_token_expiration(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret", user_info_cache_ttl=60)
+
+    with (
+        patch.object(iam, "_decode_token", return_value={"user_id": 1, "token_id": 2, "expires": _ts_now() - 1}),
+        patch.object(iam, "check_token", AsyncMock(return_value=(1, 2, "dev"))) as check_token,
+        patch.object(iam, "get_user_info", AsyncMock(return_value=MagicMock(id=1))),
+    ):
+        await iam.get_token_user_info(postgres_session, token="sk-abcdef")
+        await iam.get_token_user_info(postgres_session, token="sk-abcdef")
+
+    assert check_token.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_token_user_info_discards_user_info_invalidated_while_loading(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret", user_info_cache_ttl=60)
+
+    async def get_user_info(postgres_session, user_id):
+        await iam.invalidate_user_info(user_id=user_id)  # e.g. the user is updated by another request
+        return MagicMock(id=user_id)
+
+    with (
+        patch.object(iam, "_decode_token", return_value={"user_id": 1, "token_id": 2, "expires": None}),
+        patch.object(iam, "check_token", AsyncMock(return_value=(1, 2, "dev"))),
+        patch.object(iam, "get_user_info", side_effect=get_user_info),
+    ):
+        await iam.get_token_user_info(postgres_session, token="sk-abcdef")
+
+    assert iam.user_info_cache == {}
+
+
+@pytest.mark.asyncio
+async def test_invalidate_user_info_publishes_invalidation(postgres_session: AsyncSession):
+    redis_client = AsyncMock()
+    iam = IdentityAccessManager(master_key="secret", redis_pool=MagicMock(), user_info_cache_ttl=60)
+    iam.user_info_cache[2] = MagicMock(user_info=MagicMock(id=1))
+    iam.user_info_cache[3] = MagicMock(user_info=MagicMock(id=4))
+
+    with patch("api.helpers._identityaccessmanager.AsyncRedis", return_value=redis_client):
+        await iam.invalidate_user_info(user_id=1)
+
+    assert list(iam.user_info_cache) == [3]
+    redis_client.publish.assert_awaited_once_with(IdentityAccessManager.USER_INFO_CHANNEL, "user:1")
+
+
+@pytest.mark.asyncio
+async def test_check_token_without_database_unless_revoked(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret")
+    postgres_session.execute = AsyncMock(return_value=_Result(all_rows=[(1, 5)]))
+    await iam.sync_revoked_tokens(postgres_session)
+    postgres_session.execute = AsyncMock(return_value=_Result(all_rows=[]))
+
+    # valid token: signature and expiration are checked locally
+    token = iam._encode_token(user_id=1, token_id=2, name="dev", expires=_ts_now() + 100)
+    assert await iam.check_token(postgres_session, token=token) == (1, 2, "dev")
+    postgres_session.execute.assert_not_awaited()
+
+    # expired token
+    token = iam._encode_token(user_id=1, token_id=2, name="dev", expires=_ts_now() - 1)
+    assert await iam.check_token(postgres_session, token=token) == (None, None, None)
+    postgres_session.execute.assert_not_awaited()
+
+    # revoked token: confirmed in the database
+    token = iam._encode_token(user_id=1, token_id=5, name="dev")
+    assert await iam.check_token(postgres_session, token=token) == (None, None, None)
+    postgres_session.execute.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_sync_revoked_tokens_reads_revocations_committed_late(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret")
+
+    # the revocation 2 is committed after the revocation 3
+    postgres_session.execute = AsyncMock(return_value=_Result(all_rows=[(1, 10), (3, 30)]))
+    await iam.sync_revoked_tokens(postgres_session)
+    postgres_session.execute = AsyncMock(return_value=_Result(all_rows=[(2, 20), (3, 30)]))
+    await iam.sync_revoked_tokens(postgres_session)
+
+    assert all(token_id in iam.revoked_tokens for token_id in [10, 20, 30])
+    assert iam.revoked_tokens.count == 3
+    assert iam.revoked_tokens_offset == 3
+
+
+@pytest.mark.asyncio
+async def test_delete_token_records_revocation_in_transaction(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret")
+    postgres_session.execute = AsyncMock(side_effect=[_Result(scalar_one=2), _Result(all_rows=[(2, None)]), None])
+
+    await iam.delete_token(postgres_session, user_id=1, token_id=2)
+
+    statements = [str(call.kwargs["statement"]) for call in postgres_session.execute.await_args_list]
+    assert statements[2].startswith("INSERT INTO revoked_token")
+    postgres_session.commit.assert_awaited_once()
+    assert 2 in iam.revoked_tokens
+
+
+@pytest.mark.asyncio
+async def test_sync_revoked_tokens_prunes_revocations_of_expired_tokens(postgres_session: AsyncSession):
+    iam = IdentityAccessManager(master_key="secret")
+    iam.REVOKED_TOKENS_CAPACITY = 4
+    iam.revoked_tokens = BloomFilter(capacity=4)
+
+    # the revocations of the expired tokens are deleted at the first sync, and are not read
+    postgres_session.execute = AsyncMock(side_effect=[None, _Result(all_rows=[(1, 10), (2, 20)])])
+    await iam.sync_revoked_tokens(postgres_session)
+
+    statements = [str(call.kwargs["statement"]) for call in postgres_session.execute.await_args_list]
+    assert statements[0].startswith("DELETE FROM revoked_token WHERE revoked_token.expires < now()")
+    assert "revoked_token.expires IS NULL OR revoked_token.expires >= now()" in statements[1]
+    postgres_session.commit.assert_awaited_once()
+
+    # when the filter is full, the revocations of the tokens expired since are deleted and the filter is rebuilt from the others
+    postgres_session.execute = AsyncMock(side_effect=[_Result(all_rows=[(3, 30), (4, 40), (5, 50)]), None, _Result(all_rows=[(4, 40), (5, 50)])])
+    await iam.sync_revoked_tokens(postgres_session)
+
+    statements = [str(call.kwargs["statement"]) for call in postgres_session.execute.await_args_list]
+    assert statements[1].startswith("DELETE FROM revoked_token")
+    assert iam.revoked_tokens.count == 2
+    assert iam.revoked_tokens.capacity == 4
+    assert iam.revoked_tokens_offset == 5
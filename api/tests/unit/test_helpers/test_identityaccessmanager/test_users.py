@@ -278,7 +278,7 @@ async def test_get_user_info_by_id_success(postgres_session: AsyncSession, iam:
 
     # Sequence: get_users -> roles rows, limits rows, permissions rows (get_roles won't fetch ids when role_id provided)
     roles_rows = [
-        _RowDict({"id": 2, "name": "role", "created": 100, "updated": 101, "users": 1}),
+        _RowDict({"id": 2, "name": "role", "routing_weight": 1.0, "created": 100, "updated": 101, "users": 1}),
     ]
 
     from api.schemas.admin.roles import LimitType, PermissionType
@@ -357,7 +357,7 @@ async def test_get_user_info_by_email_success(postgres_session: AsyncSession, ia
 
     # No ids page when role_id is provided to get_roles
     roles_rows = [
-        _RowDict({"id": 3, "name": "role", "created": 200, "updated": 201, "users": 1}),
+        _RowDict({"id": 3, "name": "role", "routing_weight": 1.0, "created": 200, "updated": 201, "users": 1}),
     ]
     limits_iter = [_LimitRow(3, 202, LimitType.RPM, 200)]
     permissions_iter = [
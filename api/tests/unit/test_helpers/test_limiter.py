@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from unittest.mock import AsyncMock, MagicMock, call, patch
 
@@ -11,6 +12,7 @@ from api.schemas.admin.roles import Limit, LimitType
 from api.schemas.core.configuration import LimitingStrategy
 from api.schemas.me.info import UserInfo
 from api.utils.exceptions import InsufficientPermissionException, ModelNotFoundException, RateLimitExceeded
+from api.utils.variables import PREFIX__REDIS_RATE_LIMIT
 
 logger = logging.getLogger(__name__)
 
@@ -468,24 +470,13 @@ async def test_limiter_check_user_limits_rpm_exceeded(strategy):
 
         user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
 
-        # Mock hit/remaining
-        # hit returns False for RPM check (first call is RPM check)
-        # Sequence of calls: hit(RPM), hit(RPD), [hit(TPM), hit(TPD)]
-        # We need to simulate hit call for RPM returning False
-
-        # Using side_effect to return False for specific call is safer
-        async def hit_side_effect(user_id, router_id, type, value, cost=1):
-            if type == LimitType.RPM:
-                return False
-            return True
-
-        limiter.hit = AsyncMock(side_effect=hit_side_effect)
-        limiter.remaining = AsyncMock(return_value=0)
+        # The script returns the index of the first exceeded limit (RPM, RPD), then the remaining amount of each limit
+        limiter.redis_client.eval = AsyncMock(return_value=[1, 0, 999])
 
         with pytest.raises(RateLimitExceeded) as exc_info:
             await limiter.check_user_limits(user_info=user_info, router_id=1)
 
-        assert "requests per minute exceeded" in str(exc_info.value.detail)
+        assert "requests per minute exceeded (remaining: 0)" in str(exc_info.value.detail)
 
 
 @pytest.mark.asyncio
@@ -517,15 +508,23 @@ async def test_limiter_check_user_limits_with_prompt_tokens_success(strategy):
         ]
         user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
 
-        limiter.hit = AsyncMock(return_value=True)
+        limiter.redis_client.eval = AsyncMock(return_value=[0, 99, 999, 450, 4950])
 
         await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=50)
 
-        called_types = [call.kwargs["type"] for call in limiter.hit.call_args_list]
-        assert LimitType.RPM in called_types
-        assert LimitType.RPD in called_types
-        assert LimitType.TPM in called_types
-        assert LimitType.TPD in called_types
+        # all the limits are checked and consumed in a single round trip
+        limiter.redis_client.eval.assert_awaited_once()
+        script, numkeys, *keys_and_args = limiter.redis_client.eval.await_args.args
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        assert script == Limiter.HIT_SCRIPT and numkeys == 8
+        assert args[0] == strategy.value
+        assert args[2:] == [100, 60, 1, 1000, 86400, 1, 500, 60, 50, 5000, 86400, 50]
+
+        key = f"{PREFIX__REDIS_RATE_LIMIT}:{LimitType.TPD.value}:1:1/5000/1/day"
+        if strategy == LimitingStrategy.SLIDING_WINDOW:
+            assert keys[6:] == [f"LIMITS:{{LIMITER/{key}}}", f"LIMITS:{{LIMITER/{key}}}/-1"]
+        else:
+            assert keys[6:] == [f"LIMITS:LIMITER/{key}", f"LIMITS:LIMITER/{key}"]
 
 
 @pytest.mark.asyncio
@@ -549,13 +548,7 @@ async def test_limiter_check_user_limits_rpd_exceeded(strategy):
         ]
         user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
 
-        async def hit_side_effect(user_id, router_id, type, value, cost=1):
-            if type == LimitType.RPD:
-                return False
-            return True
-
-        limiter.hit = AsyncMock(side_effect=hit_side_effect)
-        limiter.remaining = AsyncMock(return_value=0)
+        limiter.redis_client.eval = AsyncMock(return_value=[2, 99, 0])
 
         with pytest.raises(RateLimitExceeded) as exc_info:
             await limiter.check_user_limits(user_info=user_info, router_id=1)
@@ -583,15 +576,169 @@ async def test_limiter_check_user_limits_tpd_exceeded(strategy):
         ]
         user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
 
-        async def hit_side_effect(user_id, router_id, type, value, cost=1):
-            if type == LimitType.TPD:
-                return False
-            return True
-
-        limiter.hit = AsyncMock(side_effect=hit_side_effect)
-        limiter.remaining = AsyncMock(return_value=0)
+        limiter.redis_client.eval = AsyncMock(return_value=[4, 99, 999, 400, 0])
 
         with pytest.raises(RateLimitExceeded) as exc_info:
             await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=100)
 
         assert "input tokens per day exceeded" in str(exc_info.value.detail)
+
+
+@pytest.mark.asyncio
+async def test_limiter_hit_limits_fails_open_on_redis_error():
+    """Test the request is not limited if the rate limits cannot be checked."""
+    mock_redis_pool = MagicMock()
+    mock_redis_pool.url = "redis://localhost:6379"
+
+    with patch("api.helpers._limiter.storage.RedisStorage") as MockStorage, patch("api.helpers._limiter.Redis") as MockRedis:
+        MockStorage.return_value = AsyncMock(spec=RedisStorage)
+        MockRedis.return_value = AsyncMock()
+
+        limiter = Limiter(mock_redis_pool, LimitingStrategy.FIXED_WINDOW)
+        limiter.redis_client.eval = AsyncMock(side_effect=RedisError("Boom"))
+
+        exceeded, remaining = await limiter.hit_limits(user_id=1, router_id=1, limits=[(LimitType.RPM, 10, 1)])
+
+        assert exceeded is None
+        assert remaining == [None]
+
+
+# =========================== LOCAL PRE-ADMISSION TIER ============================
+
+
+@pytest.mark.asyncio
+async def test_limiter_check_user_limits_local_budget():
+    """Test the requests are admitted with the budget leased locally, with a single Redis round trip per block."""
+    mock_redis_pool = MagicMock()
+    mock_redis_pool.url = "redis://localhost:6379"
+
+    with patch("api.helpers._limiter.storage.RedisStorage") as MockStorage, patch("api.helpers._limiter.Redis") as MockRedis:
+        MockStorage.return_value = AsyncMock(spec=RedisStorage)
+        MockRedis.return_value = AsyncMock()
+
+        limiter = Limiter(mock_redis_pool, LimitingStrategy.FIXED_WINDOW, local_share=0.1)
+        limiter.redis_client.eval = AsyncMock(return_value=[0, 90, 990, 450, 4950])
+
+        limits = [
+            Limit(router=1, type=LimitType.RPM, value=100),
+            Limit(router=1, type=LimitType.RPD, value=1000),
+            Limit(router=1, type=LimitType.TPM, value=500),
+            Limit(router=1, type=LimitType.TPD, value=5000),
+        ]
+        user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
+
+        await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=10)
+        await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=10)
+
+        # a block of 10% of the per minute limits is leased once
+        limiter.redis_client.eval.assert_awaited_once()
+        numkeys = limiter.redis_client.eval.await_args.args[1]
+        assert limiter.redis_client.eval.await_args.args[2 + numkeys + 2 :] == (100, 60, 10, 1000, 86400, 10, 500, 60, 50, 5000, 86400, 50)
+
+        # the next block is leased in background once half of the block is spent
+        await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=10)
+        await asyncio.gather(*limiter.refill_tasks)
+        assert limiter.redis_client.eval.await_count == 2
+        budget = list(limiter.local_budgets.values())[0]
+        assert (budget.requests, budget.tokens) == (17, 70)
+
+
+@pytest.mark.asyncio
+async def test_limiter_check_user_limits_local_budget_falls_back_to_redis():
+    """Test the limits are checked exactly in Redis when a block cannot be leased."""
+    mock_redis_pool = MagicMock()
+    mock_redis_pool.url = "redis://localhost:6379"
+
+    with patch("api.helpers._limiter.storage.RedisStorage") as MockStorage, patch("api.helpers._limiter.Redis") as MockRedis:
+        MockStorage.return_value = AsyncMock(spec=RedisStorage)
+        MockRedis.return_value = AsyncMock()
+
+        limiter = Limiter(mock_redis_pool, LimitingStrategy.FIXED_WINDOW, local_share=0.1)
+        limiter.redis_client.eval = AsyncMock(side_effect=[[3, 90, 990, 20, 4000], [0, 89, 989, 0, 3980]])
+
+        limits = [
+            Limit(router=1, type=LimitType.RPM, value=100),
+            Limit(router=1, type=LimitType.RPD, value=1000),
+            Limit(router=1, type=LimitType.TPM, value=500),
+            Limit(router=1, type=LimitType.TPD, value=5000),
+        ]
+        user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
+
+        await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=20)
+
+        assert limiter.redis_client.eval.await_count == 2
+        assert limiter.redis_client.eval.await_args.args[-1] == 20  # exact cost of the request
+        assert limiter.local_budgets == {}
+
+
+class _FixedWindowRedis:
+    """Counters of the fixed window strategy of `Limiter.HIT_SCRIPT`, shared by several limiters as by several API workers."""
+
+    def __init__(self):
+        self.counters = {}
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        keys, args = keys_and_args[:numkeys:2], keys_and_args[numkeys:]
+        limits = [args[2 + 3 * i : 5 + 3 * i] for i in range(len(keys))]
+        refunds = args[2 + 3 * len(keys) :] or [0] * len(keys)
+        for key, refund in zip(keys, refunds):
+            self.counters[key] = self.counters.get(key, 0) - min(refund, self.counters.get(key, 0))
+
+        remaining = [amount - self.counters.get(key, 0) for key, (amount, _, _) in zip(keys, limits)]
+        for i, (key, (amount, _, cost)) in enumerate(zip(keys, limits)):
+            if cost > 0 and self.counters.get(key, 0) + cost > amount:
+                return [i + 1, *remaining]
+
+        for key, (_, _, cost) in zip(keys, limits):
+            self.counters[key] = self.counters.get(key, 0) + cost
+        return [0, *[value - cost for value, (_, _, cost) in zip(remaining, limits)]]
+
+
+@pytest.mark.asyncio
+async def test_limiter_check_user_limits_local_budget_not_rejected_below_limits():
+    """Test a user is not rejected before consuming its limits, the budget leased by the workers but not spent being given back."""
+    mock_redis_pool = MagicMock()
+    mock_redis_pool.url = "redis://localhost:6379"
+
+    with patch("api.helpers._limiter.storage.RedisStorage") as MockStorage, patch("api.helpers._limiter.Redis") as MockRedis:
+        MockStorage.return_value = AsyncMock(spec=RedisStorage)
+        MockRedis.return_value = AsyncMock()
+
+        redis_client = _FixedWindowRedis()
+        workers = [Limiter(mock_redis_pool, LimitingStrategy.FIXED_WINDOW, local_share=0.1) for _ in range(4)]
+        for limiter in workers:
+            limiter.redis_client = redis_client
+
+        limits = [
+            Limit(router=1, type=LimitType.RPM, value=10),
+            Limit(router=1, type=LimitType.RPD, value=1000),
+            Limit(router=1, type=LimitType.TPM, value=500),
+            Limit(router=1, type=LimitType.TPD, value=5000),
+        ]
+        user_info = UserInfo(id=1, email="u@test.com", name="User", permissions=[], limits=limits, expires=None, created=0, updated=0)
+
+        async def send(limiter):
+            await limiter.check_user_limits(user_info=user_info, router_id=1, prompt_tokens=0)
+            await asyncio.gather(*limiter.refill_tasks)
+
+        # each worker admits a request and leases the next block in background
+        for limiter in workers:
+            await send(limiter)
+        rpm_key = [key for key in redis_client.counters if f":{LimitType.RPM.value}:" in key][0]
+        assert redis_client.counters[rpm_key] == 8
+
+        # the unused blocks of the workers are given back when they expire, then the user sends all its requests to the same worker
+        for limiter in workers:
+            for budget in limiter.local_budgets.values():
+                budget.expires = 0
+            await limiter._release_expired_local_budgets()
+        assert redis_client.counters[rpm_key] == 4
+
+        for _ in range(6):
+            await send(workers[0])
+
+        with pytest.raises(RateLimitExceeded):
+            await send(workers[0])
+
+        # the requests without tokens do not lease tokens
+        assert all(f":{LimitType.TPM.value}:" not in key and f":{LimitType.TPD.value}:" not in key for key in redis_client.counters)
@@ -0,0 +1,97 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.helpers._metricsaggregator import MetricsAggregator
+
+
+def _redis_client(results=None):
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(return_value=results or [[]])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    return redis_client, pipeline
+
+
+def test_record_keeps_last_samples():
+    aggregator = MetricsAggregator(flush_interval=1000, precision=10, buffer_size=3)
+
+    for value in range(5):
+        aggregator.record(key="ts:ttft:1", value=value)
+
+    assert list(aggregator.buffers["ts:ttft:1"]) == [2, 3, 4]
+
+
+def test_summarize_keeps_extremes_and_percentiles():
+    aggregator = MetricsAggregator(flush_interval=1000, precision=5)
+
+    assert aggregator.summarize(values=[3, 1, 2]) == [1, 2, 3]
+    assert aggregator.summarize(values=list(range(101))) == [0, 25, 50, 75, 100]
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_summary_with_distinct_timestamps():
+    aggregator = MetricsAggregator(flush_interval=1000, precision=3)
+    aggregator.worker = "host-1"
+    for value in range(10):
+        aggregator.record(key="ts:ttft:1", value=value)
+    aggregator.record(key="ts:latency:1", value=200)
+    redis_client, pipeline = _redis_client(results=[b"OK", b"OK", [1, 1, 1, 1]])
+
+    with patch("api.helpers._metricsaggregator.time.time", return_value=10.0):
+        await aggregator.flush(redis_client=redis_client)
+
+    samples = pipeline.ts.return_value.madd.call_args.kwargs["ktv_tuples"]
+    # the data points are written in the series of the worker, not overwritten by the flushes of the other workers
+    assert samples == [("ts:ttft:1:host-1", 9998, 0), ("ts:ttft:1:host-1", 9999, 4), ("ts:ttft:1:host-1", 10000, 9), ("ts:latency:1:host-1", 10000, 200)]  # fmt: off
+    assert pipeline.ts.return_value.create.call_count == 2
+    assert pipeline.ts.return_value.create.call_args.kwargs["labels"] == {"metric": "latency", "provider_id": "1", "worker": "host-1"}
+    assert aggregator.buffers == {}
+    assert aggregator.created_keys == {"ts:ttft:1:host-1", "ts:latency:1:host-1"}
+
+
+@pytest.mark.asyncio
+async def test_flush_without_samples_skips_redis():
+    aggregator = MetricsAggregator(flush_interval=1000, precision=3)
+    redis_client, _ = _redis_client()
+
+    await aggregator.flush(redis_client=redis_client)
+
+    redis_client.pipeline.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_flushes_on_cancel():
+    aggregator = MetricsAggregator(flush_interval=60_000, precision=3)
+    aggregator.record(key="ts:ttft:1", value=100)
+    redis_client, pipeline = _redis_client()
+    redis_client.aclose = AsyncMock()
+
+    with patch("api.helpers._metricsaggregator.AsyncRedis", return_value=redis_client):
+        task = asyncio.create_task(aggregator.run(redis_pool=MagicMock()))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    pipeline.ts.return_value.madd.assert_called_once()
+    redis_client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_flush_updates_peak_ewma_with_raw_latencies():
+    aggregator = MetricsAggregator(flush_interval=1000, precision=1, peak_ewma_half_life=5.0)
+    with patch("api.helpers._metricsaggregator.time.time", side_effect=[1.0, 1.0, 2.0, 2.0, 3.0, 3.0, 4.0, 10.0]):
+        for value in [500, 100, 200]:
+            aggregator.record(key="ts:latency:1", value=value)
+            aggregator.record_peak_ewma(key="ts:latency:1", value=value)
+        aggregator.record(key="ts:ttft:1", value=50)
+        redis_client, pipeline = _redis_client(results=[[1, 1]])
+        await aggregator.flush(redis_client=redis_client)
+
+    # the peak EWMA is updated with the raw samples in arrival order, not with the summary written in the time series
+    updates = [call.args[3:5] for call in pipeline.eval.call_args_list]
+    assert updates == [(500, 1000), (100, 2000), (200, 3000)]
+    samples = pipeline.ts.return_value.madd.call_args.kwargs["ktv_tuples"]
+    assert [(key.rsplit(":", 1)[0], timestamp, value) for key, timestamp, value in samples] == [("ts:latency:1", 10000, 200), ("ts:ttft:1", 10000, 50)]  # fmt: off
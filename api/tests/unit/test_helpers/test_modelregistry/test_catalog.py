@@ -0,0 +1,231 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.helpers._slotlease import SlotLease
+import api.helpers.models._modelregistry as modelregistry_module
+from api.helpers.models._modelregistry import ModelRegistry
+from api.helpers.models._routingcatalog import RoutingCatalog
+from api.schemas.admin.providers import Provider, ProviderType
+from api.schemas.admin.routers import Router, RouterLoadBalancingStrategy
+from api.schemas.core.configuration import RoutingFairQueuingKey
+from api.schemas.core.context import RequestContext
+from api.schemas.me.info import UserInfo
+from api.schemas.models import ModelType
+from api.utils.exceptions import ModelNotFoundException, ProviderNotFoundException, RouterNotFoundException
+from api.utils.variables import ENDPOINT__CHAT_COMPLETIONS
+
+
+@pytest.fixture
+def postgres_session():
+    return AsyncMock(spec=AsyncSession)
+
+
+@pytest.fixture
+def model_registry():
+    return ModelRegistry(
+        app_title="TestApp",
+        queuing_enabled=False,
+        max_priority=10,
+        max_retries=3,
+        retry_countdown=60,
+    )
+
+
+def _router(id: int, name: str, aliases: list[str] | None = None) -> Router:
+    return Router(
+        id=id,
+        name=name,
+        user_id=0,
+        type=ModelType.TEXT_GENERATION,
+        aliases=aliases,
+        load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+        cost_prompt_tokens=0.0,
+        cost_completion_tokens=0.0,
+        providers=1,
+        created=100,
+        updated=200,
+    )
+
+
+def _provider(id: int, router_id: int) -> Provider:
+    return Provider(
+        id=id,
+        router_id=router_id,
+        user_id=0,
+        type=ProviderType.VLLM,
+        url="http://localhost:8000",
+        key=None,
+        timeout=10,
+        model_name=f"model-{id}",
+        qos_metric=None,
+    )
+
+
+@pytest.fixture
+def catalog():
+    return RoutingCatalog.build(
+        version=3,
+        routers=[_router(id=1, name="router-1", aliases=["alias-1"]), _router(id=2, name="router-2")],
+        providers=[_provider(id=12, router_id=1), _provider(id=11, router_id=1)],
+    )
+
+
+def test_build_indexes_names_aliases_and_providers(catalog: RoutingCatalog):
+    assert catalog.version == 3
+    assert catalog.get_router(name="router-1").id == 1
+    assert catalog.get_router(name="alias-1").id == 1
+    assert [provider.id for provider in catalog.get_providers(router_id=1)] == [11, 12]
+    assert catalog.get_providers(router_id=2) == []
+    assert catalog.get_provider(router_id=1, provider_id=12).model_name == "model-12"
+
+
+def test_get_router_and_provider_not_found(catalog: RoutingCatalog):
+    with pytest.raises(RouterNotFoundException):
+        catalog.get_router(name="unknown")
+
+    with pytest.raises(ProviderNotFoundException):
+        catalog.get_provider(router_id=2, provider_id=11)
+
+
+@pytest.mark.asyncio
+async def test_load_catalog_reads_version_before_database(model_registry: ModelRegistry, postgres_session: AsyncSession):
+    redis_client = AsyncMock()
+    redis_client.get.return_value = b"7"
+    model_registry.get_routers = AsyncMock(return_value=[_router(id=1, name="router-1")])
+    model_registry.get_providers = AsyncMock(return_value=[_provider(id=11, router_id=1)])
+
+    await model_registry.load_catalog(postgres_session=postgres_session, redis_client=redis_client)
+
+    assert model_registry.catalog.version == 7
+    assert model_registry.catalog.get_router(name="router-1").id == 1
+    redis_client.get.assert_awaited_once_with(model_registry.catalog_version_key)
+
+
+@pytest.mark.asyncio
+async def test_invalidate_catalog_bumps_version_and_publishes(model_registry: ModelRegistry, postgres_session: AsyncSession):
+    redis_client = AsyncMock()
+    redis_client.incr.return_value = 4
+    redis_client.get.return_value = b"4"
+    model_registry.get_routers = AsyncMock(return_value=[])
+    model_registry.get_providers = AsyncMock(return_value=[])
+
+    await model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
+
+    redis_client.incr.assert_awaited_once_with(model_registry.catalog_version_key)
+    redis_client.publish.assert_awaited_once_with(model_registry.catalog_channel, 4)
+    assert model_registry.catalog.version == 4
+
+
+@pytest.mark.asyncio
+async def test_get_model_provider_uses_catalog_without_database(model_registry: ModelRegistry, postgres_session: AsyncSession, catalog):
+    model_registry.catalog = catalog
+    model_registry.get_routers = AsyncMock()
+    model_registry.get_providers = AsyncMock()
+    context = MagicMock()
+    context.get.return_value = RequestContext()
+
+    provider_class = MagicMock(return_value=MagicMock())
+    with (
+        patch.object(
+            modelregistry_module, "apply_routing_without_queuing", AsyncMock(return_value=SlotLease(provider_id=12, lease_id="lease", ttl=600))
+        ),
+        patch.object(modelregistry_module.ModelProvider, "import_module", return_value=provider_class),
+    ):
+        await model_registry.get_model_provider(
+            model="alias-1",
+            endpoint=ENDPOINT__CHAT_COMPLETIONS,
+            postgres_session=postgres_session,
+            redis_client=AsyncMock(),
+            request_context=context,
+        )
+
+    model_registry.get_routers.assert_not_called()
+    model_registry.get_providers.assert_not_called()
+    postgres_session.execute.assert_not_called()
+    assert context.get.return_value.router_id == 1
+    assert context.get.return_value.provider_id == 12
+
+
+@pytest.mark.asyncio
+async def test_get_model_provider_schedules_by_organization_flow(model_registry: ModelRegistry, postgres_session: AsyncSession, catalog):
+    model_registry.catalog = catalog
+    model_registry.scheduling_enabled = True
+    model_registry.fair_queuing_key = RoutingFairQueuingKey.ORGANIZATION
+    user_info = UserInfo(id=5, email="user@example.com", organization=7, permissions=[], limits=[], priority=2, routing_weight=3.0, created=0, updated=0)  # fmt: off
+    context = MagicMock()
+    context.get.return_value = RequestContext(user_info=user_info)
+
+    routing = AsyncMock(return_value=SlotLease(provider_id=12, lease_id="lease", ttl=600))
+    with (
+        patch.object(modelregistry_module, "apply_routing_with_scheduling", routing),
+        patch.object(modelregistry_module.ModelProvider, "import_module", return_value=MagicMock(return_value=MagicMock())),
+    ):
+        await model_registry.get_model_provider(
+            model="alias-1",
+            endpoint=ENDPOINT__CHAT_COMPLETIONS,
+            postgres_session=postgres_session,
+            redis_client=AsyncMock(),
+            request_context=context,
+        )
+
+    kwargs = routing.await_args.kwargs
+    assert (kwargs["router_id"], kwargs["priority"], kwargs["flow"], kwargs["weight"]) == (1, 2, "organization:7", 3.0)
+
+
+@pytest.mark.asyncio
+async def test_get_model_provider_caps_deadline_at_provider_timeout(model_registry: ModelRegistry, postgres_session: AsyncSession, catalog):
+    model_registry.catalog = catalog
+    model_registry.scheduling_enabled = True
+    context = MagicMock()
+    context.get.return_value = RequestContext(deadline=time.time() + 1e12)
+
+    routing = AsyncMock(return_value=SlotLease(provider_id=12, lease_id="lease", ttl=600))
+    with (
+        patch.object(modelregistry_module, "apply_routing_with_scheduling", routing),
+        patch.object(modelregistry_module.ModelProvider, "import_module", return_value=MagicMock(return_value=MagicMock())),
+    ):
+        await model_registry.get_model_provider(
+            model="alias-1",
+            endpoint=ENDPOINT__CHAT_COMPLETIONS,
+            postgres_session=postgres_session,
+            redis_client=AsyncMock(),
+            request_context=context,
+        )
+
+    # the providers of the catalog have a timeout of 10 seconds
+    assert routing.await_args.kwargs["deadline"] - time.time() <= 10
+
+
+@pytest.mark.asyncio
+async def test_get_model_provider_unknown_model_in_catalog(model_registry: ModelRegistry, postgres_session: AsyncSession, catalog):
+    model_registry.catalog = catalog
+
+    with pytest.raises(ModelNotFoundException):
+        await model_registry.get_model_provider(
+            model="unknown",
+            endpoint=ENDPOINT__CHAT_COMPLETIONS,
+            postgres_session=postgres_session,
+            redis_client=AsyncMock(),
+            request_context=MagicMock(),
+        )
+
+
+@pytest.mark.asyncio
+async def test_watch_catalog_closes_redis_client_on_cancel(model_registry: ModelRegistry):
+    pubsub = AsyncMock()
+    pubsub.get_message.side_effect = asyncio.Event().wait  # no invalidation, wait until cancelled
+    redis_client = MagicMock()
+    redis_client.pubsub.return_value = pubsub
+    redis_client.aclose = AsyncMock()
+
+    task = asyncio.create_task(model_registry.watch_catalog(redis_client=redis_client, postgres_session_factory=MagicMock()))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    pubsub.aclose.assert_awaited_once()
+    redis_client.aclose.assert_awaited_once()
@@ -5,7 +5,7 @@ from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.helpers.models._modelregistry import ModelRegistry
-from api.schemas.admin.routers import Router, RouterLoadBalancingStrategy
+from api.schemas.admin.routers import Router, RouterLoadBalancingStrategy, RouterUsageSource
 from api.schemas.models import ModelType
 from api.utils.exceptions import (
     RouterAliasAlreadyExistsException,
@@ -313,6 +313,7 @@ async def test_get_routers_by_id_success(postgres_session: AsyncSession, model_r
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 1.0,
             "cost_completion_tokens": 2.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 2,
@@ -355,6 +356,7 @@ async def test_get_routers_by_name_success(postgres_session: AsyncSession, model
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 1,
@@ -389,6 +391,7 @@ async def test_get_routers_by_alias_success(postgres_session: AsyncSession, mode
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 1,
@@ -423,6 +426,7 @@ async def test_get_routers_by_name_not_found(postgres_session: AsyncSession, mod
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 1,
@@ -453,6 +457,7 @@ async def test_get_routers_pagination_and_ordering(postgres_session: AsyncSessio
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 1,
@@ -470,6 +475,7 @@ async def test_get_routers_pagination_and_ordering(postgres_session: AsyncSessio
             "load_balancing_strategy": RouterLoadBalancingStrategy.LEAST_BUSY.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 2048,
             "vector_size": 768,
             "providers": 2,
@@ -510,6 +516,7 @@ async def test_get_routers_master_user(postgres_session: AsyncSession, model_reg
             "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE.value,
             "cost_prompt_tokens": 0.0,
             "cost_completion_tokens": 0.0,
+            "usage_source": RouterUsageSource.UPSTREAM.value,
             "max_context_length": 4096,
             "vector_size": None,
             "providers": 0,
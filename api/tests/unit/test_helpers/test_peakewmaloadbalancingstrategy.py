@@ -0,0 +1,77 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.helpers._metricsamples import add_metric_samples
+from api.helpers._peakewma import PeakEwma
+from api.helpers.load_balancing import PeakEwmaLoadBalancingStrategy
+from api.utils.variables import PREFIX__REDIS_METRIC_EWMA, PREFIX__REDIS_METRIC_TIMESERIE
+
+
+def _redis_client(results):
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(return_value=results)
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    return redis_client, pipeline
+
+
+@pytest.mark.asyncio
+async def test_strategy_weights_latency_by_inflight_requests():
+    # provider 1 is faster but has more inflight requests: 100 * (5 + 1) > 250 * (1 + 1)
+    redis_client, pipeline = _redis_client(results=[[b"100", None, None], b"5", [b"250", None, None], b"1"])
+
+    strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2])
+
+    assert (provider_id, score) == (2, 500.0)
+    pipeline.execute.assert_awaited_once()
+    assert pipeline.hmget.call_args_list[0].args == (f"{PREFIX__REDIS_METRIC_EWMA}:1", ["ewma", "timestamp", "half_life"])
+
+
+@pytest.mark.asyncio
+async def test_strategy_unknown_provider_gets_mean_latency():
+    redis_client, _ = _redis_client(results=[[b"100", None, None], b"0", [b"300", None, None], b"0", [None, None, None], b"1"])
+
+    strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2, 3])
+
+    assert (provider_id, score) == (1, 100.0)  # provider 3 scores 200 * (1 + 1)
+
+
+@pytest.mark.asyncio
+async def test_strategy_decays_peak_ewma_of_provider_without_sample():
+    # provider 1 spiked to 900 ms two half-lives ago and has not been sampled since, provider 2 is at 300 ms
+    redis_client, _ = _redis_client(results=[[b"900", b"0", b"5000"], b"0", [b"300", b"10000", b"5000"], b"0"])
+
+    strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    with patch("api.helpers.load_balancing._peakewmaloadbalancingstrategy.time.time", return_value=10.0):
+        provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2])
+
+    # 900 decays toward the mean (600) by three quarters: 900 * 0.25 + 600 * 0.75
+    assert (provider_id, score) == (2, 300.0)
+    assert PeakEwma.get_decayed(ewma=900, timestamp=0, half_life=5000, target=600, now=10000) == 675.0
+
+
+def test_sync_strategy_redis_error():
+    pipeline = MagicMock()
+    pipeline.execute.side_effect = ConnectionError()
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, _ = strategy.apply_sync_strategy(candidates=[1, 2])
+
+    assert provider_id in (1, 2)
+    redis_client.reset.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_latency_samples_update_peak_ewma():
+    redis_client, pipeline = _redis_client(results=[[1, 1]])
+    samples = [(f"{PREFIX__REDIS_METRIC_TIMESERIE}:ttft:1", 1000, 50), (f"{PREFIX__REDIS_METRIC_TIMESERIE}:latency:1", 1000, 200)]
+
+    await add_metric_samples(redis_client=redis_client, samples=samples, created_keys={key for key, _, _ in samples}, peak_ewma_half_life=5.0)
+
+    pipeline.eval.assert_called_once_with(PeakEwma.SCRIPT, 1, f"{PREFIX__REDIS_METRIC_EWMA}:1", 200, 1000, 5000.0, 120_000)
@@ -0,0 +1,46 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from api.helpers.load_balancing import PowerOfTwoLoadBalancingStrategy
+from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+
+
+def test_sync_strategy_picks_least_inflight_of_two():
+    redis_client = MagicMock()
+    redis_client.mget.return_value = [b"5", b"2"]
+
+    strategy = PowerOfTwoLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, inflight = strategy.apply_sync_strategy(candidates=[1, 2, 3, 4])
+
+    keys = redis_client.mget.call_args.args[0]
+    assert len(keys) == 2
+    assert all(key.startswith(f"{PREFIX__REDIS_METRIC_GAUGE}:inflight:") for key in keys)
+    assert provider_id == int(keys[1].rsplit(":", 1)[1])
+    assert inflight == 2.0
+
+
+@pytest.mark.asyncio
+async def test_async_strategy_missing_gauge_counts_as_idle():
+    redis_client = MagicMock()
+    redis_client.mget = AsyncMock(return_value=[b"3", None])
+
+    strategy = PowerOfTwoLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, inflight = await strategy.apply_async_strategy(candidates=[1, 2])
+
+    keys = redis_client.mget.call_args.args[0]
+    assert provider_id == int(keys[1].rsplit(":", 1)[1])
+    assert inflight == 0.0
+
+
+@pytest.mark.asyncio
+async def test_async_strategy_single_candidate_and_redis_error():
+    redis_client = MagicMock()
+    redis_client.mget = AsyncMock(side_effect=ConnectionError())
+    redis_client.reset = AsyncMock()
+
+    strategy = PowerOfTwoLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, _ = await strategy.apply_async_strategy(candidates=[7])
+
+    assert provider_id == 7
+    redis_client.reset.assert_awaited_once()
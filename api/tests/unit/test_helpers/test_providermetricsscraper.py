@@ -0,0 +1,122 @@
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.clients.model import OpenaiModelProvider, VllmModelProvider
+from api.helpers._providermetricsscraper import ProviderMetricsScraper
+from api.helpers.load_balancing import LeastLoadedLoadBalancingStrategy
+from api.helpers.models._routingcatalog import RoutingCatalog
+from api.schemas.admin.providers import Provider, ProviderCarbonFootprintZone, ProviderType
+from api.utils.variables import PREFIX__REDIS_METRIC_BACKEND
+
+VLLM_METRICS = """# HELP vllm:num_requests_running Number of requests in model execution batches.
+# TYPE vllm:num_requests_running gauge
+vllm:num_requests_running{engine="0",model_name="model"} 3.0
+vllm:num_requests_running{engine="1",model_name="model"} 4.0
+# TYPE vllm:num_requests_waiting gauge
+vllm:num_requests_waiting{engine="0",model_name="model"} 2.0
+vllm:num_requests_waiting{engine="1",model_name="model"} 0.0
+# TYPE vllm:gpu_cache_usage_perc gauge
+vllm:gpu_cache_usage_perc{engine="0",model_name="model"} 0.25
+vllm:gpu_cache_usage_perc{engine="1",model_name="model"} 0.75
+process_open_fds 42
+"""
+
+
+def _patch_http_client(text: str):
+    response = MagicMock(text=text)
+    client = MagicMock()
+    client.get = AsyncMock(return_value=response)
+
+    @asynccontextmanager
+    async def _get_http_client(self):
+        yield client
+
+    return patch.object(VllmModelProvider, "_get_http_client", _get_http_client), client
+
+
+def _provider(id: int, type: ProviderType) -> Provider:
+    return Provider(
+        id=id,
+        router_id=1,
+        user_id=0,
+        type=type,
+        url="http://localhost:8000",
+        key=None,
+        timeout=10,
+        model_name="model",
+        model_hosting_zone=ProviderCarbonFootprintZone.WOR,
+        qos_metric=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_backend_metrics_parses_prometheus_text():
+    provider = VllmModelProvider(
+        url="http://localhost:8000",
+        key=None,
+        timeout=10,
+        model_name="model",
+        model_hosting_zone=ProviderCarbonFootprintZone.WOR,
+        model_total_params=0,
+        model_active_params=0,
+    )
+    patcher, client = _patch_http_client(text=VLLM_METRICS)
+
+    with patcher:
+        metrics = await provider.get_backend_metrics()
+
+    assert metrics == {"waiting": 2.0, "running": 7.0, "kv_cache": 0.75}
+    assert client.get.call_args.kwargs["url"] == "http://localhost:8000/metrics"
+    assert OpenaiModelProvider.METRICS_ENDPOINT is None
+
+
+@pytest.mark.asyncio
+async def test_scrape_caches_metrics_of_supported_providers():
+    model_registry = MagicMock()
+    model_registry.catalog = RoutingCatalog(
+        version=1, providers={1: (_provider(id=1, type=ProviderType.VLLM), _provider(id=2, type=ProviderType.OPENAI))}
+    )
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock()
+    redis_client = MagicMock()
+    redis_client.set = AsyncMock(return_value=True)
+    redis_client.pipeline.return_value = pipeline
+    patcher, client = _patch_http_client(text=VLLM_METRICS)
+
+    with patcher:
+        await ProviderMetricsScraper(model_registry=model_registry, interval=5.0).scrape(redis_client=redis_client)
+
+    client.get.assert_awaited_once()
+    pipeline.hset.assert_called_once_with(f"{PREFIX__REDIS_METRIC_BACKEND}:1", mapping={"waiting": 2.0, "running": 7.0, "kv_cache": 0.75})
+    pipeline.pexpire.assert_called_once_with(f"{PREFIX__REDIS_METRIC_BACKEND}:1", 15_000)
+
+
+@pytest.mark.asyncio
+async def test_scrape_skipped_when_another_worker_holds_the_lock():
+    model_registry = MagicMock()
+    model_registry.catalog = RoutingCatalog(version=1, providers={1: (_provider(id=1, type=ProviderType.VLLM),)})
+    redis_client = MagicMock()
+    redis_client.set = AsyncMock(return_value=None)
+    patcher, client = _patch_http_client(text=VLLM_METRICS)
+
+    with patcher:
+        await ProviderMetricsScraper(model_registry=model_registry, interval=5.0).scrape(redis_client=redis_client)
+
+    client.get.assert_not_called()
+    redis_client.pipeline.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_least_loaded_strategy_prefers_short_queue_then_kv_cache():
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(return_value=[[b"2", b"0.1"], [b"0", b"0.9"], [b"0", b"0.3"], [None, None]])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    strategy = LeastLoadedLoadBalancingStrategy(redis_client=redis_client)
+    provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2, 3, 4])
+
+    assert (provider_id, score) == (3, 0.3)
+    pipeline.execute.assert_awaited_once()
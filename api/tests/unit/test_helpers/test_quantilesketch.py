@@ -0,0 +1,110 @@
+import math
+import random
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from api.helpers._quantilesketch import QuantileSketch
+from api.helpers.load_balancing import LeastBusyLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils.variables import PREFIX__REDIS_METRIC_SKETCH, PREFIX__REDIS_METRIC_TIMESERIE
+
+
+def test_quantile_relative_accuracy():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(mu=6, sigma=1) for _ in range(10_000)]
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value=value)
+
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        expected = values[math.ceil(q * len(values)) - 1]
+        assert abs(sketch.quantile(q=q) - expected) <= QuantileSketch.RELATIVE_ACCURACY * expected
+
+
+def test_quantile_empty_and_zero_values():
+    sketch = QuantileSketch()
+    assert sketch.quantile(q=0.95) is None
+
+    sketch.add(value=0, count=3)
+    sketch.add(value=100)
+    assert sketch.quantile(q=0.5) == 0.0
+    assert sketch.quantile(q=0.95) == pytest.approx(100, rel=QuantileSketch.RELATIVE_ACCURACY)
+
+
+def test_redis_round_trip_merges_slots():
+    first, second = QuantileSketch(), QuantileSketch()
+    first.add(value=10)
+    first.add(value=0)
+    second.add(value=10, count=2)
+
+    hashes = [{k.encode(): str(v).encode() for k, v in first.to_redis().items()}, second.to_redis(), {}]
+    sketch = QuantileSketch.from_redis(hashes=hashes)
+
+    first.merge(second)
+    assert (sketch.buckets, sketch.zero_count) == (first.buckets, first.zero_count)
+    assert sketch.count == 4
+
+
+def test_keys_cover_retention_window():
+    key = QuantileSketch.get_key(timeserie_key=f"{PREFIX__REDIS_METRIC_TIMESERIE}:ttft:1", timestamp=1_000_000)
+    keys = QuantileSketch.get_window_keys(metric="ttft", provider_id=1, timestamp=1_000_000)
+
+    assert key == f"{PREFIX__REDIS_METRIC_SKETCH}:ttft:1:100"
+    assert keys[-1] == key
+    assert keys[0] == f"{PREFIX__REDIS_METRIC_SKETCH}:ttft:1:88"
+
+
+def _sketch_hashes(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value=value)
+
+    slots = len(QuantileSketch.get_window_keys(metric="ttft", provider_id=1, timestamp=1_000_000))
+    return [sketch.to_redis()] + [{}] * (slots - 1)
+
+
+def test_least_busy_sync_strategy_scores_all_candidates_in_one_round_trip():
+    pipeline = MagicMock()
+    pipeline.execute.return_value = _sketch_hashes([500] * 10) + _sketch_hashes([100] * 10) + _sketch_hashes([])
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=Metric.TTFT)
+    provider_id, score = strategy.apply_sync_strategy(candidates=[1, 2, 3])
+
+    assert provider_id == 2
+    assert score == pytest.approx(100, rel=QuantileSketch.RELATIVE_ACCURACY)
+    pipeline.execute.assert_called_once()
+    assert pipeline.hgetall.call_args_list[0].args[0].startswith(f"{PREFIX__REDIS_METRIC_SKETCH}:ttft:1:")
+
+
+@pytest.mark.asyncio
+async def test_least_busy_async_strategy_without_samples():
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(return_value=_sketch_hashes([]) * 2)
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+
+    strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=Metric.TTFT)
+    provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2])
+
+    assert provider_id in (1, 2)
+    assert score == float("inf")
+
+
+@pytest.mark.asyncio
+async def test_least_busy_async_strategy_redis_error():
+    pipeline = MagicMock()
+    pipeline.execute = AsyncMock(side_effect=ConnectionError())
+    redis_client = MagicMock()
+    redis_client.pipeline.return_value = pipeline
+    redis_client.reset = AsyncMock()
+
+    strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=Metric.TTFT)
+    provider_id, score = await strategy.apply_async_strategy(candidates=[1, 2])
+
+    assert provider_id in (1, 2)
+    assert score == float("inf")
+    redis_client.reset.assert_awaited_once()
@@ -0,0 +1,149 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.helpers._admissioncontroller import AdmissionController
+from api.helpers._slotlease import SlotLease
+from api.schemas.admin.providers import Provider
+from api.schemas.admin.routers import RouterLoadBalancingStrategy
+from api.schemas.core.context import RequestContext
+from api.schemas.core.models import Metric
+from api.utils import context as context_module
+from api.utils import routing as routing_module
+from api.utils.context import release_slot_leases
+from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+
+
+@pytest.mark.asyncio
+async def test_acquire_checks_limit_in_script():
+    redis_client = AsyncMock()
+    redis_client.eval.return_value = 3
+
+    lease = await SlotLease.acquire(redis_client=redis_client, provider_id=7, ttl=60, limit=4)
+
+    assert lease.provider_id == 7
+    script, numkeys, gauge_key, leases_key, tokens_key, tokens_leases_key, limit, ttl, lease_id, tokens, token_limit = (
+        redis_client.eval.await_args.args
+    )
+    assert script == SlotLease.ACQUIRE_SCRIPT and numkeys == 4
+    assert (gauge_key, leases_key) == (f"{PREFIX__REDIS_METRIC_GAUGE}:inflight:7", f"{PREFIX__REDIS_METRIC_GAUGE}:inflight:7:leases")
+    assert (tokens_key, tokens_leases_key) == (
+        f"{PREFIX__REDIS_METRIC_GAUGE}:inflight_tokens:7",
+        f"{PREFIX__REDIS_METRIC_GAUGE}:inflight_tokens:7:leases",
+    )
+    assert (limit, ttl, lease_id, tokens, token_limit) == (4, 60_000, lease.lease_id, 0, "")
+
+
+@pytest.mark.asyncio
+async def test_acquire_refused_or_unlimited():
+    redis_client = AsyncMock()
+    redis_client.eval.return_value = -1
+    assert await SlotLease.acquire(redis_client=redis_client, provider_id=7, ttl=60, limit=4) is None
+
+    sync_client = MagicMock()
+    sync_client.eval.return_value = 1
+    lease = SlotLease.acquire_sync(redis_client=sync_client, provider_id=7, ttl=60, tokens=1200, token_limit=8000)
+    assert lease is not None
+    assert sync_client.eval.call_args.args[6] == ""
+    assert sync_client.eval.call_args.args[-2:] == (1200, 8000)
+
+
+@pytest.mark.asyncio
+async def test_release_publishes_to_admission_channel():
+    redis_client = AsyncMock()
+    lease = SlotLease(provider_id=7, lease_id="abc", ttl=60)
+
+    await lease.release(redis_client=redis_client)
+
+    assert redis_client.eval.await_args.args[-4:] == ("abc", 60_000, AdmissionController.CHANNEL, 7)
+
+
+@pytest.mark.asyncio
+async def test_renew_only_after_half_ttl():
+    redis_client = AsyncMock()
+    lease = SlotLease(provider_id=7, lease_id="abc", ttl=60)
+
+    await lease.renew(redis_client=redis_client)
+    redis_client.eval.assert_not_awaited()
+
+    lease.renewed_at -= 31
+    await lease.renew(redis_client=redis_client)
+    assert redis_client.eval.await_args.args[0] == SlotLease.RENEW_SCRIPT
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_renews_until_cancelled():
+    redis_client = AsyncMock()
+    lease = SlotLease(provider_id=7, lease_id="abc", ttl=0.02)
+
+    task = asyncio.create_task(lease.keep_alive(redis_client=redis_client))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert redis_client.eval.await_count >= 2
+    assert all(call.args[0] == SlotLease.RENEW_SCRIPT for call in redis_client.eval.await_args_list)
+
+
+@pytest.mark.asyncio
+async def test_release_slot_leases_releases_remaining_leases():
+    redis_client = AsyncMock()
+    leases = [SlotLease(provider_id=7, lease_id="abc", ttl=60), SlotLease(provider_id=8, lease_id="def", ttl=60)]
+    context = RequestContext(slot_leases=list(leases))
+
+    with patch.object(context_module, "AsyncRedis", return_value=redis_client):
+        await release_slot_leases(context=context)
+        await release_slot_leases(context=context)
+
+    assert [call.args[-4] for call in redis_client.eval.await_args_list] == ["abc", "def"]
+    assert context.slot_leases == []
+    redis_client.aclose.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_routing_acquires_inflight_slot_atomically():
+    providers = [Provider.model_construct(id=1, qos_metric=Metric.INFLIGHT, qos_limit=2)]
+    qos_policy = AsyncMock()
+
+    with (
+        patch.object(routing_module, "apply_async_qos_policy", qos_policy),
+        patch.object(routing_module.SlotLease, "acquire", AsyncMock(return_value=SlotLease(provider_id=1, lease_id="abc", ttl=30))) as acquire,
+    ):
+        lease = await routing_module.apply_routing_without_queuing(
+            providers=providers,
+            load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+            load_balancing_metric=Metric.TTFT,
+            max_retries=1,
+            retry_countdown=1,
+            redis_client=AsyncMock(),
+            slot_lease_ttl=30,
+        )
+
+    assert lease.lease_id == "abc"
+    assert acquire.await_args.kwargs["limit"] == 2
+    qos_policy.assert_not_awaited()  # the inflight limit is checked by the acquisition script
+
+
+@pytest.mark.asyncio
+async def test_routing_acquires_inflight_tokens_slot_atomically():
+    providers = [Provider.model_construct(id=1, qos_metric=Metric.INFLIGHT_TOKENS, qos_limit=8000)]
+    qos_policy = AsyncMock()
+
+    with (
+        patch.object(routing_module, "apply_async_qos_policy", qos_policy),
+        patch.object(routing_module.SlotLease, "acquire", AsyncMock(return_value=SlotLease(provider_id=1, lease_id="abc", ttl=30))) as acquire,
+    ):
+        await routing_module.apply_routing_without_queuing(
+            providers=providers,
+            load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+            load_balancing_metric=Metric.TTFT,
+            max_retries=1,
+            retry_countdown=1,
+            redis_client=AsyncMock(),
+            slot_lease_ttl=30,
+            tokens=1200,
+        )
+
+    assert (acquire.await_args.kwargs["tokens"], acquire.await_args.kwargs["token_limit"]) == (1200, 8000)
+    qos_policy.assert_not_awaited()
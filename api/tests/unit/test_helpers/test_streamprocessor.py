@@ -0,0 +1,127 @@
+from json import dumps, loads
+from unittest.mock import MagicMock
+
+from api.helpers._streamprocessor import StreamProcessor
+from api.helpers._usagetokenizer import StreamTokenCounter
+
+
+def _event(content: str, index: int = 0) -> bytes:
+    chunk = {"id": "chatcmpl-123", "object": "chat.completion.chunk", "choices": [{"index": index, "delta": {"content": content}}]}
+    return f"data: {dumps(chunk)}\n\n".encode()
+
+
+def test_feed_forwards_complete_events_only():
+    processor = StreamProcessor()
+    event = _event(content="Hello")
+
+    assert processor.feed(data=event[:10]) == b""
+    assert processor.feed(data=event[10:]) == event
+    assert processor.id == "chatcmpl-123"
+    assert processor.first_token_time is not None
+
+
+def test_feed_splits_crlf_events():
+    processor = StreamProcessor(token_counter=StreamTokenCounter(tokenizer=MagicMock()))
+    data = (_event(content="Hello") + _event(content=" world") + b"data: [DONE]\n\n").replace(b"\n", b"\r\n")
+    split = data.index(b"\r\n\r\n") + 1  # between the `\r` and the `\n` of a separator
+
+    assert processor.feed(data=data[:split]) == b""
+    assert processor.feed(data=data[split:]) == _event(content="Hello") + _event(content=" world")
+    assert processor.done is True
+    assert processor.token_counter.pending == {0: ["Hello", " world"]}
+    assert processor._tail == b""
+
+
+def test_feed_splits_cr_events():
+    processor = StreamProcessor()
+
+    # the last `\r` may be followed by `\n` in the next read, so the event is complete once the next read starts
+    assert processor.feed(data=_event(content="Hello").replace(b"\n", b"\r")) == b""
+    assert processor.feed(data=b"data: [DONE]\r\r") == _event(content="Hello")
+    assert processor.id == "chatcmpl-123"
+    assert processor.flush() == b""
+    assert processor.done is True
+
+
+def test_feed_stops_before_done_event_split_across_reads():
+    processor = StreamProcessor(token_counter=StreamTokenCounter(tokenizer=MagicMock()))
+    data = _event(content="Hello") + _event(content=" world") + b"data: [DO"
+
+    assert processor.feed(data=data) == _event(content="Hello") + _event(content=" world")
+    assert processor.done is False
+
+    assert processor.feed(data=b"NE]\n\n") == b""
+    assert processor.done is True
+    assert processor.feed(data=_event(content="ignored")) == b""
+    assert processor.token_counter.pending == {0: ["Hello", " world"]}
+
+
+def test_feed_counts_contents_by_choice():
+    token_counter = StreamTokenCounter(tokenizer=MagicMock())
+    processor = StreamProcessor(token_counter=token_counter)
+
+    processor.feed(data=_event(content="Hello", index=0) + _event(content="Bonjour", index=1) + _event(content=" world", index=0))
+
+    assert token_counter.pending == {0: ["Hello", " world"], 1: ["Bonjour"]}
+    assert processor.last_chunk["choices"][0]["delta"]["content"] == " world"
+
+
+def test_feed_keeps_upstream_usage():
+    processor = StreamProcessor()
+    usage_chunk = {"id": "chatcmpl-123", "choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12}}
+
+    processor.feed(data=_event(content="Hello") + f"data: {dumps(usage_chunk)}\n\n".encode())
+
+    assert processor.usage == {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12}
+
+
+def test_feed_drops_upstream_usage_chunk_not_requested_by_client():
+    processor = StreamProcessor(drop_usage=True)
+    usage_chunk = {"id": "chatcmpl-123", "choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12}}
+
+    events = processor.feed(data=_event(content="Hello") + f"data: {dumps(usage_chunk)}\n\n".encode() + b"data: [DONE]\n\n")
+
+    assert events == _event(content="Hello")
+    assert processor.usage == {"prompt_tokens": 5, "completion_tokens": 7, "total_tokens": 12}
+
+
+def test_ttft_not_set_on_empty_role_chunk():
+    processor = StreamProcessor()
+    role_chunk = {"id": "chatcmpl-123", "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}}]}
+
+    processor.feed(data=f"data: {dumps(role_chunk)}\n\n".encode())
+    assert processor.first_token_time is None
+
+    processor.finish()
+    assert processor.get_ttft() is not None
+
+
+def test_flush_processes_event_without_separator():
+    processor = StreamProcessor()
+
+    assert processor.feed(data=_event(content="Hello").rstrip(b"\n")) == b""
+    assert processor.flush() == _event(content="Hello")
+    assert processor.last_chunk["choices"][0]["delta"]["content"] == "Hello"
+
+
+def test_flush_separates_last_event_from_usage_chunk():
+    processor = StreamProcessor()
+    usage_chunk = {"id": "chatcmpl-123", "object": "chat.completion.chunk", "choices": [], "usage": {"total_tokens": 3}}
+
+    # the provider closes the stream without a final separator, then the usage chunk is forwarded
+    stream = processor.feed(data=_event(content="Hello") + _event(content=" world").rstrip(b"\n"))
+    stream += processor.flush()
+    stream += f"data: {dumps(usage_chunk)}\n\n".encode()
+
+    events = [event for event in stream.split(b"\n\n") if event]
+    assert [loads(event.removeprefix(b"data: ")) for event in events][-1] == usage_chunk
+    assert len(events) == 3
+
+
+def test_invalid_json_is_forwarded_but_ignored():
+    processor = StreamProcessor()
+
+    assert processor.feed(data=b"data: {not json}\n\n") == b"data: {not json}\n\n"
+    assert processor.last_chunk is None
+    processor.finish()
+    assert processor.get_ttft() is None
@@ -0,0 +1,108 @@
+from unittest.mock import patch
+
+import pytest
+import tiktoken
+
+from api.helpers._usagetokenizer import StreamTokenCounter, UsageTokenizer
+from api.schemas.core.context import RequestContext
+from api.utils.context import request_context
+from api.utils.variables import ENDPOINT__CHAT_COMPLETIONS, ENDPOINT__EMBEDDINGS
+
+TEXTS = [
+    "Hello world, this is a test.",
+    "Lorem ipsum  dolor sit amet,\n consectetur   adipiscing elit. " * 40,
+    "def main():\n    return 1234567 + 89\n" * 30,
+    "Les élèves n'ont pas été très contents aujourd'hui ! " * 20,
+]
+
+
+@pytest.fixture
+def usage_tokenizer():
+    # small byte-level BPE with the gpt2 pre-tokenizer, built locally to not download the encoding files
+    ranks = {bytes([i]): i for i in range(256)}
+    for text in TEXTS:
+        data = text.encode()
+        for pair in zip(data, data[1:]):
+            ranks.setdefault(bytes(pair), len(ranks))
+    encoding = tiktoken.Encoding(
+        name="test",
+        pat_str=r"""'(?:[sdmt]|ll|ve|re)| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks,
+        special_tokens={},
+    )
+
+    usage_tokenizer = UsageTokenizer.__new__(UsageTokenizer)
+    usage_tokenizer.tokenizer = encoding
+
+    return usage_tokenizer
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_stream_token_counter_matches_full_encoding(usage_tokenizer: UsageTokenizer, text: str):
+    token_counter = usage_tokenizer.get_stream_token_counter()
+    for i in range(0, len(text), 3):  # deltas of a few characters, like a streaming response
+        token_counter.add(index=0, content=text[i : i + 3])
+        assert token_counter.pending_size[0] < StreamTokenCounter.SEGMENT_SIZE + 64
+
+    assert token_counter.count() == len(usage_tokenizer.tokenizer.encode(text))
+
+
+def test_stream_token_counter_cuts_text_without_space(usage_tokenizer: UsageTokenizer):
+    text = "abcdefghij" * 1000
+    token_counter = usage_tokenizer.get_stream_token_counter()
+    for i in range(0, len(text), 3):
+        token_counter.add(index=0, content=text[i : i + 3])
+        assert token_counter.pending_size[0] < StreamTokenCounter.MAX_PENDING_SIZE + 3
+
+    # one token of error at most by cut
+    cuts = len(text) // StreamTokenCounter.MAX_PENDING_SIZE
+    assert abs(token_counter.count() - len(usage_tokenizer.tokenizer.encode(text))) <= cuts
+
+
+def test_stream_token_counter_sums_choices(usage_tokenizer: UsageTokenizer):
+    token_counter = usage_tokenizer.get_stream_token_counter()
+    token_counter.add(index=0, content="Hello world")
+    token_counter.add(index=1, content="Lorem ipsum")
+
+    expected = len(usage_tokenizer.tokenizer.encode("Hello world")) + len(usage_tokenizer.tokenizer.encode("Lorem ipsum"))
+    completion_tokens = usage_tokenizer.get_completion_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, response_data=token_counter, stream=True)
+
+    assert completion_tokens == expected
+
+
+def test_lazy_stream_token_counter_encodes_only_when_counted(usage_tokenizer: UsageTokenizer):
+    token_counter = usage_tokenizer.get_stream_token_counter(lazy=True)
+    with patch.object(usage_tokenizer.tokenizer, "encode", wraps=usage_tokenizer.tokenizer.encode) as encode:
+        for i in range(0, len(TEXTS[1]), 3):
+            token_counter.add(index=0, content=TEXTS[1][i : i + 3])
+        encode.assert_not_called()
+
+        assert token_counter.count() == len(usage_tokenizer.tokenizer.encode(TEXTS[1]))
+
+
+def test_get_prompt_tokens_tokenizes_prompt_once_per_request(usage_tokenizer: UsageTokenizer):
+    body = {"messages": [{"role": "user", "content": TEXTS[1]}, {"role": "assistant", "content": TEXTS[2]}]}
+    expected = len(usage_tokenizer.tokenizer.encode(TEXTS[1])) + len(usage_tokenizer.tokenizer.encode(TEXTS[2]))
+    token = request_context.set(RequestContext(prompt_tokens={}))
+
+    try:
+        with patch.object(usage_tokenizer.tokenizer, "encode", wraps=usage_tokenizer.tokenizer.encode) as encode:
+            # rate limits, routing and usage count the prompt of different copies of the body
+            assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, body=body) == expected
+            assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, body={**body, "stream": True}) == expected
+            assert encode.call_count == 2
+
+            # a modified prompt is tokenized again
+            body["messages"].append({"role": "user", "content": TEXTS[0]})
+            assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, body=body) > expected
+            assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__EMBEDDINGS, body={"input": [TEXTS[0]]}) > 0
+            assert encode.call_count == 6
+    finally:
+        request_context.reset(token)
+
+
+def test_get_prompt_tokens_invalid_body(usage_tokenizer: UsageTokenizer):
+    body = {"messages": [{"role": "user", "content": [{"type": "text", "text": "Hello"}]}]}
+
+    assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, body=body) == 0
+    assert usage_tokenizer.get_prompt_tokens(endpoint=ENDPOINT__CHAT_COMPLETIONS, body={}) == 0
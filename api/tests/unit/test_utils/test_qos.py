@@ -4,7 +4,7 @@ import pytest
 
 from api.schemas.core.models import Metric
 from api.utils.qos import apply_async_qos_policy, apply_sync_qos_policy
-from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+from api.utils.variables import PREFIX__REDIS_METRIC_BACKEND, PREFIX__REDIS_METRIC_GAUGE
 
 
 class TestApplySyncQosPolicy:
@@ -98,6 +98,44 @@ class TestApplySyncQosPolicy:
         assert result is True
         redis_client.get.assert_not_called()
 
+    def test_apply_sync_qos_policy_return_false_when_waiting_requests_exceeds_limit(self):
+        # Given
+        provider_id = 1
+        qos_metric = Metric.WAITING
+        qos_limit = 4.0
+        redis_client = MagicMock()
+        redis_client.hget.return_value = b"6"
+        # When
+        result = apply_sync_qos_policy(provider_id, qos_metric, qos_limit, redis_client)
+        # Then
+        assert result is False
+        redis_client.hget.assert_called_once_with(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", Metric.WAITING.value)
+
+    def test_apply_sync_qos_policy_return_true_when_backend_metrics_not_in_redis(self):
+        # Given
+        provider_id = 1
+        qos_metric = Metric.KV_CACHE
+        qos_limit = 0.9
+        redis_client = MagicMock()
+        redis_client.hget.return_value = None
+        # When
+        result = apply_sync_qos_policy(provider_id, qos_metric, qos_limit, redis_client)
+        # Then
+        assert result is True
+
+    def test_apply_sync_qos_policy_return_false_when_inflight_tokens_exceeds_limit(self):
+        # Given
+        provider_id = 1
+        qos_metric = Metric.INFLIGHT_TOKENS
+        qos_limit = 8000.0
+        redis_client = MagicMock()
+        redis_client.get.return_value = b"9000"
+        # When
+        result = apply_sync_qos_policy(provider_id, qos_metric, qos_limit, redis_client)
+        # Then
+        assert result is False
+        redis_client.get.assert_called_once_with(f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT_TOKENS.value}:{provider_id}")
+
 
 class TestApplyAsyncQosPolicy:
     @pytest.mark.asyncio
@@ -196,3 +234,31 @@ class TestApplyAsyncQosPolicy:
         # Then
         assert result is True
         redis_client.get.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_apply_async_qos_policy_return_false_when_kv_cache_usage_exceeds_limit(self):
+        # Given
+        provider_id = 1
+        qos_metric = Metric.KV_CACHE
+        qos_limit = 0.9
+        redis_client = AsyncMock()
+        redis_client.hget.return_value = b"0.95"
+        # When
+        result = await apply_async_qos_policy(provider_id, qos_metric, qos_limit, redis_client)
+        # Then
+        assert result is False
+        redis_client.hget.assert_awaited_once_with(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", Metric.KV_CACHE.value)
+
+    @pytest.mark.asyncio
+    async def test_apply_async_qos_policy_return_true_when_inflight_tokens_within_limit(self):
+        # Given
+        provider_id = 1
+        qos_metric = Metric.INFLIGHT_TOKENS
+        qos_limit = 8000.0
+        redis_client = AsyncMock()
+        redis_client.get.return_value = b"7000"
+        # When
+        result = await apply_async_qos_policy(provider_id, qos_metric, qos_limit, redis_client)
+        # Then
+        assert result is True
+        redis_client.get.assert_awaited_once_with(f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT_TOKENS.value}:{provider_id}")
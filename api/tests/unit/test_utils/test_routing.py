@@ -0,0 +1,252 @@
+import asyncio
+from json import dumps, loads
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.helpers._admissioncontroller import AdmissionController
+from api.helpers._routingreplylistener import RoutingReplyListener
+from api.helpers._routingscheduler import RoutingScheduler
+from api.helpers._slotlease import SlotLease
+from api.schemas.admin.providers import Provider
+from api.schemas.admin.routers import RouterLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.tasks import routing as tasks_routing_module
+from api.utils import routing as routing_module
+from api.utils.context import get_request_deadline
+from api.utils.exceptions import ModelIsTooBusyException, RequestDeadlineExceededException, TaskFailedException
+from api.utils.variables import PREFIX__REDIS_ROUTING_REPLY, PREFIX__REDIS_ROUTING_SCHEDULER
+
+
+async def _apply_routing_with_queuing(redis_client, retry_countdown=1, apply_async=None):
+    with (
+        patch.object(routing_module, "create_model_queue", MagicMock()),
+        patch.object(routing_module.apply_routing, "apply_async", apply_async or MagicMock(return_value=MagicMock(id="task-1"))),
+    ):
+        return await routing_module.apply_routing_with_queuing(
+            providers=[Provider.model_construct(id=1, qos_metric=None, qos_limit=None)],
+            load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+            load_balancing_metric=Metric.TTFT,
+            retry_countdown=retry_countdown,
+            max_retries=2,
+            queue_name="queue",
+            priority=0,
+            redis_client=redis_client,
+            slot_lease_ttl=30,
+        )
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_with_queuing_pops_reply_key():
+    redis_client = AsyncMock()
+    redis_client.lpop.return_value = dumps({"status_code": 200, "provider_id": 1, "lease_id": "abc"}).encode()
+
+    lease = await _apply_routing_with_queuing(redis_client=redis_client)
+
+    assert (lease.provider_id, lease.lease_id, lease.ttl) == (1, "abc", 30)
+    redis_client.lpop.assert_awaited_once_with(f"{PREFIX__REDIS_ROUTING_REPLY}:task-1")
+    redis_client.blpop.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_with_queuing_task_expires_at_end_of_wait():
+    redis_client = AsyncMock()
+    redis_client.lpop.return_value = dumps({"status_code": 200, "provider_id": 1, "lease_id": "abc"}).encode()
+    apply_async = MagicMock(return_value=MagicMock(id="task-1"))
+
+    await _apply_routing_with_queuing(redis_client=redis_client, apply_async=apply_async)
+
+    # without deadline, the task expires and stops retrying when the API stops waiting (2 retries of 1.2 seconds)
+    kwargs = apply_async.call_args.kwargs
+    wait_end = kwargs["args"][-1]
+    assert 0 < wait_end - time.time() <= 2.4
+    assert kwargs["expires"].timestamp() == pytest.approx(wait_end)
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_with_queuing_failure_and_timeout():
+    redis_client = AsyncMock()
+    redis_client.lpop.return_value = dumps({"status_code": 503, "body": {"detail": "Max retries exceeded"}}).encode()
+    with pytest.raises(TaskFailedException):
+        await _apply_routing_with_queuing(redis_client=redis_client)
+
+    redis_client.lpop.return_value = None
+    redis_client.pipeline = MagicMock(return_value=MagicMock(execute=AsyncMock(return_value=[True, None])))
+    with patch.object(RoutingReplyListener, "POLL_INTERVAL", 0.01), pytest.raises(ModelIsTooBusyException):
+        await _apply_routing_with_queuing(redis_client=redis_client, retry_countdown=0)
+
+    # the task is marked as abandoned, so it does not push its result and releases its slot if it runs later
+    pipeline = redis_client.pipeline.return_value
+    pipeline.set.assert_called_once_with(f"{PREFIX__REDIS_ROUTING_REPLY}:task-1:abandoned", 1, ex=60)
+    redis_client.eval.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_with_queuing_releases_slot_of_late_reply():
+    redis_client = AsyncMock()
+    redis_client.lpop.return_value = None
+    late_reply = dumps({"status_code": 200, "provider_id": 1, "lease_id": "abc"}).encode()
+    redis_client.pipeline = MagicMock(return_value=MagicMock(execute=AsyncMock(return_value=[True, late_reply])))
+
+    with patch.object(RoutingReplyListener, "POLL_INTERVAL", 0.01), pytest.raises(ModelIsTooBusyException):
+        await _apply_routing_with_queuing(redis_client=redis_client, retry_countdown=0)
+
+    # the reply pushed after the timeout is popped and its slot released
+    assert redis_client.eval.await_args.args[0] == SlotLease.RELEASE_SCRIPT
+    assert redis_client.eval.await_args.args[-4:] == ("abc", 30_000, AdmissionController.CHANNEL, 1)
+
+
+@pytest.mark.asyncio
+async def test_routing_reply_listener_wakes_waiting_request():
+    listener = RoutingReplyListener()
+    reply = dumps({"status_code": 200}).encode()
+    redis_client = AsyncMock()
+    redis_client.lpop.side_effect = [None, reply]
+
+    waiter = asyncio.create_task(listener.wait(task_id="task-1", key="key", timeout=10, redis_client=redis_client))
+    await asyncio.sleep(0.01)
+    assert "task-1" in listener.waiters
+    listener.wake(task_id="task-2")
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    listener.wake(task_id="task-1")
+    assert await asyncio.wait_for(waiter, timeout=1) == reply
+    assert listener.waiters == {}
+    assert redis_client.lpop.await_count == 2
+
+
+def test_send_routing_reply_pushes_result():
+    redis_client = MagicMock()
+    redis_client.eval.return_value = 1
+    result = {"status_code": 200, "provider_id": 1, "lease_id": "abc"}
+    lease = SlotLease(provider_id=1, lease_id="abc", ttl=30)
+
+    with patch.object(tasks_routing_module, "get_redis_client", return_value=redis_client):
+        assert tasks_routing_module.send_routing_reply(task_id="task-1", result=result, lease=lease) == result
+
+    script, _, key, abandoned_key, value, ttl, channel, task_id = redis_client.eval.call_args.args
+    assert script == tasks_routing_module.REPLY_SCRIPT
+    assert (key, abandoned_key) == (f"{PREFIX__REDIS_ROUTING_REPLY}:task-1", f"{PREFIX__REDIS_ROUTING_REPLY}:task-1:abandoned")
+    assert loads(value) == result
+    assert (ttl, channel, task_id) == (60, RoutingReplyListener.CHANNEL, "task-1")
+    redis_client.eval.assert_called_once()
+
+
+def test_send_routing_reply_releases_slot_of_abandoned_request():
+    redis_client = MagicMock()
+    redis_client.eval.return_value = 0  # the API stopped waiting before the reply
+    result = {"status_code": 200, "provider_id": 1, "lease_id": "abc"}
+
+    with patch.object(tasks_routing_module, "get_redis_client", return_value=redis_client):
+        tasks_routing_module.send_routing_reply(task_id="task-1", result=result, lease=SlotLease(provider_id=1, lease_id="abc", ttl=30))
+
+    assert redis_client.eval.call_args.args[0] == SlotLease.RELEASE_SCRIPT
+    assert redis_client.eval.call_args.args[-4:] == ("abc", 30_000, AdmissionController.CHANNEL, 1)
+
+
+def test_apply_routing_task_skips_abandoned_request():
+    redis_client = MagicMock()
+    redis_client.exists.return_value = 1
+
+    with (
+        patch.object(tasks_routing_module, "get_redis_client", return_value=redis_client),
+        patch.object(tasks_routing_module.SlotLease, "acquire_sync") as acquire_sync,
+    ):
+        result = tasks_routing_module.apply_routing.run([(1, None, None)], RouterLoadBalancingStrategy.SHUFFLE, Metric.TTFT, 1, 2, 30, 0, None)
+
+    assert result["status_code"] == 503
+    acquire_sync.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_with_scheduling_waits_for_head_of_queue():
+    controller = AdmissionController()
+    lease = SlotLease(provider_id=1, lease_id="abc", ttl=30)
+    is_head = AsyncMock(side_effect=[False, True])
+    dequeue = AsyncMock()
+
+    with (
+        patch.object(routing_module.RoutingScheduler, "enqueue", AsyncMock(return_value=("123:ticket", 4.5))),
+        patch.object(routing_module.RoutingScheduler, "is_head", is_head),
+        patch.object(routing_module.RoutingScheduler, "dequeue", dequeue),
+        patch.object(routing_module, "_acquire_slot", AsyncMock(return_value=lease)) as acquire_slot,
+        patch.object(routing_module.global_context, "admission_controller", controller),
+    ):
+        task = asyncio.create_task(
+            routing_module.apply_routing_with_scheduling(
+                router_id=3,
+                providers=[Provider.model_construct(id=1, qos_metric=None, qos_limit=None)],
+                load_balancing_strategy=RouterLoadBalancingStrategy.SHUFFLE,
+                load_balancing_metric=Metric.TTFT,
+                max_retries=10,
+                retry_countdown=10,
+                redis_client=AsyncMock(),
+            )
+        )
+        await asyncio.sleep(0.01)
+        acquire_slot.assert_not_awaited()  # not at the head of the queue
+
+        controller.wake_member(member="456:other")  # another request of the queue
+        await asyncio.sleep(0.01)
+        assert is_head.await_count == 1
+
+        controller.wake_member(member="123:ticket")  # the previous head left the queue
+        assert await asyncio.wait_for(task, timeout=0.1) is lease
+
+    dequeue.assert_awaited_once()
+    assert dequeue.await_args.kwargs["member"] == "123:ticket"
+    assert dequeue.await_args.kwargs["start"] == 4.5  # the virtual time of the router advances to the admitted request
+
+
+@pytest.mark.asyncio
+async def test_routing_scheduler_enqueue_and_dequeue():
+    redis_client = AsyncMock()
+    redis_client.eval.return_value = [b"123:ticket", b"0.5"]
+
+    member, start = await RoutingScheduler.enqueue(redis_client=redis_client, router_id=3, ticket="ticket", priority=2, timeout=1.5, flow="user:1", weight=2.0)  # fmt: off
+    assert (member, start) == ("123:ticket", 0.5)
+    keys = [f"{PREFIX__REDIS_ROUTING_SCHEDULER}:3", f"{PREFIX__REDIS_ROUTING_SCHEDULER}:3:fq"]
+    assert redis_client.eval.await_args.args[1:] == (2, *keys, 2, 1500, "ticket", "user:1", 2.0)
+
+    await RoutingScheduler.dequeue(redis_client=redis_client, router_id=3, member=member)
+    assert redis_client.eval.await_args.args[1:] == (2, *keys, "123:ticket", "", AdmissionController.CHANNEL, AdmissionController.MEMBER_PREFIX)
+
+
+@pytest.mark.asyncio
+async def test_apply_routing_without_queuing_refuses_request_after_deadline():
+    kwargs = {
+        "providers": [Provider.model_construct(id=1, qos_metric=None, qos_limit=None)],
+        "load_balancing_strategy": RouterLoadBalancingStrategy.SHUFFLE,
+        "load_balancing_metric": Metric.TTFT,
+        "max_retries": 10,
+        "retry_countdown": 10,
+        "redis_client": AsyncMock(),
+    }
+    with patch.object(routing_module, "_acquire_slot", AsyncMock(return_value=None)) as acquire_slot:
+        with pytest.raises(RequestDeadlineExceededException):
+            await routing_module.apply_routing_without_queuing(**kwargs, deadline=time.time() - 1)
+        acquire_slot.assert_not_awaited()  # dropped before trying to acquire a slot
+
+        # the wait is bounded by the deadline instead of max_retries * retry_countdown seconds
+        with pytest.raises(RequestDeadlineExceededException):
+            await asyncio.wait_for(routing_module.apply_routing_without_queuing(**kwargs, deadline=time.time() + 0.05), timeout=1)
+
+
+def test_apply_routing_task_refuses_request_after_deadline():
+    with patch.object(tasks_routing_module, "send_routing_reply", side_effect=lambda task_id, result: result):
+        result = tasks_routing_module.apply_routing.run(
+            [(1, None, None)], RouterLoadBalancingStrategy.SHUFFLE, Metric.TTFT, 1, 2, 30, 0, time.time() - 1
+        )
+
+    assert result["status_code"] == 503
+
+
+def test_get_request_deadline():
+    assert get_request_deadline(timeout=None) is None
+    assert get_request_deadline(timeout="invalid") is None
+    assert get_request_deadline(timeout="-1") is None
+    assert get_request_deadline(timeout="inf") is None
+    assert get_request_deadline(timeout="nan") is None
+    assert 29 < get_request_deadline(timeout="30") - time.time() <= 30
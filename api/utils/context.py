@@ -1,8 +1,15 @@
 from contextvars import ContextVar
+import logging
+import math
+import time
 from uuid import uuid4
 
+from redis.asyncio import Redis as AsyncRedis
+
 from api.schemas.core.context import GlobalContext, RequestContext
 
+logger = logging.getLogger(__name__)
+
 global_context: GlobalContext = GlobalContext()
 request_context: ContextVar[RequestContext] = ContextVar("request_context", default=RequestContext())
 
@@ -12,3 +19,44 @@ def generate_request_id() -> str:
     Get the ID of the request.
     """
     return f"request-{str(uuid4()).replace("-", "")}"
+
+
+def get_request_deadline(timeout: str | None) -> float | None:
+    """
+    Get the deadline of the request from the number of seconds the client waits for the response (request timeout header).
+
+    Args:
+        timeout(str | None): The value of the request timeout header.
+
+    Returns:
+        float | None: The timestamp of the deadline, None if the header is missing or invalid (not a positive finite number).
+    """
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        return None
+
+    return time.time() + timeout if math.isfinite(timeout) and timeout > 0 else None
+
+
+async def release_slot_leases(context: RequestContext) -> None:
+    """
+    Release the provider slots acquired by the routing for a request and not released by the forward of the request, for example if
+    the endpoint raised an error or if the client disconnected before the start of a stream. Run at the end of each request.
+
+    Args:
+        context(RequestContext): The context of the request.
+    """
+    slot_leases, context.slot_leases = context.slot_leases or [], []
+    if not slot_leases:
+        return
+
+    redis_client = AsyncRedis(connection_pool=global_context.redis_pool)
+    try:
+        for lease in slot_leases:
+            try:
+                await lease.release(redis_client=redis_client)
+            except Exception:
+                logger.error("Unable to release the provider slot", exc_info=True)
+    finally:
+        await redis_client.aclose()
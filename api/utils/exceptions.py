@@ -272,3 +272,8 @@ class ResponseFormatFailedException(HTTPException):
 class ModelIsTooBusyException(HTTPException):
     def __init__(self, detail: str = "Model is too busy, please try again later.") -> None:
         super().__init__(status_code=503, detail=detail)
+
+
+class RequestDeadlineExceededException(HTTPException):
+    def __init__(self, detail: str = "Model is too busy, the request could not start before its deadline.") -> None:
+        super().__init__(status_code=503, detail=detail)
@@ -10,7 +10,7 @@ from starlette.responses import StreamingResponse
 from api.helpers._streamingresponsewithstatuscode import StreamingResponseWithStatusCode
 from api.sql.models import Usage, User
 from api.utils.configuration import configuration
-from api.utils.context import request_context
+from api.utils.context import global_context, request_context
 from api.utils.dependencies import get_postgres_session
 
 logger = logging.getLogger(__name__)
@@ -191,6 +191,10 @@ async def update_budget(usage: Usage):
 
                 result = await postgres_session.execute(update_stmt)
 
+            # the cached user info of the user must see the exhausted budget
+            if new_budget == 0:
+                await global_context.identity_access_manager.invalidate_user_info(user_id=user_id)
+
         except Exception as e:
             logger.exception(f"Failed to update budget for user {user_id}: {e}")
             return
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 import traceback
 from types import SimpleNamespace
@@ -9,14 +10,19 @@ from sqlalchemy.orm import sessionmaker
 
 from api.clients.parser import BaseParserClient as ParserClient
 from api.clients.vector_store import BaseVectorStoreClient as VectorStoreClient
+from api.helpers._admissioncontroller import AdmissionController
 from api.helpers._documentmanager import DocumentManager
+from api.helpers._httpclientpool import HttpClientPool
 from api.helpers._identityaccessmanager import IdentityAccessManager
 from api.helpers._limiter import Limiter
+from api.helpers._metricsaggregator import MetricsAggregator
 from api.helpers._parsermanager import ParserManager
+from api.helpers._providermetricsscraper import ProviderMetricsScraper
+from api.helpers._routingreplylistener import RoutingReplyListener
 from api.helpers._usagemanager import UsageManager
 from api.helpers._usagetokenizer import UsageTokenizer
 from api.helpers.models import ModelRegistry
-from api.schemas.core.configuration import Configuration
+from api.schemas.core.configuration import Configuration, RoutingQueueType
 from api.schemas.core.context import GlobalContext
 from api.utils.configuration import get_configuration
 from api.utils.context import global_context
@@ -53,21 +59,56 @@ async def lifespan(app: FastAPI):
     # setup global context
     await _setup_redis_pool(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_usage_manager(configuration=configuration, global_context=global_context, dependencies=dependencies)
+    await _setup_http_client_pool(configuration=configuration, global_context=global_context, dependencies=dependencies)
+    await _setup_metrics_aggregator(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_postgres_session(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_model_registry(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_identity_access_manager(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_limiter(configuration=configuration, global_context=global_context, dependencies=dependencies)
+    await _setup_provider_metrics_scraper(configuration=configuration, global_context=global_context, dependencies=dependencies)
+    await _setup_admission_controller(configuration=configuration, global_context=global_context, dependencies=dependencies)
+    await _setup_routing_reply_listener(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_tokenizer(configuration=configuration, global_context=global_context, dependencies=dependencies)
     await _setup_document_manager(configuration=configuration, global_context=global_context, dependencies=dependencies)
 
     await global_context.limiter.reset()
 
+    catalog_watcher = asyncio.create_task(
+        global_context.model_registry.watch_catalog(
+            redis_client=redis.Redis(connection_pool=global_context.redis_pool),
+            postgres_session_factory=global_context.postgres_session_factory,
+        )
+    )
+
+    admission_listener = asyncio.create_task(global_context.admission_controller.run(redis_pool=global_context.redis_pool))
+    routing_reply_listener = asyncio.create_task(global_context.routing_reply_listener.run(redis_pool=global_context.redis_pool))
+    invalidations_watcher = asyncio.create_task(
+        global_context.identity_access_manager.watch_invalidations(postgres_session_factory=global_context.postgres_session_factory)
+    )
+
+    background_tasks = [catalog_watcher, admission_listener, routing_reply_listener, invalidations_watcher]
+    if global_context.metrics_aggregator is not None:
+        background_tasks.append(asyncio.create_task(global_context.metrics_aggregator.run(redis_pool=global_context.redis_pool)))
+
+    if configuration.settings.rate_limiting_local_share > 0:
+        background_tasks.append(asyncio.create_task(global_context.limiter.run()))
+
+    if global_context.provider_metrics_scraper is not None:
+        background_tasks.append(asyncio.create_task(global_context.provider_metrics_scraper.run(redis_pool=global_context.redis_pool)))
+
     yield
 
-    # cleanup resources when app shuts down
+    # cleanup resources when app shuts down, the background tasks close their redis clients when cancelled (and the aggregator
+    # flushes the remaining metrics), so they are awaited
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
     if vector_store:
         await vector_store.close()
 
+    await global_context.http_client_pool.close()
+
 
 async def _setup_redis_pool(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
     redis_pool = redis.ConnectionPool.from_url(**configuration.dependencies.redis.model_dump())
@@ -86,6 +127,31 @@ async def _setup_usage_manager(configuration: Configuration, global_context: Glo
     global_context.usage_manager = UsageManager()
 
 
+async def _setup_http_client_pool(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
+    """Set up the pool of HTTP clients shared by all requests to the model providers."""
+
+    global_context.http_client_pool = HttpClientPool(
+        max_connections=configuration.settings.provider_http_max_connections,
+        max_keepalive_connections=configuration.settings.provider_http_max_keepalive_connections,
+        keepalive_expiry=configuration.settings.provider_http_keepalive_expiry,
+        http2=configuration.settings.provider_http_http2,
+    )
+
+
+async def _setup_metrics_aggregator(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
+    """Set up the in-process aggregator of the providers performance metrics, if enabled."""
+
+    if not configuration.settings.metrics_aggregator_enabled:
+        global_context.metrics_aggregator = None
+        return
+
+    global_context.metrics_aggregator = MetricsAggregator(
+        flush_interval=configuration.settings.metrics_aggregator_flush_interval,
+        precision=configuration.settings.metrics_aggregator_precision,
+        peak_ewma_half_life=configuration.settings.routing_peak_ewma_half_life,
+    )
+
+
 async def _setup_postgres_session(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
     """Set up the PostgreSQL session by creating the session pool."""
 
@@ -96,32 +162,81 @@ async def _setup_postgres_session(configuration: Configuration, global_context:
 
 async def _setup_model_registry(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
     """Set up the model registry by fetching the models defined in the DB and the configuration. Basic conflict handling between the DB and config."""
-    queuing_enabled = configuration.dependencies.celery is not None
+    queuing_enabled = configuration.dependencies.celery is not None and configuration.settings.routing_queue == RoutingQueueType.CELERY
     async for postgres_session in get_postgres_session():
         global_context.model_registry = ModelRegistry(
             app_title=configuration.settings.app_title,
             queuing_enabled=queuing_enabled,
+            scheduling_enabled=configuration.settings.routing_queue == RoutingQueueType.REDIS,
+            fair_queuing_key=configuration.settings.routing_fair_queuing_key,
             max_priority=configuration.settings.routing_max_priority,
             max_retries=configuration.settings.routing_max_retries,
             retry_countdown=configuration.settings.routing_retry_countdown,
+            catalog_refresh_interval=configuration.settings.routing_catalog_refresh_interval,
+            peak_ewma_half_life=configuration.settings.routing_peak_ewma_half_life,
+            slot_lease_ttl=configuration.settings.routing_slot_lease_ttl,
         )
         await global_context.model_registry.setup(models=configuration.models, postgres_session=postgres_session)
 
+        # load the routing catalog and notify the workers already started that the configuration models may have changed
+        redis_client = redis.Redis(connection_pool=global_context.redis_pool)
+        await global_context.model_registry.invalidate_catalog(postgres_session=postgres_session, redis_client=redis_client)
+        await redis_client.aclose()
+
 
 async def _setup_identity_access_manager(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
     global_context.identity_access_manager = IdentityAccessManager(
         master_key=configuration.settings.auth_master_key,
         key_max_expiration_days=configuration.settings.auth_key_max_expiration_days,
         playground_session_duration=configuration.settings.auth_playground_session_duration,
+        redis_pool=global_context.redis_pool,
+        user_info_cache_ttl=configuration.settings.auth_user_info_cache_ttl,
+        user_info_cache_size=configuration.settings.auth_user_info_cache_size,
     )
+    async with global_context.postgres_session_factory() as postgres_session:
+        await global_context.identity_access_manager.sync_revoked_tokens(postgres_session=postgres_session)
 
 
 async def _setup_limiter(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
-    global_context.limiter = Limiter(redis_pool=global_context.redis_pool, strategy=configuration.settings.rate_limiting_strategy)
+    global_context.limiter = Limiter(
+        redis_pool=global_context.redis_pool,
+        strategy=configuration.settings.rate_limiting_strategy,
+        local_share=configuration.settings.rate_limiting_local_share,
+        local_ttl=configuration.settings.rate_limiting_local_ttl,
+    )
+
+
+async def _setup_provider_metrics_scraper(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
+    """Set up the background scraper of the providers metrics endpoints, if enabled."""
+    assert global_context.model_registry, "Set model registry in global context before setting up provider metrics scraper."
+
+    if not configuration.settings.provider_metrics_enabled:
+        global_context.provider_metrics_scraper = None
+        return
+
+    global_context.provider_metrics_scraper = ProviderMetricsScraper(
+        model_registry=global_context.model_registry,
+        interval=configuration.settings.provider_metrics_interval,
+    )
+
+
+async def _setup_admission_controller(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
+    """Set up the admission controller waking up the requests waiting for a provider slot when a slot is released."""
+
+    global_context.admission_controller = AdmissionController()
+
+
+async def _setup_routing_reply_listener(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
+    """Set up the listener waking up the queued requests when the result of their routing task is published."""
+
+    global_context.routing_reply_listener = RoutingReplyListener()
 
 
 async def _setup_tokenizer(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
-    global_context.tokenizer = UsageTokenizer(tokenizer=configuration.settings.usage_tokenizer)
+    global_context.tokenizer = UsageTokenizer(
+        tokenizer=configuration.settings.usage_tokenizer,
+        sampling_rate=configuration.settings.usage_sampling_rate,
+    )
 
 
 async def _setup_document_manager(configuration: Configuration, global_context: GlobalContext, dependencies: SimpleNamespace):
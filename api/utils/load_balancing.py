@@ -1,7 +1,13 @@
 from redis import Redis
 from redis.asyncio import Redis as AsyncRedis
 
-from api.helpers.load_balancing import LeastBusyLoadBalancingStrategy, ShuffleLoadBalancingStrategy
+from api.helpers.load_balancing import (
+    LeastBusyLoadBalancingStrategy,
+    LeastLoadedLoadBalancingStrategy,
+    PeakEwmaLoadBalancingStrategy,
+    PowerOfTwoLoadBalancingStrategy,
+    ShuffleLoadBalancingStrategy,
+)
 from api.schemas.admin.routers import RouterLoadBalancingStrategy
 from api.schemas.core.models import Metric
 
@@ -18,7 +24,7 @@ def apply_sync_load_balancing(
     Args:
         load_balancing_strategy (RouterLoadBalancingStrategy): The routing strategy to use for selecting a provider
         candidates (list[int]): The list of provider candidates (provider IDs) to choose from
-        redis_client (Redis): Redis client instance, required for least busy strategy
+        redis_client (Redis): Redis client instance, required for all strategies except shuffle
         load_balancing_metric (Metric): The type of metric to use for performance evaluation
 
     Returns:
@@ -28,6 +34,12 @@ def apply_sync_load_balancing(
     """
     if load_balancing_strategy == RouterLoadBalancingStrategy.LEAST_BUSY:
         load_balancing_strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=load_balancing_metric)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.POWER_OF_TWO:
+        load_balancing_strategy = PowerOfTwoLoadBalancingStrategy(redis_client=redis_client)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.PEAK_EWMA:
+        load_balancing_strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.LEAST_LOADED:
+        load_balancing_strategy = LeastLoadedLoadBalancingStrategy(redis_client=redis_client)
     else:  # load_balancing_strategy == RouterLoadBalancingStrategy.SHUFFLE:
         load_balancing_strategy = ShuffleLoadBalancingStrategy()
 
@@ -48,7 +60,7 @@ async def apply_async_load_balancing(
     Args:
         load_balancing_strategy (RouterLoadBalancingStrategy): The routing strategy to use for selecting a provider
         candidates (list[int]): The list of provider candidates (provider IDs) to choose from
-        redis_client (AsyncRedis | None): Redis client instance, required for least busy strategy
+        redis_client (AsyncRedis | None): Redis client instance, required for all strategies except shuffle
         load_balancing_metric (Metric): The type of metric to use for performance evaluation
 
     Returns:
@@ -59,6 +71,12 @@ async def apply_async_load_balancing(
     performance_indicator = None
     if load_balancing_strategy == RouterLoadBalancingStrategy.LEAST_BUSY:
         load_balancing_strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=load_balancing_metric)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.POWER_OF_TWO:
+        load_balancing_strategy = PowerOfTwoLoadBalancingStrategy(redis_client=redis_client)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.PEAK_EWMA:
+        load_balancing_strategy = PeakEwmaLoadBalancingStrategy(redis_client=redis_client)
+    elif load_balancing_strategy == RouterLoadBalancingStrategy.LEAST_LOADED:
+        load_balancing_strategy = LeastLoadedLoadBalancingStrategy(redis_client=redis_client)
     else:  # load_balancing_strategy == RouterLoadBalancingStrategy.SHUFFLE:
         load_balancing_strategy = ShuffleLoadBalancingStrategy()
 
@@ -2,7 +2,7 @@ from redis import Redis
 from redis.asyncio import Redis as AsyncRedis
 
 from api.schemas.core.models import Metric
-from api.utils.variables import PREFIX__REDIS_METRIC_GAUGE
+from api.utils.variables import PREFIX__REDIS_METRIC_BACKEND, PREFIX__REDIS_METRIC_GAUGE
 
 
 def apply_sync_qos_policy(provider_id: int, qos_metric: Metric | None, qos_limit: float | None, redis_client: Redis) -> bool:
@@ -18,6 +18,17 @@ def apply_sync_qos_policy(provider_id: int, qos_metric: Metric | None, qos_limit
             if inflight_requests > qos_limit:
                 can_be_forwarded = False
 
+    elif qos_metric == Metric.INFLIGHT_TOKENS:
+        inflight_tokens = redis_client.get(f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT_TOKENS.value}:{provider_id}")
+        if inflight_tokens is not None and int(inflight_tokens) > qos_limit:
+            can_be_forwarded = False
+
+    elif qos_metric in (Metric.WAITING, Metric.KV_CACHE):
+        # scraped from the provider metrics endpoint, no limit is applied if the provider metrics are not available
+        backend_value = redis_client.hget(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", qos_metric.value)
+        if backend_value is not None and float(backend_value) > qos_limit:
+            can_be_forwarded = False
+
     return can_be_forwarded
 
 
@@ -34,4 +45,15 @@ async def apply_async_qos_policy(provider_id: int, qos_metric: Metric | None, qo
             if inflight_requests > qos_limit:
                 can_be_forwarded = False
 
+    elif qos_metric == Metric.INFLIGHT_TOKENS:
+        inflight_tokens = await redis_client.get(f"{PREFIX__REDIS_METRIC_GAUGE}:{Metric.INFLIGHT_TOKENS.value}:{provider_id}")
+        if inflight_tokens is not None and int(inflight_tokens) > qos_limit:
+            can_be_forwarded = False
+
+    elif qos_metric in (Metric.WAITING, Metric.KV_CACHE):
+        # scraped from the provider metrics endpoint, no limit is applied if the provider metrics are not available
+        backend_value = await redis_client.hget(f"{PREFIX__REDIS_METRIC_BACKEND}:{provider_id}", qos_metric.value)
+        if backend_value is not None and float(backend_value) > qos_limit:
+            can_be_forwarded = False
+
     return can_be_forwarded
@@ -1,56 +1,272 @@
 import asyncio
+from datetime import UTC, datetime
+from json import loads
 import logging
+import time
+from uuid import uuid4
 
-from celery.result import AsyncResult
 from redis.asyncio import Redis as AsyncRedis
 
+from api.helpers._routingreplylistener import RoutingReplyListener
+from api.helpers._routingscheduler import RoutingScheduler
+from api.helpers._slotlease import SlotLease
 from api.schemas.admin.providers import Provider
 from api.schemas.admin.routers import RouterLoadBalancingStrategy
 from api.schemas.core.models import Metric
-from api.tasks import app, create_model_queue
-from api.tasks.routing import apply_routing
-from api.utils.exceptions import ModelIsTooBusyException, TaskFailedException
+from api.tasks import create_model_queue
+from api.tasks.routing import apply_routing, get_routing_abandoned_key, get_routing_reply_key
+from api.utils.context import global_context
+from api.utils.exceptions import ModelIsTooBusyException, RequestDeadlineExceededException, TaskFailedException
 from api.utils.load_balancing import apply_async_load_balancing
 from api.utils.qos import apply_async_qos_policy
+from api.utils.redis import redis_retry
+from api.utils.variables import REDIS__ROUTING_REPLY_TTL_SECONDS
 
 logger = logging.getLogger(__name__)
 
 
-async def apply_routing_without_queuing(
+async def _acquire_slot(
     providers: list[Provider],
     load_balancing_strategy: RouterLoadBalancingStrategy,
     load_balancing_metric: Metric,
-    max_retries: int,
-    retry_countdown: int,
+    slot_lease_ttl: int,
     redis_client: AsyncRedis,
-) -> int:
-    if len(providers) == 1:
-        provider_id = providers[0].id
-    else:
+    tokens: int = 0,
+) -> SlotLease | None:
+    """
+    Acquire a slot of a provider accepting the request according to its QoS policy. The provider chosen by the load balancing strategy
+    is tried first, if it refuses the request the other providers are checked and the load balancing strategy is applied among those
+    accepting it. For the inflight and inflight tokens QoS metrics, the limit is checked atomically with the acquisition of the slot
+    (see `SlotLease`).
+
+    Returns:
+        SlotLease | None: The lease of the slot, None if no provider accepts the request.
+    """
+
+    async def is_admitted(provider: Provider) -> bool:
+        return await apply_async_qos_policy(provider_id=provider.id, qos_metric=provider.qos_metric, qos_limit=provider.qos_limit, redis_client=redis_client)  # fmt: off
+
+    async def acquire(provider: Provider) -> SlotLease | None:
+        if provider.qos_metric == Metric.INFLIGHT:
+            return await SlotLease.acquire(redis_client=redis_client, provider_id=provider.id, ttl=slot_lease_ttl, limit=provider.qos_limit, tokens=tokens)  # fmt: off
+        if provider.qos_metric == Metric.INFLIGHT_TOKENS:
+            return await SlotLease.acquire(redis_client=redis_client, provider_id=provider.id, ttl=slot_lease_ttl, tokens=tokens, token_limit=provider.qos_limit)  # fmt: off
+        if not await is_admitted(provider=provider):
+            return None
+        return await SlotLease.acquire(redis_client=redis_client, provider_id=provider.id, ttl=slot_lease_ttl, tokens=tokens)
+
+    async def load_balance(candidates: list[Provider]) -> Provider:
+        if len(candidates) == 1:
+            return candidates[0]
         provider_id, _ = await apply_async_load_balancing(
-            candidates=[provider.id for provider in providers],
+            candidates=[provider.id for provider in candidates],
             load_balancing_strategy=load_balancing_strategy,
             load_balancing_metric=load_balancing_metric,
             redis_client=redis_client,
         )
-    qos_metric, qos_limit = [(provider.qos_metric, provider.qos_limit) for provider in providers if provider.id == provider_id][0]
+        return [provider for provider in candidates if provider.id == provider_id][0]
+
+    provider = await load_balance(candidates=providers)
+    lease = await acquire(provider=provider)
+    if lease is not None:
+        return lease
+
+    others = [other for other in providers if other.id != provider.id]
+    if not others:
+        return None
+
+    admitted = await asyncio.gather(*[is_admitted(provider=other) for other in others])
+    others = [other for other, is_ok in zip(others, admitted) if is_ok]
+    if not others:
+        return None
+
+    # the admission of the chosen provider is checked again atomically, the request waits for the next release if a concurrent request took the slot
+    return await acquire(provider=await load_balance(candidates=others))
+
+
+def _get_wait_timeout(timeout: float, deadline: float | None) -> float:
+    """
+    Get the maximum number of seconds a request waits for a provider slot, bounded by the deadline of the request if any.
+
+    Raises:
+        RequestDeadlineExceededException: If the deadline of the request is already passed.
+    """
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.time())
+        if timeout <= 0:
+            raise RequestDeadlineExceededException()
+
+    return timeout
+
+
+def _get_wait_exception(timeout: float, wait_timeout: float) -> ModelIsTooBusyException | RequestDeadlineExceededException:
+    """
+    Get the exception raised when a request did not get a provider slot in time, depending on whether its deadline bounded the wait.
+    """
+    if wait_timeout < timeout:
+        return RequestDeadlineExceededException()
+
+    return ModelIsTooBusyException(detail=f"Model is too busy after {timeout} seconds")
+
+
+async def _wait_for_slot(providers: list[Provider], priority: int, arrival: float, timeout: float, member: str | None = None) -> None:
+    """
+    Wait for a slot release of one of the providers (see `AdmissionController`), for the request to become the head of its routing
+    queue, or for at most `timeout` seconds.
+    """
+    admission_controller = getattr(global_context, "admission_controller", None)
+    if admission_controller is None:
+        await asyncio.sleep(timeout)
+    else:
+        provider_ids = [provider.id for provider in providers]
+        await admission_controller.wait(provider_ids=provider_ids, priority=priority, arrival=arrival, timeout=timeout, member=member)
+
+
+async def apply_routing_without_queuing(
+    providers: list[Provider],
+    load_balancing_strategy: RouterLoadBalancingStrategy,
+    load_balancing_metric: Metric,
+    max_retries: int,
+    retry_countdown: int,
+    redis_client: AsyncRedis,
+    priority: int = 0,
+    slot_lease_ttl: int = 600,
+    tokens: int = 0,
+    deadline: float | None = None,
+) -> SlotLease:
+    """
+    Route a request to a provider accepting it according to its QoS policy and acquire a slot of the provider. If no provider accepts
+    the request, the request waits for a slot release of one of the providers (see `AdmissionController`), or for at most
+    `retry_countdown` seconds, and all the providers are evaluated again, until `max_retries * retry_countdown` seconds or the deadline
+    of the request.
+
+    Args:
+        providers(list[Provider]): The providers of the router.
+        load_balancing_strategy(RouterLoadBalancingStrategy): The load balancing strategy of the router.
+        load_balancing_metric(Metric): The metric used by the load balancing strategy.
+        max_retries(int): The maximum number of evaluations of the providers.
+        retry_countdown(int): The maximum number of seconds between two evaluations of the providers.
+        redis_client(AsyncRedis): The redis client to use.
+        priority(int): The priority of the request, higher priority requests waiting for a slot are woken up first.
+        slot_lease_ttl(int): Number of seconds before the slot is released if the request is not completed (crashed API worker).
+        tokens(int): The estimated tokens of the request, counted by the inflight tokens QoS metric.
+        deadline(float | None): The timestamp after which the request is refused instead of being forwarded to a provider.
 
-    while max_retries > 0:
-        can_be_forwarded = await apply_async_qos_policy(
-            provider_id=provider_id,
-            qos_metric=qos_metric,
-            qos_limit=qos_limit,
+    Returns:
+        SlotLease: The lease of the slot of the chosen provider, released by the provider at the end of the request.
+    """
+    loop = asyncio.get_running_loop()
+    arrival = loop.time()
+    timeout = max_retries * retry_countdown
+    wait_timeout = _get_wait_timeout(timeout=timeout, deadline=deadline)
+
+    while True:
+        lease = await _acquire_slot(
+            providers=providers,
+            load_balancing_strategy=load_balancing_strategy,
+            load_balancing_metric=load_balancing_metric,
+            slot_lease_ttl=slot_lease_ttl,
             redis_client=redis_client,
+            tokens=tokens,
         )
-        if can_be_forwarded:
-            break
-        await asyncio.sleep(retry_countdown)
-        max_retries -= 1
+        if lease is not None:
+            return lease
+
+        remaining = arrival + wait_timeout - loop.time()
+        if remaining <= 0:
+            raise _get_wait_exception(timeout=timeout, wait_timeout=wait_timeout)
+
+        await _wait_for_slot(providers=providers, priority=priority, arrival=arrival, timeout=min(retry_countdown, remaining))
+
+
+async def apply_routing_with_scheduling(
+    router_id: int,
+    providers: list[Provider],
+    load_balancing_strategy: RouterLoadBalancingStrategy,
+    load_balancing_metric: Metric,
+    max_retries: int,
+    retry_countdown: int,
+    redis_client: AsyncRedis,
+    priority: int = 0,
+    slot_lease_ttl: int = 600,
+    flow: str = "",
+    weight: float = 1.0,
+    tokens: int = 0,
+    deadline: float | None = None,
+) -> SlotLease:
+    """
+    Queue a request in the Redis queue of its router (see `RoutingScheduler`) and acquire a slot of a provider accepting it once the
+    request is at the head of the queue. Like `apply_routing_without_queuing`, the request waits for a slot release or for the removal
+    of the previous request from the queue, or for at most `retry_countdown` seconds, until `max_retries * retry_countdown` seconds or
+    the deadline of the request.
+
+    Args:
+        router_id(int): The router ID.
+        providers(list[Provider]): The providers of the router.
+        load_balancing_strategy(RouterLoadBalancingStrategy): The load balancing strategy of the router.
+        load_balancing_metric(Metric): The metric used by the load balancing strategy.
+        max_retries(int): The maximum number of evaluations of the providers.
+        retry_countdown(int): The maximum number of seconds between two evaluations of the providers.
+        redis_client(AsyncRedis): The redis client to use.
+        priority(int): The priority of the request, higher priority requests are admitted first.
+        slot_lease_ttl(int): Number of seconds before the slot is released if the request is not completed (crashed API worker).
+        flow(str): The fair queuing flow of the request (user or organization), see `RoutingScheduler`.
+        weight(float): The fair queuing weight of the flow.
+        tokens(int): The estimated tokens of the request, counted by the inflight tokens QoS metric.
+        deadline(float | None): The timestamp after which the request is refused instead of being forwarded to a provider.
+
+    Returns:
+        SlotLease: The lease of the slot of the chosen provider, released by the provider at the end of the request.
+    """
+    loop = asyncio.get_running_loop()
+    arrival = loop.time()
+    timeout = max_retries * retry_countdown
+    wait_timeout = _get_wait_timeout(timeout=timeout, deadline=deadline)
+
+    member, start = await RoutingScheduler.enqueue(redis_client=redis_client, router_id=router_id, ticket=uuid4().hex, priority=priority, timeout=wait_timeout, flow=flow, weight=weight)  # fmt: off
+    lease = None
+    try:
+        while True:
+            if await RoutingScheduler.is_head(redis_client=redis_client, router_id=router_id, member=member):
+                lease = await _acquire_slot(
+                    providers=providers,
+                    load_balancing_strategy=load_balancing_strategy,
+                    load_balancing_metric=load_balancing_metric,
+                    slot_lease_ttl=slot_lease_ttl,
+                    redis_client=redis_client,
+                    tokens=tokens,
+                )
+                if lease is not None:
+                    return lease
+
+            remaining = arrival + wait_timeout - loop.time()
+            if remaining <= 0:
+                raise _get_wait_exception(timeout=timeout, wait_timeout=wait_timeout)
+
+            # the requests of a worker are woken up in the order of the queue
+            await _wait_for_slot(providers=providers, priority=priority, arrival=start, timeout=min(retry_countdown, remaining), member=member)
+    finally:
+        start = start if lease is not None else None
+        await redis_retry(RoutingScheduler.dequeue, redis_client=redis_client, router_id=router_id, member=member, start=start, max_retries=2)  # fmt: off
+
 
-    if not can_be_forwarded:
-        raise ModelIsTooBusyException(detail=f"Model is too busy after {max_retries * retry_countdown} seconds")
+async def _abandon_routing_task(task_id: str, redis_client: AsyncRedis, slot_lease_ttl: int) -> None:
+    """
+    Mark a routing task as abandoned when the API stops waiting for its result. A task running afterwards does not push its result
+    and releases the slot it acquired (see `send_routing_reply`), and the slot of a result pushed before is released here, so the
+    timed out requests do not hold provider slots until the expiration of their lease.
+    """
+    pipeline = redis_client.pipeline(transaction=True)
+    pipeline.set(get_routing_abandoned_key(task_id=task_id), 1, ex=REDIS__ROUTING_REPLY_TTL_SECONDS)
+    pipeline.lpop(get_routing_reply_key(task_id=task_id))
+    _, reply = await pipeline.execute()
+    if reply is None:
+        return
 
-    return provider_id
+    result = loads(reply)
+    if result.get("lease_id") is not None:
+        lease = SlotLease(provider_id=result["provider_id"], lease_id=result["lease_id"], ttl=slot_lease_ttl)
+        await lease.release(redis_client=redis_client)
 
 
 async def apply_routing_with_queuing(
@@ -61,9 +277,41 @@ async def apply_routing_with_queuing(
     max_retries: int,
     queue_name: str,
     priority: int,
-) -> int:
+    redis_client: AsyncRedis,
+    slot_lease_ttl: int = 600,
+    tokens: int = 0,
+    deadline: float | None = None,
+) -> SlotLease:
+    """
+    Send a routing task to the routing queue of the router and await its result, pushed by the task on a reply key of the request
+    (see `send_routing_reply`). The request is woken up when the result is published (see `RoutingReplyListener`), without polling the
+    Celery result backend nor holding a redis connection during the wait. The task expires if it is not started before the end of the
+    wait (the deadline or the retry budget, whichever comes first), and refuses the request if it is retried after it, so tasks do
+    not run after the API stopped waiting for them.
+
+    Args:
+        providers(list[Provider]): The providers of the router.
+        load_balancing_strategy(RouterLoadBalancingStrategy): The load balancing strategy of the router.
+        load_balancing_metric(Metric): The metric used by the load balancing strategy.
+        retry_countdown(int): The number of seconds between two retries of the routing task.
+        max_retries(int): The maximum number of retries of the routing task.
+        queue_name(str): The routing queue of the router.
+        priority(int): The priority of the routing task.
+        redis_client(AsyncRedis): The redis client to use.
+        slot_lease_ttl(int): Number of seconds before the slot is released if the request is not completed (crashed API worker).
+        tokens(int): The estimated tokens of the request, counted by the inflight tokens QoS metric.
+        deadline(float | None): The timestamp after which the request is refused instead of being forwarded to a provider.
+
+    Returns:
+        SlotLease: The lease of the slot of the chosen provider, released by the provider at the end of the request.
+    """
     candidates = [(provider.id, provider.qos_metric, provider.qos_limit) for provider in providers]
 
+    task_timeout = 0.2  # estimed task execution time
+    timeout = max_retries * (retry_countdown + task_timeout)
+    max_wait_time = _get_wait_timeout(timeout=timeout, deadline=deadline)
+    wait_end = time.time() + max_wait_time
+
     queue_obj = create_model_queue(queue_name)
     task = apply_routing.apply_async(
         args=[
@@ -72,67 +320,39 @@ async def apply_routing_with_queuing(
             load_balancing_metric,  # load_balancing_metric
             retry_countdown,  # task_retry_countdown
             max_retries,  # task_max_retries
+            slot_lease_ttl,  # slot_lease_ttl
+            tokens,  # tokens
+            wait_end,  # deadline
         ],
         queue=queue_name,
         priority=priority,
         declare=[queue_obj],
+        expires=datetime.fromtimestamp(wait_end, tz=UTC),
     )
 
-    async_result = AsyncResult(id=task.id, app=app)
-    initial_state = async_result.state
-    logger.info(f"Task {task.id} sent to queue '{queue_name}', initial state: {initial_state}, waiting for result...")
-
-    loop = asyncio.get_event_loop()
-    start_time = loop.time()
-
-    task_interval = 0.1  # polling interval to check if the task is ready
-    task_timeout = 0.2  # estimed task execution time
-    max_wait_time = max_retries * (retry_countdown + task_timeout)
-    logger.debug(f"Task {task.id}: Polling for result (max wait: {max_wait_time}s, interval: {task_interval}s)")
-
-    poll_count = 0
-    last_state = initial_state
-    while not async_result.ready():
-        elapsed = loop.time() - start_time
-        current_state = async_result.state
-
-        # Log state changes
-        if current_state != last_state:
-            logger.info(f"Task {task.id}: State changed from {last_state} to {current_state} (elapsed: {elapsed:.2f}s)")
-            last_state = current_state
-
-        if elapsed > max_wait_time:
-            logger.error(f"Task {task.id}: Timeout after {elapsed:.2f}s (state: {current_state})")
-            # Try to get more info about the task
-            try:
-                info = async_result.info
-                logger.error(f"Task {task.id}: Info={info}")
-            except Exception as e:
-                logger.error(f"Task {task.id}: Could not get task info: {e}")
-            raise ModelIsTooBusyException(detail=f"Model is too busy after {max_wait_time} seconds")
-
-        poll_count += 1
-        if poll_count % 10 == 0:  # Log every second (10 * 0.1s)
-            logger.debug(f"Task {task.id}: Still waiting... (elapsed: {elapsed:.2f}s, state: {current_state})")
-
-        await asyncio.sleep(task_interval)
+    logger.debug(f"Task {task.id} sent to queue '{queue_name}', waiting for result (max wait: {max_wait_time}s)...")
 
+    # without listener (eg. outside of the API), the reply key is only checked periodically
+    routing_reply_listener = getattr(global_context, "routing_reply_listener", None) or RoutingReplyListener()
     try:
-        state = async_result.state
-        logger.info(f"Task {task.id}: Completed with state={state}")
-        result = async_result.result  # direct access is safe after ready() returns True
-        logger.debug(f"Task {task.id}: Result={result}")
-
-        if result["status_code"] != 200:
-            logger.error(f"Task {task.id}: Failed with status_code={result["status_code"]}, detail={result.get("body", {}).get("detail", "N/A")}")
-            raise TaskFailedException(status_code=result["status_code"], detail=result["body"]["detail"])
-        provider_id = result["provider_id"]
-        logger.info(f"Task {task.id}: Successfully returned provider_id={provider_id}")
-
-    except TaskFailedException:
-        raise
+        reply = await routing_reply_listener.wait(task_id=task.id, key=get_routing_reply_key(task_id=task.id), timeout=max_wait_time, redis_client=redis_client)  # fmt: off
     except Exception as e:
         logger.error(f"Task {task.id}: Error retrieving result: {e}", exc_info=True)
-        raise TaskFailedException(status_code=500, detail=str(e))
+        raise TaskFailedException(status_code=500, detail=type(e).__name__)
+
+    if reply is None:
+        logger.error(f"Task {task.id}: Timeout after {max_wait_time}s")
+        await redis_retry(_abandon_routing_task, task_id=task.id, redis_client=redis_client, slot_lease_ttl=slot_lease_ttl, max_retries=2)
+        raise _get_wait_exception(timeout=timeout, wait_timeout=max_wait_time)
+
+    result = loads(reply)
+    logger.debug(f"Task {task.id}: Result={result}")
+
+    if result["status_code"] != 200:
+        logger.error(f"Task {task.id}: Failed with status_code={result["status_code"]}, detail={result.get("body", {}).get("detail", "N/A")}")
+        raise TaskFailedException(status_code=result["status_code"], detail=result["body"]["detail"])
+
+    provider_id = result["provider_id"]
+    logger.info(f"Task {task.id}: Successfully returned provider_id={provider_id}")
 
-    return provider_id
+    return SlotLease(provider_id=provider_id, lease_id=result["lease_id"], ttl=slot_lease_ttl)
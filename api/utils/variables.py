@@ -1,10 +1,21 @@
 DEFAULT_APP_NAME = "OpenGateLLM"
 DEFAULT_TIMEOUT = 300
 
+HEADER__REQUEST_TIMEOUT = "X-Request-Timeout"
+
 PREFIX__CELERY_QUEUE_ROUTING = "ogl_qr"
+PREFIX__REDIS_ADMISSION = "ogl_ad"
+PREFIX__REDIS_METRIC_BACKEND = "ogl_bk"
+PREFIX__REDIS_METRIC_EWMA = "ogl_ew"
 PREFIX__REDIS_METRIC_GAUGE = "ogl_mg"
+PREFIX__REDIS_METRIC_SKETCH = "ogl_sk"
 PREFIX__REDIS_METRIC_TIMESERIE = "ogl_ts"
 PREFIX__REDIS_RATE_LIMIT = "ogl_rt"
+PREFIX__REDIS_ROUTING_CATALOG = "ogl_rc"
+PREFIX__REDIS_ROUTING_REPLY = "ogl_rr"
+PREFIX__REDIS_ROUTING_SCHEDULER = "ogl_rs"
+PREFIX__REDIS_USER_INFO = "ogl_ui"
+REDIS__ROUTING_REPLY_TTL_SECONDS = 60
 REDIS__TIMESERIE_RETENTION_SECONDS = 120
 
 ENDPOINT__ADMIN_ORGANIZATIONS = "/admin/organizations"
@@ -0,0 +1,90 @@
+"""
+Benchmark of the routing decision latency of the least busy load balancing strategy: quantile sketches versus the previous
+`TS.RANGE` + sort over the whole retention window, with 1k, 10k and 100k samples per window and provider.
+
+Requires a Redis Stack instance (RedisTimeSeries module). Run from the root of the repository:
+    PYTHONPATH=. python scripts/benchmarks/least_busy_sketch.py --redis_url redis://localhost:6379
+"""
+
+import argparse
+import math
+import random
+import statistics
+import time
+
+from redis import Redis
+
+from api.helpers._quantilesketch import QuantileSketch
+from api.helpers.load_balancing import LeastBusyLoadBalancingStrategy
+from api.schemas.core.models import Metric
+from api.utils.variables import PREFIX__REDIS_METRIC_TIMESERIE, REDIS__TIMESERIE_RETENTION_SECONDS
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--redis_url", type=str, default="redis://localhost:6379")
+parser.add_argument("--samples", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+parser.add_argument("--candidates", type=int, default=3)
+parser.add_argument("--decisions", type=int, default=50)
+
+
+def seed(redis_client: Redis, provider_ids: list[int], samples: int) -> None:
+    now = int(time.time() * 1000)
+    window = REDIS__TIMESERIE_RETENTION_SECONDS * 1000 - 1000
+    for provider_id in provider_ids:
+        key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.TTFT.value}:{provider_id}"
+        redis_client.ts().create(key, retention_msecs=REDIS__TIMESERIE_RETENTION_SECONDS * 1000, duplicate_policy="LAST")
+        # distinct timestamps spread backwards over the window, as duplicate timestamps overwrite each other
+        points = [(key, now - (i * window) // samples, random.lognormvariate(mu=6, sigma=1)) for i in range(samples)]
+        for i in range(0, len(points), 10_000):
+            redis_client.ts().madd(ktv_tuples=points[i : i + 10_000])
+
+        sketches = QuantileSketch.from_samples(samples=points)
+        pipeline = redis_client.pipeline(transaction=False)
+        for sketch_key, sketch in sketches.items():
+            pipeline.hset(sketch_key, mapping=sketch.to_redis())
+        pipeline.execute()
+
+
+def range_decision(redis_client: Redis, provider_ids: list[int]) -> int:
+    """Previous implementation: fetch the whole window of each candidate and sort it."""
+    scores = {}
+    from_time = int(time.time() * 1000) - REDIS__TIMESERIE_RETENTION_SECONDS * 1000
+    for provider_id in provider_ids:
+        key = f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.TTFT.value}:{provider_id}"
+        values = sorted(value for _, value in redis_client.ts().range(key, from_time=from_time, to_time="+"))
+        scores[provider_id] = values[math.ceil(0.95 * len(values)) - 1] if values else float("inf")
+
+    return min(scores, key=scores.get)
+
+
+def measure(func, decisions: int) -> tuple[float, float]:
+    durations = []
+    for _ in range(decisions):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations), statistics.quantiles(durations, n=20)[-1]
+
+
+def cleanup(redis_client: Redis, provider_ids: list[int]) -> None:
+    for provider_id in provider_ids:
+        redis_client.delete(f"{PREFIX__REDIS_METRIC_TIMESERIE}:{Metric.TTFT.value}:{provider_id}")
+        keys = QuantileSketch.get_window_keys(metric=Metric.TTFT.value, provider_id=provider_id, timestamp=int(time.time() * 1000))
+        redis_client.delete(*keys)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    redis_client = Redis.from_url(args.redis_url)
+    provider_ids = [-(i + 1) for i in range(args.candidates)]  # negative IDs do not collide with real providers
+    strategy = LeastBusyLoadBalancingStrategy(redis_client=redis_client, load_balancing_metric=Metric.TTFT)
+
+    print(f"{'samples':>10} | {'TS.RANGE p50 (ms)':>18} | {'TS.RANGE p95 (ms)':>18} | {'sketch p50 (ms)':>16} | {'sketch p95 (ms)':>16}")
+    for samples in args.samples:
+        cleanup(redis_client=redis_client, provider_ids=provider_ids)
+        seed(redis_client=redis_client, provider_ids=provider_ids, samples=samples)
+        range_p50, range_p95 = measure(lambda: range_decision(redis_client=redis_client, provider_ids=provider_ids), args.decisions)
+        sketch_p50, sketch_p95 = measure(lambda: strategy.apply_sync_strategy(candidates=provider_ids), args.decisions)
+        print(f"{samples:>10} | {range_p50:>18.2f} | {range_p95:>18.2f} | {sketch_p50:>16.2f} | {sketch_p95:>16.2f}")
+
+    cleanup(redis_client=redis_client, provider_ids=provider_ids)
@@ -0,0 +1,134 @@
+"""
+Simulation of the queueing delay of the load balancing strategies under bursty arrivals: `shuffle`, `least_busy` (p95 of the time
+to first token of the last two minutes, only known once requests complete) and `power_of_two` (fewest inflight requests of two
+random providers, known live).
+
+Providers are simulated as servers with a fixed number of concurrent slots and exponential service times; requests exceeding the
+slots wait in a FIFO queue. Arrivals alternate between calm periods and bursts (Markov-modulated Poisson process).
+
+    python scripts/benchmarks/load_balancing_simulation.py --providers 8 --requests 200000
+"""
+
+import argparse
+from collections import deque
+import heapq
+import math
+import random
+import statistics
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--providers", type=int, default=8)
+parser.add_argument("--slots", type=int, default=4, help="concurrent requests processed by each provider")
+parser.add_argument("--service_time", type=float, default=1.0, help="mean service time of a request, in seconds")
+parser.add_argument("--load", type=float, default=0.6, help="mean load of the providers, between 0 and 1")
+parser.add_argument("--burst_factor", type=float, default=2.0, help="arrival rate during bursts relative to calm periods")
+parser.add_argument("--burst_ratio", type=float, default=0.2, help="fraction of the time spent in bursts")
+parser.add_argument("--period", type=float, default=30.0, help="mean duration of a calm period plus a burst, in seconds")
+parser.add_argument("--window", type=float, default=120.0, help="window of the least busy percentiles, in seconds")
+parser.add_argument("--requests", type=int, default=100_000)
+parser.add_argument("--seed", type=int, default=0)
+
+
+class Provider:
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.busy = 0
+        self.queue = deque()
+        self.ttfts = deque()  # (completion time, time to first token) of the completed requests, for least busy
+
+    @property
+    def inflight(self) -> int:
+        return self.busy + len(self.queue)
+
+    def get_p95(self, now: float, window: float) -> float:
+        while self.ttfts and self.ttfts[0][0] < now - window:
+            self.ttfts.popleft()
+        if not self.ttfts:
+            return float("inf")
+
+        values = sorted(ttft for _, ttft in self.ttfts)
+        return values[math.ceil(0.95 * len(values)) - 1]
+
+
+def shuffle(providers: list[Provider], rng: random.Random, now: float, window: float) -> int:
+    return rng.randrange(len(providers))
+
+
+def least_busy(providers: list[Provider], rng: random.Random, now: float, window: float) -> int:
+    scores = [provider.get_p95(now=now, window=window) for provider in providers]
+    best = min(scores)
+    return rng.choice([i for i, score in enumerate(scores) if score == best])
+
+
+def power_of_two(providers: list[Provider], rng: random.Random, now: float, window: float) -> int:
+    first, second = rng.sample(range(len(providers)), k=2) if len(providers) > 1 else (0, 0)
+    if providers[first].inflight == providers[second].inflight:
+        return rng.choice([first, second])
+
+    return first if providers[first].inflight < providers[second].inflight else second
+
+
+def generate_requests(args: argparse.Namespace) -> list[tuple[float, float]]:
+    """Generate the (arrival time, service time) of the requests, the same for all the strategies."""
+    rng = random.Random(args.seed)
+
+    # arrival rates of calm periods and bursts giving the requested mean load
+    capacity = args.providers * args.slots / args.service_time
+    calm_rate = args.load * capacity / (1 - args.burst_ratio + args.burst_ratio * args.burst_factor)
+    burst_rate = calm_rate * args.burst_factor
+
+    requests = []
+    now, bursting, phase_end = 0.0, False, rng.expovariate(1 / (args.period * (1 - args.burst_ratio)))
+    while len(requests) < args.requests:
+        arrival = now + rng.expovariate(burst_rate if bursting else calm_rate)
+        if arrival > phase_end:  # switch between calm periods and bursts
+            now, bursting = phase_end, not bursting
+            phase_end += rng.expovariate(1 / (args.period * (args.burst_ratio if bursting else 1 - args.burst_ratio)))
+            continue
+
+        now = arrival
+        requests.append((arrival, rng.expovariate(1 / args.service_time)))
+
+    return requests
+
+
+def simulate(strategy, requests: list[tuple[float, float]], args: argparse.Namespace) -> list[float]:
+    """Run the simulation and return the queueing delays of the requests, in seconds."""
+    rng = random.Random(args.seed)
+    providers = [Provider(slots=args.slots) for _ in range(args.providers)]
+    events = []  # (completion time, provider index, arrival time)
+    delays = []
+
+    def start(now: float, index: int, arrival: float, service_time: float) -> None:
+        providers[index].busy += 1
+        delays.append(now - arrival)
+        heapq.heappush(events, (now + service_time, index, arrival))
+
+    for arrival, service_time in requests:
+        # process the completions before the arrival
+        while events and events[0][0] <= arrival:
+            now, index, arrived = heapq.heappop(events)
+            provider = providers[index]
+            provider.busy -= 1
+            provider.ttfts.append((now, now - arrived))
+            if provider.queue:
+                start(now, index, *provider.queue.popleft())
+
+        index = strategy(providers=providers, rng=rng, now=arrival, window=args.window)
+        if providers[index].busy < providers[index].slots:
+            start(arrival, index, arrival, service_time)
+        else:
+            providers[index].queue.append((arrival, service_time))
+
+    return delays
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    print(f"{'strategy':>14} | {'mean (s)':>9} | {'p95 (s)':>9} | {'p99 (s)':>9}")
+    requests = generate_requests(args=args)
+    for strategy in (shuffle, least_busy, power_of_two):
+        delays = simulate(strategy=strategy, requests=requests, args=args)
+        quantiles = statistics.quantiles(delays, n=100)
+        print(f"{strategy.__name__:>14} | {statistics.mean(delays):>9.3f} | {quantiles[94]:>9.3f} | {quantiles[98]:>9.3f}")